@@ -0,0 +1,115 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from threading import Thread
+
+# common also puts the project root on sys.path
+from common import load_model, percentiles, write_results
+
+from src.engine import InferenceEngine
+from src.preference_store import PreferenceStore, iter_preferences
+from src.prefetch import AnnotationPrefetcher
+from src.work_queue import AnnotationWorkQueue
+
+
+def annotator(work_queue, session_id, think_time, waits, seen):
+    rng = random.Random(session_id)
+    while True:
+        start = time.perf_counter()
+        lease = work_queue.lease(session_id)
+        if lease is None:
+            return
+        waits.append(time.perf_counter() - start)
+        seen.append(lease.prompt)
+        # Reading and deciding takes the annotator a while
+        time.sleep(think_time * rng.uniform(0.5, 1.5))
+        work_queue.complete(session_id, rng.choice(["A is Better", "B is Better"]))
+
+
+def run_level(engine, sessions, items_per_session, max_new_tokens, think_time, depth):
+    prompts = [
+        f"Prompt {i}: tell me a story." for i in range(sessions * items_per_session)
+    ]
+
+    def generate(batch, on_text=None):
+        results = engine.generate_batch(
+            batch, num_responses=2, max_new_tokens=max_new_tokens, temperature=0.9
+        )
+        texts = [r.text for r in results]
+        return [texts[i : i + 2] for i in range(0, len(texts), 2)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = PreferenceStore(os.path.join(tmp, "preferences.jsonl"))
+        prefetcher = AnnotationPrefetcher(
+            prompts, generate, depth=depth, batch_size=max(1, sessions // 2)
+        )
+        work_queue = AnnotationWorkQueue(prefetcher, store)
+
+        waits, seen = [], []
+        threads = [
+            Thread(
+                target=annotator, args=(work_queue, f"s{s}", think_time, waits, seen)
+            )
+            for s in range(sessions)
+        ]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        work_queue.flush()
+        elapsed = time.perf_counter() - start
+        prefetcher.stop()
+        store.close()
+        saved = sum(1 for _ in iter_preferences(store.path))
+
+    return {
+        "sessions": sessions,
+        "votes": len(seen),
+        "duplicates": len(seen) - len(set(seen)),
+        "saved": saved,
+        "votes_per_s": len(seen) / elapsed,
+        "item_wait": percentiles(waits),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simulate concurrent annotators against the annotation work queue."
+    )
+    parser.add_argument("--model", default=None, help="Defaults to a tiny random GPT-2")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--items", type=int, default=4, help="Per session")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument(
+        "--think-time", type=float, default=0.2, help="Seconds per vote"
+    )
+    parser.add_argument("--depth", type=int, default=16, help="Prefetch queue depth")
+    parser.add_argument("--output", default=None, help="Optional JSON output file")
+    args = parser.parse_args()
+
+    model, tokenizer = load_model(args.model)
+    engine = InferenceEngine(model, tokenizer, max_batch_size=32)
+
+    results = []
+    for sessions in args.sessions:
+        level = run_level(
+            engine,
+            sessions,
+            args.items,
+            args.max_new_tokens,
+            args.think_time,
+            args.depth,
+        )
+        print(
+            f"sessions={sessions:3d}  {level['votes_per_s']:7.2f} votes/s  "
+            f"wait p50={level['item_wait']['p50'] * 1000:7.1f}ms  "
+            f"p99={level['item_wait']['p99'] * 1000:7.1f}ms  "
+            f"duplicates={level['duplicates']}  saved={level['saved']}/{level['votes']}"
+        )
+        results.append(level)
+
+    engine.stop()
+    write_results({"benchmark": "annotation", "levels": results}, args.output)
@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import time
+
+# common also puts the project root on sys.path
+from common import load_model, percentiles, write_results
+
+from src.engine import InferenceEngine
+
+PROMPTS = [
+    "Explain quantum computing to a 5-year-old.",
+    "Write a poem about a robot who loves flowers.",
+    "What are the benefits of exercise?",
+    "How do I make a cake?",
+    "Tell me a joke.",
+]
+
+
+async def client(engine, index, num_requests, max_new_tokens, latencies, ttfts):
+    tokens = 0
+    for i in range(num_requests):
+        result = await engine.generate(
+            PROMPTS[(index + i) % len(PROMPTS)],
+            max_new_tokens=max_new_tokens,
+            temperature=0.9,
+        )
+        latencies.append(result.latency)
+        ttfts.append(result.time_to_first_token)
+        tokens += len(result.token_ids)
+    return tokens
+
+
+async def run_level(engine, concurrency, num_requests, max_new_tokens):
+    latencies, ttfts = [], []
+    start = time.perf_counter()
+    tokens = await asyncio.gather(
+        *(
+            client(engine, c, num_requests, max_new_tokens, latencies, ttfts)
+            for c in range(concurrency)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "latency": percentiles(latencies),
+        "time_to_first_token": percentiles(ttfts),
+        "tokens_per_s": sum(tokens) / elapsed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load-test the continuous-batching inference engine."
+    )
+    parser.add_argument("--model", default=None, help="Defaults to a tiny random GPT-2")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=4, help="Per client")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--output", default=None, help="Optional JSON output file")
+    args = parser.parse_args()
+
+    model, tokenizer = load_model(args.model)
+    engine = InferenceEngine(model, tokenizer, max_batch_size=args.max_batch_size)
+
+    results = []
+    for concurrency in args.concurrency:
+        level = asyncio.run(
+            run_level(engine, concurrency, args.requests, args.max_new_tokens)
+        )
+        print(
+            f"concurrency={concurrency:3d}  "
+            f"p50={level['latency']['p50'] * 1000:8.1f}ms  "
+            f"p99={level['latency']['p99'] * 1000:8.1f}ms  "
+            f"{level['tokens_per_s']:8.1f} tok/s"
+        )
+        results.append(level)
+
+    engine.stop()
+    write_results({"benchmark": "engine", "levels": results}, args.output)
@@ -0,0 +1,100 @@
+import argparse
+import time
+import torch
+
+# common also puts the project root on sys.path
+from common import load_model, tiny_reward_model, tiny_tokenizer, write_results
+
+from src.reward import RewardScorer
+from src.runtime import configure_threads, quantize_dynamic
+
+PROFILES = {
+    "fp32": (torch.float32, False),
+    "bf16": (torch.bfloat16, False),
+    "fp32+int8": (torch.float32, True),
+}
+
+PROMPTS = [
+    "Explain quantum computing to a 5-year-old.",
+    "Write a poem about a robot who loves flowers.",
+    "What are the benefits of exercise?",
+    "How do I make a cake?",
+]
+
+
+def generation_tokens_per_s(model, tokenizer, max_new_tokens, repeats):
+    tokenizer.padding_side = "left"
+    inputs = tokenizer(PROMPTS, return_tensors="pt", padding=True)
+    tokens, elapsed = 0, 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with torch.inference_mode():
+            outputs = model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                min_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=tokenizer.pad_token_id,
+            )
+        elapsed += time.perf_counter() - start
+        tokens += (outputs.shape[1] - inputs["input_ids"].shape[1]) * len(PROMPTS)
+    return tokens / elapsed
+
+
+def reward_texts_per_s(model, tokenizer, num_texts, repeats):
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(num_texts)]
+    responses = [f"Response number {i} " * (1 + i % 8) for i in range(num_texts)]
+    scorer = RewardScorer(model, tokenizer, cache_size=0)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        scorer.score(prompts, responses)
+    return num_texts * repeats / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare CPU execution profiles for generation and scoring."
+    )
+    parser.add_argument(
+        "--model", default=None, help="Policy model; defaults to a tiny random GPT-2"
+    )
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES))
+    parser.add_argument("--threads", type=int, nargs="+", default=[0])
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--num-texts", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default=None, help="Optional JSON output file")
+    args = parser.parse_args()
+
+    policy, tokenizer = load_model(args.model)
+    rm_tokenizer = tiny_tokenizer()
+
+    results = []
+    for threads in args.threads:
+        configure_threads(num_threads=threads)
+        for name in args.profiles:
+            dtype, quantize = PROFILES[name]
+            model = policy.to(dtype)
+            reward_model = tiny_reward_model(rm_tokenizer)
+            reward_model = (
+                quantize_dynamic(reward_model) if quantize else reward_model.to(dtype)
+            )
+
+            result = {
+                "profile": name,
+                "threads": torch.get_num_threads(),
+                "generation_tokens_per_s": generation_tokens_per_s(
+                    model, tokenizer, args.max_new_tokens, args.repeats
+                ),
+                "reward_texts_per_s": reward_texts_per_s(
+                    reward_model, rm_tokenizer, args.num_texts, args.repeats
+                ),
+            }
+            print(
+                f"{name:10s} threads={result['threads']:3d}  "
+                f"{result['generation_tokens_per_s']:8.1f} tok/s  "
+                f"{result['reward_texts_per_s']:8.1f} RM texts/s"
+            )
+            results.append(result)
+
+    write_results({"benchmark": "profiles", "results": results}, args.output)
@@ -0,0 +1,91 @@
+import json
+import sys
+import os
+import numpy as np
+import torch
+from transformers import (
+    DistilBertConfig,
+    DistilBertForSequenceClassification,
+    GPT2Config,
+    GPT2LMHeadModel,
+    PreTrainedTokenizerFast,
+)
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def tiny_tokenizer():
+    """Byte-level tokenizer built in memory, so benchmarks need no downloads."""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+
+    alphabet = sorted(pre_tokenizers.ByteLevel.alphabet())
+    vocab = {c: i for i, c in enumerate(alphabet)}
+    vocab["<|endoftext|>"] = len(vocab)
+
+    backend = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    return PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        bos_token="<|endoftext|>",
+        eos_token="<|endoftext|>",
+        pad_token="<|endoftext|>",
+        model_input_names=["input_ids", "attention_mask"],
+    )
+
+
+def tiny_model(tokenizer, n_layer=2, n_embd=64, n_head=4, seed=0):
+    """Randomly initialized GPT-2 sized to ``tokenizer``."""
+    torch.manual_seed(seed)
+    model_config = GPT2Config(
+        vocab_size=len(tokenizer),
+        n_positions=1024,
+        n_layer=n_layer,
+        n_embd=n_embd,
+        n_head=n_head,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    )
+    return GPT2LMHeadModel(model_config).eval()
+
+
+def tiny_reward_model(tokenizer, n_layers=2, dim=128, seed=0):
+    """Randomly initialized single-logit DistilBERT sized to ``tokenizer``."""
+    torch.manual_seed(seed)
+    model_config = DistilBertConfig(
+        vocab_size=len(tokenizer),
+        n_layers=n_layers,
+        n_heads=4,
+        dim=dim,
+        hidden_dim=4 * dim,
+        num_labels=1,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    return DistilBertForSequenceClassification(model_config).eval()
+
+
+def load_model(model_name=None):
+    """Return ``(model, tokenizer)``: a pretrained model or the tiny offline one."""
+    if model_name is None:
+        tokenizer = tiny_tokenizer()
+        return tiny_model(tokenizer), tokenizer
+
+    from src.models import load_tokenizer
+    from transformers import AutoModelForCausalLM
+
+    model = AutoModelForCausalLM.from_pretrained(model_name).eval()
+    return model, load_tokenizer(model_name)
+
+
+def percentiles(values, qs=(50, 99)):
+    return {f"p{q}": float(np.percentile(values, q)) for q in qs}
+
+
+def write_results(results, path=None):
+    """Print results as JSON and optionally save them to ``path``."""
+    text = json.dumps(results, indent=2)
+    print(text)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# common also puts the project root on sys.path
+from common import write_results
+from suite import BENCHMARKS, Fixtures
+
+from src.autotune import hardware_signature
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results against a baseline.
+
+    Returns:
+        list: ``(name, old, new, change)`` for every metric that got worse by
+        more than ``threshold`` (a fraction of the baseline value).
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["value"], result["value"]
+        change = (new - old) / old if old else 0.0
+        worse = -change if result["higher_is_better"] else change
+        flag = "REGRESSION" if worse > threshold else ""
+        print(
+            f"{name:32s} {old:12.4g} -> {new:12.4g} {result['unit']:10s} "
+            f"{change:+8.1%} {flag}"
+        )
+        if flag:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the offline pipeline benchmarks and check for regressions."
+    )
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=None)
+    # Medians of fewer runs, or a tighter threshold, flag scheduler noise on
+    # small CPU machines as regressions
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="Allowed slowdown fraction"
+    )
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="Store results as baseline"
+    )
+    parser.add_argument("--output", default=None, help="Optional JSON output file")
+    args = parser.parse_args()
+
+    fixtures = Fixtures()
+    results = {}
+    for name in args.only or BENCHMARKS:
+        start = time.perf_counter()
+        results.update(BENCHMARKS[name](fixtures, args.repeats))
+        print(f"{name}: done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    report = {"hardware": hardware_signature(), "results": results}
+    write_results(report, args.output)
+
+    if args.update_baseline:
+        baseline = {"hardware": report["hardware"], "results": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline["hardware"] = report["hardware"]
+        baseline["results"].update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+        print(f"Updated baseline {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["hardware"] != report["hardware"]:
+            print("Warning: baseline was recorded on different hardware")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            sys.exit(1)
+    else:
+        print(f"No baseline at {args.baseline}; run with --update-baseline")
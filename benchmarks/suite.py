@@ -0,0 +1,211 @@
+import json
+import os
+import statistics
+import tempfile
+import time
+import numpy as np
+from datasets import Dataset
+from transformers import TrainerCallback, TrainingArguments
+from trl import DPOTrainer
+
+# common also puts the project root on sys.path
+from common import tiny_model, tiny_reward_model, tiny_tokenizer
+
+from src.corpus import build_corpus, PromptCorpus
+from src.data import prepare_dataset, tokenize_fn
+from src.generation import generate_responses
+from src.reward import RewardScorer
+from src.rollout import RolloutEngine
+from src.utils import set_seed
+
+PROMPTS = [
+    "Explain quantum computing to a 5-year-old.",
+    "Write a poem about a robot who loves flowers.",
+    "What are the benefits of exercise?",
+    "How do I make a cake?",
+    "Tell me a joke.",
+]
+
+
+def synthetic_preferences(n):
+    """Deterministic preference records with varied lengths."""
+    return [
+        {
+            "prompt": PROMPTS[i % len(PROMPTS)],
+            "chosen": f"A helpful answer number {i}. " * (1 + i % 7),
+            "rejected": f"Nope {i}." * (1 + i % 3),
+        }
+        for i in range(n)
+    ]
+
+
+def metric(value, unit, higher_is_better):
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def median_time(fn, repeats):
+    """Median wall-clock time of ``fn()`` after one warm-up call."""
+    fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+class Fixtures:
+    """Tiny offline models shared by the benchmarks, built on first use."""
+
+    def __init__(self):
+        self._policy = None
+        self._reward = None
+
+    @property
+    def policy(self):
+        if self._policy is None:
+            tokenizer = tiny_tokenizer()
+            self._policy = (tiny_model(tokenizer), tokenizer)
+        return self._policy
+
+    @property
+    def reward(self):
+        if self._reward is None:
+            tokenizer = tiny_tokenizer()
+            self._reward = (tiny_reward_model(tokenizer), tokenizer)
+        return self._reward
+
+
+def bench_tokenize(fixtures, repeats):
+    _, tokenizer = fixtures.policy
+    records = synthetic_preferences(2000)
+    batch = {k: [r[k] for r in records] for k in ("prompt", "chosen", "rejected")}
+    seconds = median_time(lambda: tokenize_fn(batch, tokenizer), repeats)
+    return {"tokenize_fn_rows_per_s": metric(len(records) / seconds, "rows/s", True)}
+
+
+def bench_prepare_dataset(fixtures, repeats):
+    records = synthetic_preferences(10000)
+    seconds = median_time(lambda: prepare_dataset(records), repeats)
+    return {"prepare_dataset_s": metric(seconds, "s", False)}
+
+
+def bench_annotation(fixtures, repeats):
+    model, tokenizer = fixtures.policy
+    set_seed()
+    seconds = median_time(
+        lambda: generate_responses(
+            model, tokenizer, PROMPTS[:1], num_responses=2, max_new_tokens=32
+        ),
+        repeats,
+    )
+    return {"annotation_pair_latency_s": metric(seconds, "s", False)}
+
+
+def bench_reward_scoring(fixtures, repeats):
+    model, tokenizer = fixtures.reward
+    records = synthetic_preferences(512)
+    prompts = [r["prompt"] for r in records]
+    responses = [r["chosen"] for r in records]
+    scorer = RewardScorer(model, tokenizer, cache_size=0)
+    seconds = median_time(lambda: scorer.score(prompts, responses), repeats)
+    return {"reward_texts_per_s": metric(len(records) / seconds, "texts/s", True)}
+
+
+def bench_ppo_rollout(fixtures, repeats):
+    model, tokenizer = fixtures.policy
+    reward_model, rm_tokenizer = fixtures.reward
+    engine = RolloutEngine(
+        model,
+        tokenizer,
+        RewardScorer(reward_model, rm_tokenizer, cache_size=0),
+        PROMPTS,
+        batch_size=8,
+        max_new_tokens=32,
+    )
+    set_seed()
+    np.random.seed(0)
+    seconds = median_time(engine.rollout, repeats)
+    return {"ppo_rollout_samples_per_s": metric(8 / seconds, "samples/s", True)}
+
+
+def bench_prompt_corpus(fixtures, repeats):
+    _, tokenizer = fixtures.policy
+    num_prompts = 20000
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "prompts.jsonl")
+        with open(source, "w") as f:
+            for i in range(num_prompts):
+                f.write(
+                    json.dumps({"prompt": f"{PROMPTS[i % 5]} (variant {i})"}) + "\n"
+                )
+        index_dir = os.path.join(tmp, "index")
+
+        build_s = median_time(
+            lambda: build_corpus(source, index_dir, tokenizer), repeats
+        )
+
+        corpus = PromptCorpus(index_dir)
+        rows = np.random.default_rng(0).integers(0, len(corpus), 10000)
+        access_s = median_time(lambda: [corpus[i] for i in rows], repeats)
+        open_s = median_time(lambda: PromptCorpus(index_dir), repeats)
+    return {
+        "corpus_build_prompts_per_s": metric(num_prompts / build_s, "prompts/s", True),
+        "corpus_open_s": metric(open_s, "s", False),
+        "corpus_random_access_per_s": metric(len(rows) / access_s, "prompts/s", True),
+    }
+
+
+class _StepTimer(TrainerCallback):
+    def __init__(self):
+        self.times = []
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self._start = time.perf_counter()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self.times.append(time.perf_counter() - self._start)
+
+
+def bench_dpo_step(fixtures, repeats):
+    _, tokenizer = fixtures.policy
+    # A fresh model, so training does not disturb the other benchmarks
+    model = tiny_model(tokenizer)
+    dataset = Dataset.from_list(synthetic_preferences(64))
+    timer = _StepTimer()
+    set_seed()
+    with tempfile.TemporaryDirectory() as tmp:
+        trainer = DPOTrainer(
+            model=model,
+            args=TrainingArguments(
+                output_dir=tmp,
+                max_steps=repeats + 1,
+                per_device_train_batch_size=4,
+                learning_rate=5e-5,
+                logging_steps=1000,
+                save_strategy="no",
+                report_to="none",
+                use_cpu=True,
+                disable_tqdm=True,
+            ),
+            train_dataset=dataset,
+            tokenizer=tokenizer,
+            beta=0.1,
+            max_length=128,
+            max_prompt_length=64,
+            callbacks=[timer],
+        )
+        trainer.train()
+    # The first step includes one-off setup
+    return {"dpo_step_s": metric(statistics.median(timer.times[1:]), "s", False)}
+
+
+BENCHMARKS = {
+    "tokenize": bench_tokenize,
+    "prepare_dataset": bench_prepare_dataset,
+    "annotation": bench_annotation,
+    "reward_scoring": bench_reward_scoring,
+    "ppo_rollout": bench_ppo_rollout,
+    "dpo_step": bench_dpo_step,
+    "prompt_corpus": bench_prompt_corpus,
+}
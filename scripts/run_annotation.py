@@ -10,20 +10,27 @@ class CLIAnnotation(AnnotationUI):
         print("Starting CLI Annotation...")
         pass
 
+    def _update_display(self):
+        # The loop in display() drives the CLI, so there is nothing to redraw.
+        pass
+
     def display(self):
         print("\n=== RLHF Annotation CLI ===\n")
 
-        while self.current_index < len(self.sample_prompts):
-            prompt = self.sample_prompts[self.current_index]
+        while True:
+            print("Generating responses...")
+            item = self.prefetcher.get()
+            if item is None:
+                break
+
+            self.current_item = item
+            prompt, resp_a, resp_b = item
             print(
                 f"\nPrompt [{self.current_index + 1}/{len(self.sample_prompts)}]: {prompt}"
             )
-            print("Generating responses...")
-
-            responses = self._generate_responses(prompt)
 
-            print(f"\n[A]: {responses[0]}")
-            print(f"\n[B]: {responses[1]}")
+            print(f"\n[A]: {resp_a}")
+            print(f"\n[B]: {resp_b}")
 
             while True:
                 choice = input("\nWhich is better? (A/B/T for Tie): ").strip().upper()
@@ -32,6 +39,7 @@ class CLIAnnotation(AnnotationUI):
                     break
                 print("Invalid choice. Please enter A, B, or T.")
 
+        self._save_preferences()
         print("\nAnnotation Complete! Preferences saved.")
 
 
@@ -0,0 +1,26 @@
+import argparse
+import sys
+import os
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.config import config
+from src.reward import RewardScorer
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a JSONL file offline.")
+    parser.add_argument("input", help="JSONL file with prompt/response records")
+    parser.add_argument("output", help="Where to write the scored records")
+    parser.add_argument(
+        "--model", default=os.path.join(config.output_dir, "reward_model")
+    )
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    scorer = RewardScorer.from_pretrained(
+        args.model, device=args.device, batch_size=args.batch_size
+    )
+    count = scorer.score_file(args.input, args.output)
+    print(f"Scored {count} records -> {args.output}")
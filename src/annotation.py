@@ -1,54 +1,76 @@
 import ipywidgets as widgets
 from IPython.display import display, clear_output
-import json
-import os
-import torch
 from .config import config
+from .corpus import load_prompts
+from .generation import generate_responses
 from .models import load_base_model, load_tokenizer
+from .preference_store import PreferenceStore
+from .prefetch import AnnotationPrefetcher
+from .selection import PairSelector, load_selection_scorers
 
 
 class AnnotationUI:
     def __init__(self):
-        self.model = load_base_model()
-        self.tokenizer = load_tokenizer()
         self.preferences = []
+        self.store = PreferenceStore()
         self.current_index = 0
+        self.current_item = None
 
-        # Sample prompts (could be loaded from a file/config)
-        self.sample_prompts = [
-            "Explain what artificial intelligence is in simple terms.",
-            "Write a short story about a robot learning to paint.",
-            "How does the internet work?",
-            "What is happiness?",
-            "Explain gravity in simple words.",
-            "Describe your dream job.",
-            "What makes life meaningful?",
-            "Explain the solar system.",
-        ]
+        # Built-in prompts, unless config.prompt_corpus_path is set
+        self.sample_prompts = load_prompts(
+            [
+                "Explain what artificial intelligence is in simple terms.",
+                "Write a short story about a robot learning to paint.",
+                "How does the internet work?",
+                "What is happiness?",
+                "Explain gravity in simple words.",
+                "Describe your dream job.",
+                "What makes life meaningful?",
+                "Explain the solar system.",
+            ],
+            load_tokenizer,
+        )
+
+        self.selector = None
+        self.prefetcher = AnnotationPrefetcher(
+            self.sample_prompts, self._generate_pairs
+        )
 
         self._setup_ui()
 
+    # The model is loaded on first generation (usually by the prefetcher
+    # thread), so the UI renders without waiting for the weights
+    @property
+    def model(self):
+        return load_base_model()
+
+    @property
+    def tokenizer(self):
+        return load_tokenizer()
+
     def _generate_responses(self, prompt, num_responses=2, max_length=100):
-        responses = []
-        inputs = self.tokenizer(prompt, return_tensors="pt", padding=True).to(
-            self.model.device
+        return self._generate_batch([prompt], num_responses, max_length)[0]
+
+    def _generate_batch(self, prompts, num_responses=2, max_length=100, on_text=None):
+        return generate_responses(
+            self.model,
+            self.tokenizer,
+            prompts,
+            num_responses=num_responses,
+            max_new_tokens=max_length,
+            on_text=on_text,
+            temperature=0.9,
+            top_p=0.9,
         )
 
-        for _ in range(num_responses):
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=max_length,
-                    temperature=0.9,
-                    top_p=0.9,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                )
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            response = response[len(prompt) :].strip()
-            responses.append(response)
-
-        return responses
+    def _generate_pairs(self, prompts, on_text=None):
+        # Generate several candidates and keep the most informative pair
+        if self.selector is None:
+            self.selector = PairSelector(load_selection_scorers())
+        candidates = self._generate_batch(
+            prompts, max(2, config.annotation_candidates), on_text=on_text
+        )
+        return self.selector.select(prompts, candidates)
 
     def _setup_ui(self):
         self.output_area = widgets.Output()
@@ -87,12 +109,12 @@ class AnnotationUI:
         )
 
     def _save_preferences(self):
-        with open(config.preference_path, "w") as f:
-            json.dump(self.preferences, f, indent=2)
+        self.store.sync()
         print("Preferences saved!")
 
     def _update_display(self):
-        if self.current_index >= len(self.sample_prompts):
+        item = self.prefetcher.get()
+        if item is None:
             self.prompt_display.value = "<h3>Annotation Complete</h3>"
             self.btn_a.disabled = True
             self.btn_b.disabled = True
@@ -100,35 +122,32 @@ class AnnotationUI:
             self._save_preferences()
             return
 
-        prompt = self.sample_prompts[self.current_index]
-        # In a real app, generate asynchronously or cache. Here we generate on the fly which blocks UI.
-        # But this matches the Colab notebook behavior.
-        responses = self._generate_responses(prompt)
+        # Responses are generated ahead of time by the prefetcher, so this
+        # only blocks when the annotator outpaces generation.
+        self.current_item = item
+        prompt, resp_a, resp_b = item
 
         self.prompt_display.value = f"<h3>{prompt}</h3>"
-        self.response_a.value = responses[0]
-        self.response_b.value = responses[1]
-        self.progress_label.value = f"Progress: {len(self.preferences)}"
+        self.response_a.value = resp_a
+        self.response_b.value = resp_b
+        stats = self.prefetcher.stats()
+        self.progress_label.value = (
+            f"Progress: {len(self.preferences)} "
+            f"(prefetch hits: {stats['hits']}, misses: {stats['misses']})"
+        )
 
     def _on_click(self, choice):
-        prompt = self.sample_prompts[self.current_index]
+        prompt, resp_a, resp_b = self.current_item
 
+        record = None
         if choice == "A":
-            self.preferences.append(
-                {
-                    "prompt": prompt,
-                    "chosen": self.response_a.value,
-                    "rejected": self.response_b.value,
-                }
-            )
+            record = {"prompt": prompt, "chosen": resp_a, "rejected": resp_b}
         elif choice == "B":
-            self.preferences.append(
-                {
-                    "prompt": prompt,
-                    "chosen": self.response_b.value,
-                    "rejected": self.response_a.value,
-                }
-            )
+            record = {"prompt": prompt, "chosen": resp_b, "rejected": resp_a}
+
+        if record is not None:
+            self.preferences.append(record)
+            self.store.append(record)
 
         self.current_index += 1
         self._update_display()
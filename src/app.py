@@ -1,11 +1,20 @@
+import asyncio
+import atexit
+import sys
+import time
 import gradio as gr
-import json
-import os
-import torch
-from threading import Thread
-import subprocess
 from .config import config
+from .corpus import load_prompts
+from .engine import InferenceEngine
+from .jobs import JobQueue
+from .kv_cache import PrefixCacheStore
+from .metrics import Metrics
 from .models import load_base_model, load_tokenizer
+from .preference_store import PreferenceStore
+from .prefetch import AnnotationPrefetcher
+from .runtime import get_profile
+from .selection import PairSelector, load_selection_scorers
+from .work_queue import AnnotationWorkQueue
 
 # Global state for the model (lazy loading recommended for faster app startup)
 model = None
@@ -21,8 +30,32 @@ def get_model():
 
 
 # --- Chat Interface ---
-def generate_chat_response(message, history):
-    model, tokenizer = get_model()
+# Per-session KV caches, so each turn only prefills the newly added tokens
+kv_cache_store = PrefixCacheStore()
+
+# One continuous-batching engine serves chat and annotation requests together
+engine = None
+
+
+def get_engine():
+    global engine
+    if engine is None:
+        model, tokenizer = get_model()
+        engine = InferenceEngine(
+            model,
+            tokenizer,
+            prefix_cache=kv_cache_store,
+            metrics=Metrics("engine", log_every=100),
+        )
+    return engine
+
+
+async def generate_chat_response(message, history, request: gr.Request = None):
+    session_id = request.session_hash if request is not None else "default"
+    # Loading the model can take a while; keep the event loop responsive
+    inference_engine = await asyncio.get_running_loop().run_in_executor(
+        None, get_engine
+    )
 
     # Format history (simplified for GPT-2)
     prompt = ""
@@ -30,101 +63,163 @@ def generate_chat_response(message, history):
         prompt += f"User: {user_msg}\nAssistant: {bot_msg}\n"
     prompt += f"User: {message}\nAssistant:"
 
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=100,
-            temperature=0.7,
-            top_p=0.9,
-            do_sample=True,
-            pad_token_id=tokenizer.eos_token_id,
-        )
-
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    # Extract just the new part
-    try:
-        response = response.split("Assistant:")[-1].strip()
-    except:
-        pass
-
-    return response
+    # Stream tokens to the UI as they are generated
+    response = ""
+    async for text in inference_engine.stream(
+        prompt,
+        max_new_tokens=100,
+        temperature=0.7,
+        top_p=0.9,
+        session_id=session_id,
+    ):
+        response += text
+        yield response.strip()
 
 
 # --- Annotation Interface ---
-# Sample prompts
-PROMPTS = [
+# Built-in prompts, used unless config.prompt_corpus_path points to a corpus
+SAMPLE_PROMPTS = [
     "Explain quantum computing to a 5-year-old.",
     "Write a poem about a robot who loves flowers.",
     "What are the benefits of exercise?",
     "How do I make a cake?",
     "Tell me a joke.",
 ]
-current_prompt_index = 0
-annotation_data = []
+PROMPTS = load_prompts(SAMPLE_PROMPTS, load_tokenizer)
+preference_store = PreferenceStore()
+
+
+# Picks the most informative pair out of each prompt's candidates
+selector = None
+
+
+def get_selector():
+    global selector
+    if selector is None:
+        selector = PairSelector(load_selection_scorers())
+    return selector
+
+
+def _generate_annotation_pairs(prompts, on_text=None):
+    num = max(2, config.annotation_candidates)
+    results = get_engine().generate_batch(
+        prompts, num_responses=num, max_new_tokens=50, temperature=0.9, on_text=on_text
+    )
+    texts = [r.text for r in results]
+    candidates = [texts[i : i + num] for i in range(0, len(texts), num)]
+    return get_selector().select(prompts, candidates)
+
+
+# Generates the next few annotation items in the background while users vote
+prefetcher = AnnotationPrefetcher(PROMPTS, _generate_annotation_pairs)
+
+# Leases distinct items to each browser session and batches their votes
+work_queue = AnnotationWorkQueue(prefetcher, preference_store)
 
 
-def get_next_prompt():
-    global current_prompt_index
-    if current_prompt_index >= len(PROMPTS):
-        return "Annotation Complete!", "", ""
+def _save_pending_votes():
+    # The vote writer is a daemon thread; write what it still holds on exit
+    if not work_queue.flush(timeout=30):
+        print("Warning: some preference votes could not be saved.")
+    preference_store.close()
 
-    prompt = PROMPTS[current_prompt_index]
 
-    model, tokenizer = get_model()
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+atexit.register(_save_pending_votes)
 
-    responses = []
-    for _ in range(2):
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=50,
-                temperature=0.9,
-                do_sample=True,
-                pad_token_id=tokenizer.eos_token_id,
-            )
-        resp = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        resp = resp[len(prompt) :].strip()  # Remove prompt
-        responses.append(resp)
 
-    return prompt, responses[0], responses[1]
+# Remembers an annotator id in the browser's localStorage. Gradio's
+# session_hash changes on every page reload, so leases keyed on it would be
+# orphaned (and their items held back until the lease times out)
+ANNOTATOR_ID_JS = """
+() => {
+    let id = localStorage.getItem("annotator_id");
+    if (!id) {
+        id = Date.now().toString(36) + Math.random().toString(36).slice(2);
+        localStorage.setItem("annotator_id", id);
+    }
+    return id;
+}
+"""
 
 
-def save_preference(choice, prompt, resp_a, resp_b):
-    global current_prompt_index, annotation_data
+def _session_id(request, annotator_id=None):
+    # Logged-in users keep their item across browsers; otherwise the id
+    # stored in the browser survives reloads
+    if request is not None and getattr(request, "username", None):
+        return f"user:{request.username}"
+    if annotator_id:
+        return f"browser:{annotator_id}"
+    return request.session_hash if request is not None else "default"
 
-    if choice == "A is Better":
-        chosen = resp_a
-        rejected = resp_b
-    elif choice == "B is Better":
-        chosen = resp_b
-        rejected = resp_a
-    else:  # Tie
-        current_prompt_index += 1
-        return get_next_prompt()
 
-    annotation_data.append({"prompt": prompt, "chosen": chosen, "rejected": rejected})
+def get_next_prompt(annotator_id=None, request: gr.Request = None):
+    """
+    Yield (prompt, response A, response B, *vote button updates) for the
+    session's current item.
 
-    # Save to file
-    os.makedirs(config.data_dir, exist_ok=True)
-    with open(config.preference_path, "w") as f:
-        json.dump(annotation_data, f, indent=2)
+    Partially generated responses are streamed while the item is still being
+    generated; voting stays disabled until the final responses are shown.
+    """
+    disabled = (gr.update(interactive=False),) * 3
+    for update in work_queue.stream(_session_id(request, annotator_id)):
+        if update is None:
+            yield ("Annotation Complete!", "", "") + disabled
+        elif isinstance(update, tuple):
+            yield update + disabled
+        else:
+            yield update.item + (gr.update(interactive=True),) * 3
 
-    current_prompt_index += 1
-    return get_next_prompt()
+
+def save_preference(choice, annotator_id=None, request: gr.Request = None):
+    # The vote applies to the item leased to this session, not to whatever
+    # text the page shows, so concurrent annotators cannot clobber each other
+    if not work_queue.complete(_session_id(request, annotator_id), choice):
+        gr.Warning("This item expired and was handed to another annotator.")
+    yield from get_next_prompt(annotator_id, request)
 
 
 # --- Training Interface ---
+# Training runs are queued, so a second click waits instead of oversubscribing
+job_queue = JobQueue()
+
+
 def run_training_script(script_name):
-    # This is a simple way to run the script.
-    # In a real deployed app, you'd want a more robust task queue (e.g. Celery)
-    try:
-        subprocess.Popen(["python", f"scripts/{script_name}"])
-        return f"Started {script_name}. Check terminal for logs."
-    except Exception as e:
-        return f"Error starting training: {str(e)}"
+    # Jobs train where the execution profile puts them, so on a CPU-only
+    # host they share config.job_cpu_slots instead of the single GPU slot
+    resource = "gpu" if get_profile().device == "cuda" else "cpu"
+    job_id = job_queue.submit(
+        script_name, [sys.executable, f"scripts/{script_name}"], resource=resource
+    )
+    return f"Queued {script_name} as job {job_id}."
+
+
+def list_jobs():
+    rows = []
+    for job in job_queue.list():
+        progress = job["progress"]
+        started = job["started_at"]
+        rows.append(
+            [
+                job["id"],
+                job["name"],
+                job["status"],
+                f"{progress:.0%}" if progress is not None else "",
+                time.strftime("%H:%M:%S", time.localtime(started)) if started else "",
+            ]
+        )
+    return rows
+
+
+def cancel_job(job_id):
+    if job_id is None:
+        return "Enter a job ID."
+    if job_queue.cancel(int(job_id)):
+        return f"Cancelling job {int(job_id)}."
+    return f"Job {int(job_id)} is not queued or running."
+
+
+def job_log(job_id):
+    return job_queue.tail(int(job_id)) if job_id is not None else ""
 
 
 # --- Gradio App Layout ---
@@ -151,37 +246,39 @@ with gr.Blocks(theme=theme, title="RLHF Training Pipeline") as app:
             btn_tie = gr.Button("Tie / Skip", variant="secondary")
             btn_b = gr.Button("B is Better", variant="primary")
 
+        annotation_outputs = [prompt_box, resp_a_box, resp_b_box, btn_a, btn_tie, btn_b]
+
+        annotator_id = gr.Textbox(visible=False)
+        app.load(None, outputs=annotator_id, js=ANNOTATOR_ID_JS)
+
         # Initial load (hacky way to load first prompt)
         # We use a hidden button to trigger the first load
         load_btn = gr.Button("Start Annotation", visible=True)
 
-        def start_annotation():
-            p, a, b = get_next_prompt()
-            return {
-                prompt_box: p,
-                resp_a_box: a,
-                resp_b_box: b,
-                load_btn: gr.update(visible=False),
-            }
+        def start_annotation(annotator_id, request: gr.Request):
+            for update in get_next_prompt(annotator_id, request):
+                yield update + (gr.update(visible=False),)
 
         load_btn.click(
-            start_annotation, outputs=[prompt_box, resp_a_box, resp_b_box, load_btn]
+            start_annotation,
+            inputs=annotator_id,
+            outputs=annotation_outputs + [load_btn],
         )
 
         btn_a.click(
             save_preference,
-            inputs=[gr.State("A is Better"), prompt_box, resp_a_box, resp_b_box],
-            outputs=[prompt_box, resp_a_box, resp_b_box],
+            inputs=[gr.State("A is Better"), annotator_id],
+            outputs=annotation_outputs,
         )
         btn_b.click(
             save_preference,
-            inputs=[gr.State("B is Better"), prompt_box, resp_a_box, resp_b_box],
-            outputs=[prompt_box, resp_a_box, resp_b_box],
+            inputs=[gr.State("B is Better"), annotator_id],
+            outputs=annotation_outputs,
         )
         btn_tie.click(
             save_preference,
-            inputs=[gr.State("Tie"), prompt_box, resp_a_box, resp_b_box],
-            outputs=[prompt_box, resp_a_box, resp_b_box],
+            inputs=[gr.State("Tie"), annotator_id],
+            outputs=annotation_outputs,
         )
 
     with gr.Tab("⚙️ Training"):
@@ -191,13 +288,34 @@ with gr.Blocks(theme=theme, title="RLHF Training Pipeline") as app:
         )
 
         with gr.Row():
+            rm_btn = gr.Button("Train Reward Model", variant="primary")
             dpo_btn = gr.Button("Start DPO Training", variant="primary")
             ppo_btn = gr.Button("Start PPO Training", variant="primary")
 
         status_box = gr.Textbox(label="Status", interactive=False)
 
+        jobs_table = gr.Dataframe(
+            headers=["ID", "Job", "Status", "Progress", "Started"],
+            value=list_jobs,
+            interactive=False,
+        )
+
+        with gr.Row():
+            job_id_box = gr.Number(label="Job ID", precision=0)
+            cancel_btn = gr.Button("Cancel Job", variant="stop")
+
+        log_box = gr.Textbox(label="Log", interactive=False, lines=10, max_lines=20)
+
+        rm_btn.click(lambda: run_training_script("run_rm.py"), outputs=status_box)
         dpo_btn.click(lambda: run_training_script("run_dpo.py"), outputs=status_box)
         ppo_btn.click(lambda: run_training_script("run_ppo.py"), outputs=status_box)
+        cancel_btn.click(cancel_job, inputs=job_id_box, outputs=status_box)
+        job_id_box.change(job_log, inputs=job_id_box, outputs=log_box)
+
+        # Poll job status and the selected job's log
+        timer = gr.Timer(2)
+        timer.tick(list_jobs, outputs=jobs_table)
+        timer.tick(job_log, inputs=job_id_box, outputs=log_box)
 
 
 # Expose the app object for the root script
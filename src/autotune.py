@@ -0,0 +1,279 @@
+import json
+import os
+import resource
+import time
+from dataclasses import asdict, dataclass
+import torch
+from .config import config
+from .data import cache_key
+from .runtime import get_profile
+from .utils import get_device, get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class BatchPlan:
+    """Micro-batch size, accumulation and checkpointing for one training run."""
+
+    micro_batch_size: int
+    gradient_accumulation_steps: int
+    gradient_checkpointing: bool
+    samples_per_s: float = 0.0
+
+    def training_args(self):
+        """Keyword arguments for ``TrainingArguments``."""
+        return {
+            "per_device_train_batch_size": self.micro_batch_size,
+            "gradient_accumulation_steps": self.gradient_accumulation_steps,
+            "gradient_checkpointing": self.gradient_checkpointing,
+            "gradient_checkpointing_kwargs": (
+                {"use_reentrant": False} if self.gradient_checkpointing else None
+            ),
+        }
+
+
+def hardware_signature():
+    """Identify the accelerator (or CPU) so cached plans are not reused elsewhere."""
+    if get_profile().device == "cuda":
+        props = torch.cuda.get_device_properties(0)
+        return f"cuda:{props.name}:{props.total_memory}"
+    total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    return f"cpu:{os.cpu_count()}:{total}"
+
+
+def _current_bytes():
+    if get_profile().device == "cuda":
+        return torch.cuda.memory_allocated()
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _available_bytes():
+    """Memory this process may use: what it holds plus what is still free."""
+    if get_profile().device == "cuda":
+        free, _ = torch.cuda.mem_get_info()
+    else:
+        free = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+    return free + _current_bytes()
+
+
+def _reset_peak():
+    if get_profile().device == "cuda":
+        torch.cuda.reset_peak_memory_stats()
+        return
+    try:
+        # Resets VmHWM, the peak resident set size (Linux 4.0+)
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        logger.warning("Cannot reset the peak RSS; probes overestimate memory")
+
+
+def _peak_bytes():
+    if get_profile().device == "cuda":
+        return torch.cuda.max_memory_allocated()
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss (kilobytes on Linux) never goes down, so it overestimates
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _is_oom(error):
+    return isinstance(error, torch.cuda.OutOfMemoryError) or (
+        "out of memory" in str(error).lower()
+    )
+
+
+def _probe(model, micro_batch_size, seq_len, steps=2):
+    """Time forward/backward passes at the worst-case DPO batch shape."""
+    profile = get_profile()
+    device = get_device(model)
+    # DPO runs chosen and rejected sequences through the model together
+    input_ids = torch.randint(
+        0, model.config.vocab_size, (2 * micro_batch_size, seq_len), device=device
+    )
+    autocast = torch.autocast(
+        device_type=device.type,
+        dtype=profile.dtype,
+        enabled=profile.precision in ("fp16", "bf16"),
+    )
+
+    elapsed = 0.0
+    for step in range(steps + 1):
+        start = time.perf_counter()
+        with autocast:
+            logits = model(input_ids=input_ids).logits
+            loss = logits.float().log_softmax(-1).mean()
+        loss.backward()
+        model.zero_grad(set_to_none=True)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        # The first pass includes one-off allocation and kernel selection
+        if step > 0:
+            elapsed += time.perf_counter() - start
+        del logits, loss
+    return micro_batch_size * steps / elapsed
+
+
+def _search(model, seq_len, target, budget, optimizer_bytes):
+    """
+    Find the fastest micro-batch that divides ``target`` and fits in ``budget``.
+
+    Only divisors are tried, so accumulation reaches the target batch exactly.
+    """
+    on_cuda = get_profile().device == "cuda"
+    start_bytes = _current_bytes()
+    baseline = start_bytes + optimizer_bytes
+    best_size, best_rate = 0, 0.0
+    sizes = [d for d in range(1, target + 1) if target % d == 0]
+    for i, size in enumerate(sizes):
+        if on_cuda:
+            torch.cuda.empty_cache()
+        _reset_peak()
+        try:
+            rate = _probe(model, size, seq_len)
+        except RuntimeError as e:
+            if not _is_oom(e):
+                raise
+            if on_cuda:
+                torch.cuda.empty_cache()
+            break
+
+        # Memory an earlier probe freed but the allocator kept is counted as
+        # well, which can only overestimate
+        activations = max(_peak_bytes() - start_bytes, 0)
+        logger.info(
+            f"Probe micro_batch={size}: {rate:.2f} samples/s, "
+            f"activations {activations / 1024**2:.0f} MB"
+        )
+        if baseline + activations > budget:
+            break
+        if rate > best_rate:
+            best_size, best_rate = size, rate
+        # Activation memory grows roughly linearly with the batch
+        following = sizes[i + 1] if i + 1 < len(sizes) else None
+        if following and baseline + activations * following / size > budget:
+            break
+    return best_size, best_rate
+
+
+def _set_gradient_checkpointing(model, enabled):
+    if getattr(model, "is_gradient_checkpointing", False) == enabled:
+        return
+    if enabled:
+        model.gradient_checkpointing_enable(
+            gradient_checkpointing_kwargs={"use_reentrant": False}
+        )
+        if hasattr(model, "enable_input_require_grads"):
+            model.enable_input_require_grads()
+    else:
+        model.gradient_checkpointing_disable()
+
+
+def plan_batch(
+    model,
+    seq_len=config.max_length,
+    target_batch_size=config.batch_size,
+    gradient_checkpointing=config.dpo_gradient_checkpointing,
+    cache_dir=None,
+):
+    """
+    Choose micro-batch size, gradient accumulation and checkpointing.
+
+    Probes forward/backward passes at the worst-case sequence length with
+    every micro-batch size that divides ``target_batch_size``. It keeps the
+    fastest one whose peak memory, plus Adam state for the trainable
+    parameters, stays within ``config.autotune_memory_fraction`` of the
+    available memory. With ``gradient_checkpointing="auto"`` the search is
+    repeated with checkpointing when the target batch does not fit, and the
+    faster plan wins. Accumulation steps make up the rest of the target
+    batch exactly.
+
+    Plans are cached per model, sequence length, target batch and hardware,
+    so later runs skip the probe.
+
+    Args:
+        model: The model to be trained (PEFT models included).
+        seq_len (int): Longest sequence the trainer will produce.
+        target_batch_size (int): Effective batch size to reach.
+        gradient_checkpointing (str): ``"auto"``, ``"on"`` or ``"off"``.
+        cache_dir (str): Where the plan cache lives.
+
+    Returns:
+        BatchPlan: The chosen plan.
+    """
+    path = os.path.join(cache_dir or config.cache_dir, "batch_plans.json")
+    key = cache_key(
+        model.config._name_or_path,
+        sum(p.numel() for p in model.parameters() if p.requires_grad),
+        seq_len,
+        target_batch_size,
+        gradient_checkpointing,
+        get_profile().precision,
+        hardware_signature(),
+    )
+    plans = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            plans = json.load(f)
+    if key in plans:
+        plan = BatchPlan(**plans[key])
+        logger.info(f"Using cached batch plan {plan}")
+        return plan
+
+    budget = _available_bytes() * config.autotune_memory_fraction
+    trainable = [p for p in model.parameters() if p.requires_grad]
+    # Adam keeps two fp32 moments plus the gradient for each trainable weight
+    optimizer_bytes = sum(3 * 4 * p.numel() for p in trainable)
+
+    was_training = model.training
+    # prepare_model_for_kbit_training may already have enabled checkpointing;
+    # each probe sets the state it needs and the original one is restored
+    was_checkpointing = getattr(model, "is_gradient_checkpointing", False)
+    model.train()
+    candidates = []
+    try:
+        if gradient_checkpointing != "on":
+            _set_gradient_checkpointing(model, False)
+            size, rate = _search(
+                model, seq_len, target_batch_size, budget, optimizer_bytes
+            )
+            candidates.append((rate, size, False))
+        if gradient_checkpointing == "on" or (
+            gradient_checkpointing == "auto" and candidates[0][1] < target_batch_size
+        ):
+            _set_gradient_checkpointing(model, True)
+            size, rate = _search(
+                model, seq_len, target_batch_size, budget, optimizer_bytes
+            )
+            candidates.append((rate, size, True))
+    finally:
+        _set_gradient_checkpointing(model, was_checkpointing)
+        model.train(was_training)
+
+    rate, size, checkpointing = max(candidates)
+    if size == 0:
+        raise RuntimeError(
+            f"A single sequence of {seq_len} tokens does not fit in memory"
+        )
+    plan = BatchPlan(
+        micro_batch_size=size,
+        gradient_accumulation_steps=target_batch_size // size,
+        gradient_checkpointing=checkpointing,
+        samples_per_s=rate,
+    )
+    logger.info(f"Chose batch plan {plan}")
+
+    plans[key] = asdict(plan)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(plans, f, indent=2)
+    os.replace(tmp_path, path)
+    return plan
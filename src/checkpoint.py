@@ -0,0 +1,350 @@
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import threading
+import time
+import numpy as np
+import torch
+from safetensors.torch import load_file, save_file
+from .config import config
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+_CHECKPOINT_RE = re.compile(r"^checkpoint-(\d+)$")
+STATE_NAME = "checkpoint.json"
+TENSORS_NAME = "checkpoint.safetensors"
+COMPLETE_NAME = "COMPLETE"
+
+
+def rng_state():
+    """Snapshot of the Python, numpy and torch (CPU and CUDA) generators."""
+    version, internal, gauss = random.getstate()
+    state = {
+        "python": (version, internal, gauss),
+        "numpy": np.random.get_state(legacy=False),
+        "torch": torch.random.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    version, internal, gauss = state["python"]
+    random.setstate((version, tuple(internal), gauss))
+    np.random.set_state(state["numpy"])
+    torch.random.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def trainable_state(model):
+    """Trainable parameters by name: the adapters and value head under LoRA."""
+    return {n: p.detach() for n, p in model.named_parameters() if p.requires_grad}
+
+
+@torch.no_grad()
+def load_trainable_state(model, tensors):
+    params = dict(model.named_parameters())
+    missing = set(tensors) - set(params)
+    if missing:
+        raise ValueError(f"Checkpoint has unknown parameters: {sorted(missing)[:5]}")
+    for name, tensor in tensors.items():
+        params[name].copy_(tensor)
+
+
+def _snapshot(obj, copies):
+    """Copy every tensor and array in ``obj`` so training can keep mutating it."""
+    if isinstance(obj, torch.Tensor):
+        if obj.is_cuda:
+            # Pinned host memory lets the copy overlap with training; the
+            # writer waits for it before serializing
+            copy = torch.empty(obj.shape, dtype=obj.dtype, pin_memory=True)
+            copy.copy_(obj.detach(), non_blocking=True)
+            copies.append(copy)
+            return copy
+        return obj.detach().clone()
+    if isinstance(obj, np.ndarray):
+        return obj.copy()
+    if isinstance(obj, dict):
+        return {k: _snapshot(v, copies) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(v, copies) for v in obj)
+    return obj
+
+
+def _flatten(obj, tensors, prefix="t"):
+    """
+    Split ``obj`` into safetensors-ready tensors and a JSON skeleton.
+
+    Tensors and arrays are replaced by references; tuples and dicts with
+    non-string keys (such as optimizer state) are tagged so they come back
+    with their original types.
+    """
+    if isinstance(obj, torch.Tensor):
+        key = f"{prefix}.{len(tensors)}"
+        tensors[key] = obj.contiguous()
+        return {"__tensor__": key}
+    if isinstance(obj, np.ndarray):
+        key = f"{prefix}.{len(tensors)}"
+        tensors[key] = torch.from_numpy(np.ascontiguousarray(obj))
+        return {"__ndarray__": key}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, tuple):
+        return {"__tuple__": [_flatten(v, tensors, prefix) for v in obj]}
+    if isinstance(obj, list):
+        return [_flatten(v, tensors, prefix) for v in obj]
+    if isinstance(obj, dict):
+        if all(isinstance(k, str) and not k.startswith("__") for k in obj):
+            return {k: _flatten(v, tensors, prefix) for k, v in obj.items()}
+        return {
+            "__items__": [[k, _flatten(v, tensors, prefix)] for k, v in obj.items()]
+        }
+    return obj
+
+
+def _unflatten(obj, tensors):
+    if isinstance(obj, list):
+        return [_unflatten(v, tensors) for v in obj]
+    if not isinstance(obj, dict):
+        return obj
+    if "__tensor__" in obj:
+        return tensors[obj["__tensor__"]]
+    if "__ndarray__" in obj:
+        return tensors[obj["__ndarray__"]].numpy()
+    if "__tuple__" in obj:
+        return tuple(_unflatten(v, tensors) for v in obj["__tuple__"])
+    if "__items__" in obj:
+        return {k: _unflatten(v, tensors) for k, v in obj["__items__"]}
+    return {k: _unflatten(v, tensors) for k, v in obj.items()}
+
+
+def _fsync(path):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+class CheckpointManager:
+    """
+    Asynchronous, resumable training checkpoints.
+
+    ``save`` only copies the state (weights, optimizer state, RNG state,
+    sampler position, ...) off the live tensors, onto pinned host memory
+    for GPU tensors, and hands the copy to a background writer thread. The
+    writer serializes tensors with safetensors and the rest as JSON into a
+    temporary directory, fsyncs and renames it to ``checkpoint-<step>``, so
+    a run killed mid-write never leaves a partial checkpoint behind. When a
+    save is requested while the previous one is still pending, the pending
+    one is replaced by the newer state rather than blocking the training
+    loop.
+
+    After every write, checkpoints are pruned to the ``keep_last`` most
+    recent plus every step that is a multiple of ``keep_every``.
+
+    ``install_signal_handler`` turns SIGTERM (preemption, or a cancelled
+    job) into the ``preempted`` flag, so the training loop can write a
+    last checkpoint and exit; the next run resumes from it. ``finish``
+    marks the run complete, and the next run then starts over.
+
+    Args:
+        directory (str): Run directory holding the checkpoints.
+        every (int): Steps between checkpoints (0 disables periodic saves).
+        keep_last (int): Number of recent checkpoints to keep.
+        keep_every (int): Also keep checkpoints at multiples of this step.
+        resume (bool): Resume unfinished runs; False always starts over.
+    """
+
+    def __init__(
+        self,
+        directory,
+        every=config.checkpoint_every,
+        keep_last=config.checkpoint_keep_last,
+        keep_every=config.checkpoint_keep_every,
+        resume=config.checkpoint_resume,
+    ):
+        self.directory = directory
+        self.every = every
+        self.keep_last = max(keep_last, 1)
+        self.keep_every = keep_every
+        self.resume = resume
+        self.preempted = False
+        self.skipped = 0
+        self.error = None
+        self._pending = None
+        self._writing = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self._previous_handler = None
+
+    def due(self, step):
+        return self.preempted or bool(self.every and step % self.every == 0)
+
+    def steps(self):
+        """Steps of the complete checkpoints on disk, in order."""
+        if not os.path.isdir(self.directory):
+            return []
+        steps = []
+        for name in os.listdir(self.directory):
+            match = _CHECKPOINT_RE.match(name)
+            if match and os.path.isfile(os.path.join(self.directory, name, STATE_NAME)):
+                steps.append(int(match.group(1)))
+        return sorted(steps)
+
+    def path(self, step):
+        return os.path.join(self.directory, f"checkpoint-{step}")
+
+    def latest(self):
+        steps = self.steps()
+        return self.path(steps[-1]) if steps else None
+
+    def resume_path(self):
+        """
+        Latest checkpoint of an unfinished run, or None to start over.
+
+        Starting over clears the directory: checkpoints of a finished run
+        (whose final model is saved separately) would collide with the new
+        run's steps.
+        """
+        latest = self.latest()
+        finished = os.path.exists(os.path.join(self.directory, COMPLETE_NAME))
+        if self.resume and latest and not finished:
+            return latest
+        shutil.rmtree(self.directory, ignore_errors=True)
+        return None
+
+    def save(self, step, state, files=None, block=False):
+        """
+        Snapshot ``state`` and write it as checkpoint ``step`` in the background.
+
+        Args:
+            step (int): Step number of the checkpoint.
+            state (dict): Nested dicts, lists and tuples of tensors, numpy
+                arrays and JSON values.
+            files (dict): Extra text files to write next to the state.
+            block (bool): Wait until the checkpoint is on disk.
+        """
+        copies = []
+        snapshot = _snapshot(state, copies)
+        event = None
+        if copies:
+            event = torch.cuda.Event()
+            event.record()
+        with self._cond:
+            if self._pending is not None:
+                self.skipped += 1
+                logger.warning(
+                    f"Checkpoint {self._pending[0]} superseded by {step} "
+                    "before it was written"
+                )
+            self._pending = (step, snapshot, files or {}, event)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        if block:
+            self.wait()
+
+    def wait(self):
+        """Block until every requested checkpoint is written."""
+        with self._cond:
+            while self._pending is not None or self._writing:
+                self._cond.wait()
+        if self.error is not None:
+            raise RuntimeError("Writing a checkpoint failed") from self.error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                job, self._pending = self._pending, None
+                self._writing = True
+            try:
+                self._write(*job)
+                self._prune()
+            except Exception as e:
+                logger.exception("Writing checkpoint failed")
+                self.error = e
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def _write(self, step, snapshot, files, event):
+        start = time.perf_counter()
+        if event is not None:
+            event.synchronize()
+        tmp = os.path.join(self.directory, f".checkpoint-{step}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        tensors = {}
+        skeleton = _flatten(snapshot, tensors)
+        tensors_path = os.path.join(tmp, TENSORS_NAME)
+        save_file(tensors, tensors_path)
+        _fsync(tensors_path)
+        for name, text in {STATE_NAME: json.dumps(skeleton), **files}.items():
+            with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+
+        final = self.path(step)
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+        logger.info(f"Saved checkpoint {final} in {time.perf_counter() - start:.2f}s")
+
+    def _prune(self):
+        steps = self.steps()
+        keep = set(steps[-self.keep_last :])
+        if self.keep_every:
+            keep.update(s for s in steps if s % self.keep_every == 0)
+        for step in steps:
+            if step not in keep:
+                shutil.rmtree(self.path(step), ignore_errors=True)
+
+    def load(self, path=None):
+        """Load a checkpoint's state (the latest by default) onto the CPU."""
+        path = path or self.latest()
+        with open(os.path.join(path, STATE_NAME), encoding="utf-8") as f:
+            skeleton = json.load(f)
+        return _unflatten(skeleton, load_file(os.path.join(path, TENSORS_NAME)))
+
+    def install_signal_handler(self):
+        """Set ``preempted`` on SIGTERM instead of exiting immediately."""
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        def handler(signum, frame):
+            logger.warning("Received SIGTERM, checkpointing before exit")
+            self.preempted = True
+
+        self._previous_handler = signal.signal(signal.SIGTERM, handler)
+
+    def close(self):
+        """Write pending checkpoints and stop the writer thread."""
+        self.wait()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._previous_handler is not None:
+            signal.signal(signal.SIGTERM, self._previous_handler)
+            self._previous_handler = None
+
+    def finish(self):
+        """Close and mark the run complete, so the next run starts over."""
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, COMPLETE_NAME), "w") as f:
+            f.write(f"{time.time()}\n")
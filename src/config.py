@@ -9,25 +9,88 @@ class Config:
 
     # Model config
     model_name: str = "gpt2"
-    use_4bit: bool = True
+    use_lora: bool = True  # Train LoRA adapters instead of full weights
+    use_4bit: bool = True  # 4-bit base for adapter training (CUDA only)
     lora_r: int = 16
     lora_alpha: int = 32
     lora_dropout: float = 0.05
 
     # Training config
     batch_size: int = 4
+    max_length: int = 256
     learning_rate: float = 1.41e-5
     rm_epochs: int = 3
+    rm_model_name: str = "distilbert-base-uncased"
+    rm_learning_rate: float = 2e-5
+    rm_val_fraction: float = 0.1  # Held-out pairs for reward model accuracy
     ppo_steps: int = 100
+    ppo_mini_batch_size: int = 1
+    ppo_num_workers: int = 0  # Rollout worker processes; 0 runs PPO in-process
+    ppo_sync_every: int = 1  # PPO updates between weight broadcasts to workers
+    ppo_prompt_replacement: bool = False  # False walks the prompt pool in epochs
+    ppo_prompt_weighting: str = "uniform"  # "uniform" or "reward_variance"
+    dpo_learning_rate: float = 5e-5
+    dpo_autotune: bool = True  # Probe the micro-batch; batch_size is the target
+    dpo_gradient_checkpointing: str = "auto"  # "auto", "on" or "off"
+    autotune_memory_fraction: float = 0.9
     kl_penalty: float = 0.1
 
+    # Execution profile ("auto" resolves against the hardware)
+    device: str = "auto"  # "auto", "cuda" or "cpu"
+    precision: str = "auto"  # "auto", "fp16", "bf16" or "fp32"
+    quantize_inference: bool = True  # int8 reward model on CPU
+    num_threads: int = 0  # 0 keeps the torch default
+    num_interop_threads: int = 0
+
+    # Model registry config
+    registry_max_mb: int = 8192
+
+    # Chat config
+    kv_cache_max_mb: int = 512
+    kv_cache_max_sessions: int = 64
+
+    # Inference engine config
+    engine_max_batch_size: int = 8
+    ppo_use_inference_engine: bool = False
+
     # Annotation config
     num_annotations: int = 50
+    prefetch_depth: int = 4
+    prefetch_batch_size: int = 2
+    annotation_lease_timeout: float = 300.0  # Seconds before an item is reassigned
+    # Responses per prompt; the most uncertain pair is shown
+    annotation_candidates: int = 4
+    annotation_similarity: float = 0.8  # Trigram Jaccard treated as a duplicate
+    annotation_max_margin: float = 0.0  # Skip prompts with a larger margin; 0 keeps all
+    annotation_dropout_passes: int = 4  # MC-dropout reward samples; 1 disables
+
+    # Prompt corpus config (JSONL or Parquet; empty uses the built-in prompts)
+    prompt_corpus_path: str = ""
+    prompt_corpus_field: str = "prompt"
+    prompt_max_tokens: int = 0  # Skip longer prompts; 0 keeps all
+
+    # Job queue config
+    job_gpu_slots: int = 1
+    job_cpu_slots: int = 2
+    job_log_max_bytes: int = 10 * 1024 * 1024
+    job_log_backups: int = 3
+    job_cancel_grace: float = 10.0  # Minimum; slow training steps get longer
+
+    # Checkpoint config (PPO and DPO)
+    checkpoint_every: int = 10  # Steps between async checkpoints; 0 disables
+    checkpoint_keep_last: int = 2
+    checkpoint_keep_every: int = 0  # Also keep multiples of this step; 0 keeps none
+    checkpoint_resume: bool = True  # Resume unfinished runs from their last checkpoint
+
+    # Metrics config
+    metrics_port: int = 0  # Serve Prometheus text format on /metrics (0 disables)
 
     # Paths
     output_dir: str = "output"
     data_dir: str = "data"
-    preference_file: str = "preferences.json"
+    preference_file: str = "preferences.jsonl"
+    preference_fsync_every: int = 8
+    preference_compact_every: int = 1000
 
     def __post_init__(self):
         # Ensure directories exist
@@ -38,6 +101,26 @@ class Config:
     def preference_path(self) -> str:
         return os.path.join(self.data_dir, self.preference_file)
 
+    @property
+    def cache_dir(self) -> str:
+        return os.path.join(self.data_dir, "cache")
+
+    @property
+    def checkpoint_dir(self) -> str:
+        return os.path.join(self.output_dir, "checkpoints")
+
+    @property
+    def metrics_dir(self) -> str:
+        return os.path.join(self.output_dir, "metrics")
+
+    @property
+    def jobs_db_path(self) -> str:
+        return os.path.join(self.output_dir, "jobs.sqlite")
+
+    @property
+    def job_log_dir(self) -> str:
+        return os.path.join(self.output_dir, "logs")
+
 
 # Global config instance
 config = Config()
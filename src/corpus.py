@@ -0,0 +1,273 @@
+import hashlib
+import json
+import os
+import shutil
+from array import array
+from collections.abc import Sequence
+import numpy as np
+from .config import config
+from .data import cache_key
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def _iter_jsonl(path, field):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            value = json.loads(line)
+            # Lines may be bare strings or objects holding the prompt
+            yield value if isinstance(value, str) else value[field]
+
+
+def _iter_parquet(path, field, batch_size=10_000):
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(
+        batch_size=batch_size, columns=[field]
+    ):
+        yield from batch.column(0).to_pylist()
+
+
+def iter_source(path, field="prompt"):
+    """Stream prompt texts from a JSONL or Parquet file."""
+    if path.endswith(".parquet"):
+        return _iter_parquet(path, field)
+    return _iter_jsonl(path, field)
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_corpus(source, index_dir, tokenizer, field="prompt", batch_size=1000):
+    """
+    Ingest a JSONL or Parquet prompt file into a memory-mapped index.
+
+    The source is streamed in batches: every prompt is deduplicated by an
+    8-byte BLAKE2 hash, tokenized once and appended to flat text and token
+    files whose per-prompt offsets are stored next to them. The index is
+    written to a temporary directory and renamed into place, so readers
+    never see a half-built index.
+
+    Returns:
+        PromptCorpus: The opened index.
+    """
+    tmp_dir = index_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    seen = set()
+    hashes = array("Q")
+    text_offsets = array("q", [0])
+    token_offsets = array("q", [0])
+    lengths = array("i")
+    fingerprint = hashlib.sha256()
+
+    with open(os.path.join(tmp_dir, "text.bin"), "wb") as text_file, open(
+        os.path.join(tmp_dir, "tokens.bin"), "wb"
+    ) as token_file:
+        for batch in _batched(iter_source(source, field), batch_size):
+            unique = []
+            for prompt in batch:
+                digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=8)
+                key = int.from_bytes(digest.digest(), "little")
+                if key not in seen:
+                    seen.add(key)
+                    hashes.append(key)
+                    fingerprint.update(digest.digest())
+                    unique.append(prompt)
+            if not unique:
+                continue
+
+            for ids in tokenizer(unique)["input_ids"]:
+                token_file.write(np.asarray(ids, dtype=np.int32).tobytes())
+                token_offsets.append(token_offsets[-1] + len(ids))
+                lengths.append(len(ids))
+            for prompt in unique:
+                encoded = prompt.encode("utf-8")
+                text_file.write(encoded)
+                text_offsets.append(text_offsets[-1] + len(encoded))
+
+    np.save(
+        os.path.join(tmp_dir, "text_offsets.npy"), np.frombuffer(text_offsets, np.int64)
+    )
+    np.save(
+        os.path.join(tmp_dir, "token_offsets.npy"),
+        np.frombuffer(token_offsets, np.int64),
+    )
+    np.save(os.path.join(tmp_dir, "lengths.npy"), np.frombuffer(lengths, np.int32))
+    np.save(os.path.join(tmp_dir, "hashes.npy"), np.frombuffer(hashes, np.uint64))
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(
+            {
+                "source": os.path.abspath(source),
+                "field": field,
+                "tokenizer": getattr(tokenizer, "name_or_path", None),
+                "count": len(lengths),
+                "fingerprint": fingerprint.hexdigest()[:16],
+            },
+            f,
+        )
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+    logger.info(f"Indexed {len(lengths)} unique prompts from {source}")
+    return PromptCorpus(index_dir)
+
+
+def _memmap(path, dtype):
+    # np.memmap cannot map empty files
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def _load_column(index_dir, name):
+    return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+
+class PromptCorpus(Sequence):
+    """
+    Read-only, memory-mapped prompt index built by ``build_corpus``.
+
+    Opening an index maps its files without reading them, so it is instant
+    regardless of size. Prompts are decoded on access: ``corpus[i]`` is O(1)
+    and iteration streams through the text file. ``filter`` selects prompts
+    by token length using only the length column and ``shard`` splits the
+    prompts between processes; both return views over the same files.
+
+    Attributes:
+        lengths (np.ndarray): Token length of every prompt in the view.
+        hashes (np.ndarray): 64-bit dedup hash of every prompt in the view.
+        tokens (np.ndarray): Flat token ids of the whole index.
+    """
+
+    def __init__(self, index_dir, rows=None):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        self._text = _memmap(os.path.join(index_dir, "text.bin"), np.uint8)
+        self.tokens = _memmap(os.path.join(index_dir, "tokens.bin"), np.int32)
+        self._text_offsets = _load_column(index_dir, "text_offsets.npy")
+        self._token_offsets = _load_column(index_dir, "token_offsets.npy")
+        self._lengths = _load_column(index_dir, "lengths.npy")
+        self._hashes = _load_column(index_dir, "hashes.npy")
+        self.rows = rows
+
+    @property
+    def fingerprint(self):
+        if self.rows is None:
+            return self.meta["fingerprint"]
+        return cache_key(self.meta["fingerprint"], hashlib.sha1(self.rows).hexdigest())
+
+    @property
+    def lengths(self):
+        return self._lengths if self.rows is None else self._lengths[self.rows]
+
+    @property
+    def hashes(self):
+        return self._hashes if self.rows is None else self._hashes[self.rows]
+
+    def _row(self, i):
+        return i if self.rows is None else int(self.rows[i])
+
+    def __len__(self):
+        return self.meta["count"] if self.rows is None else len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        row = self._row(i)
+        start, end = self._text_offsets[row], self._text_offsets[row + 1]
+        return bytes(self._text[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def token_spans(self):
+        """Start and end offsets of every prompt's ids in ``tokens``."""
+        offsets = np.asarray(self._token_offsets)
+        if self.rows is None:
+            return offsets[:-1], offsets[1:]
+        return offsets[self.rows], offsets[self.rows + 1]
+
+    def filter(self, min_tokens=0, max_tokens=0):
+        """View of the prompts with ``min_tokens <= length <= max_tokens``."""
+        lengths = np.asarray(self.lengths)
+        keep = lengths >= min_tokens
+        if max_tokens:
+            keep &= lengths <= max_tokens
+        rows = np.flatnonzero(keep)
+        if self.rows is not None:
+            rows = self.rows[rows]
+        return PromptCorpus(self.index_dir, rows=rows)
+
+    def shard(self, index, num_shards):
+        """View of every ``num_shards``-th prompt, starting at ``index``."""
+        rows = np.arange(index, len(self), num_shards)
+        if self.rows is not None:
+            rows = self.rows[rows]
+        return PromptCorpus(self.index_dir, rows=rows)
+
+
+def load_corpus(
+    source,
+    tokenizer,
+    field=config.prompt_corpus_field,
+    cache_dir=None,
+    min_tokens=0,
+    max_tokens=config.prompt_max_tokens,
+):
+    """
+    Open the index of ``source``, building it first if needed.
+
+    The index is keyed by the source's path, size and modification time
+    and by the tokenizer, so an unchanged file is never re-ingested.
+    """
+    stat = os.stat(source)
+    key = cache_key(
+        os.path.abspath(source),
+        stat.st_size,
+        stat.st_mtime_ns,
+        field,
+        getattr(tokenizer, "name_or_path", None),
+    )
+    index_dir = os.path.join(cache_dir or config.cache_dir, f"prompt-corpus-{key}")
+    if os.path.exists(os.path.join(index_dir, "meta.json")):
+        corpus = PromptCorpus(index_dir)
+    else:
+        corpus = build_corpus(source, index_dir, tokenizer, field)
+    if min_tokens or max_tokens:
+        corpus = corpus.filter(min_tokens, max_tokens)
+    return corpus
+
+
+def load_prompts(default, tokenizer_fn):
+    """
+    Prompts for annotation and PPO: the corpus at ``config.prompt_corpus_path``
+    when one is configured, ``default`` otherwise.
+
+    Args:
+        default (list): Prompts to fall back to.
+        tokenizer_fn (callable): Returns the tokenizer; only called when the
+            corpus is used.
+    """
+    if not config.prompt_corpus_path:
+        return default
+    return load_corpus(config.prompt_corpus_path, tokenizer_fn())
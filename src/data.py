@@ -1,5 +1,12 @@
-from datasets import Dataset
+from datasets import Dataset, concatenate_datasets, load_from_disk
+import hashlib
 import json
+import os
+import random
+import shutil
+import torch
+from .config import config
+from .preference_store import iter_preferences, resolve_preference_path
 
 
 def prepare_dataset(preferences):
@@ -23,12 +30,49 @@ def prepare_dataset(preferences):
 
 
 def load_preferences(file_path):
-    """Load preferences from a JSON file."""
-    with open(file_path, "r") as f:
-        return json.load(f)
+    """Load preferences from a JSONL (or legacy JSON) file into a list."""
+    return list(iter_preferences(file_path))
 
 
-def tokenize_fn(examples, tokenizer, max_length=256):
+def file_hash(file_path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(*parts):
+    key = "|".join(str(p) for p in parts)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _load_or_build(path, build_fn):
+    # Datasets loaded from disk are memory-mapped Arrow tables, so reopening a
+    # cached dataset costs almost nothing regardless of its size
+    if not os.path.isdir(path):
+        build_fn().save_to_disk(path)
+    return load_from_disk(path)
+
+
+def load_preference_dataset(file_path=None, cache_dir=None):
+    """
+    Load the raw preference dataset through an on-disk Arrow cache.
+
+    The cache is keyed by the file's content hash. Because the returned
+    dataset is file-backed, later ``.map`` calls (such as the tokenization done
+    inside ``DPOTrainer``) are cached by ``datasets`` across runs as well.
+    """
+    # Hash the legacy preferences.json when that is all there is yet
+    file_path = resolve_preference_path(file_path or config.preference_path)
+    cache_dir = cache_dir or config.cache_dir
+    key = cache_key(file_hash(file_path))
+    path = os.path.join(cache_dir, f"preferences-{key}")
+    return _load_or_build(path, lambda: prepare_dataset(iter_preferences(file_path)))
+
+
+def tokenize_fn(examples, tokenizer, max_length=256, padding="max_length"):
     """
     Tokenize examples for reward model training.
 
@@ -36,6 +80,8 @@ def tokenize_fn(examples, tokenizer, max_length=256):
         examples (dict): Batch of examples.
         tokenizer (AutoTokenizer): Tokenizer instance.
         max_length (int): Maximum sequence length.
+        padding (str | bool): Padding strategy. Pass False to leave padding to
+            the collator.
 
     Returns:
         dict: Tokenized 'chosen' and 'rejected' inputs.
@@ -44,13 +90,9 @@ def tokenize_fn(examples, tokenizer, max_length=256):
 
     rejected = [p + " " + r for p, r in zip(examples["prompt"], examples["rejected"])]
 
-    tok_c = tokenizer(
-        chosen, truncation=True, padding="max_length", max_length=max_length
-    )
+    tok_c = tokenizer(chosen, truncation=True, padding=padding, max_length=max_length)
 
-    tok_r = tokenizer(
-        rejected, truncation=True, padding="max_length", max_length=max_length
-    )
+    tok_r = tokenizer(rejected, truncation=True, padding=padding, max_length=max_length)
 
     return {
         "chosen_input_ids": tok_c["input_ids"],
@@ -58,3 +100,328 @@ def tokenize_fn(examples, tokenizer, max_length=256):
         "rejected_input_ids": tok_r["input_ids"],
         "rejected_attention_mask": tok_r["attention_mask"],
     }
+
+
+def _add_lengths(examples):
+    return {
+        "length": [
+            max(len(c), len(r))
+            for c, r in zip(
+                examples["chosen_input_ids"], examples["rejected_input_ids"]
+            )
+        ]
+    }
+
+
+def record_fingerprint(record):
+    """Return a stable fingerprint of a (prompt, chosen, rejected) record."""
+    key = json.dumps([record["prompt"], record["chosen"], record["rejected"]])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+_SIGNATURE_WINDOW = 64 * 1024
+
+
+def _prefix_signature(file_path, length):
+    # Hashes the length and the first and last window of the prefix, so the
+    # check costs the same however large the file has grown
+    window = _SIGNATURE_WINDOW
+    digest = hashlib.sha256(str(length).encode("ascii"))
+    with open(file_path, "rb") as f:
+        digest.update(f.read(min(window, length)))
+        tail = max(length - window, window)
+        if tail < length:
+            f.seek(tail)
+            digest.update(f.read(length - tail))
+    return digest.hexdigest()
+
+
+def _read_jsonl_from(file_path, offset):
+    # Only complete lines are consumed; a line still being written is picked
+    # up on the next run
+    records = []
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records, offset
+
+
+class TokenizedPreferenceCache:
+    """
+    Incrementally maintained, tokenized copy of a preference file.
+
+    Tokenized rows live in Arrow shards under a directory keyed by the
+    preference file path, tokenizer name and ``max_length``; each row carries
+    the fingerprint of the record it was built from. An ``index.json``
+    remembers how many bytes of the JSONL file have been consumed and a
+    signature of that prefix (a hash of its first and last 64 KiB), so an
+    update reads only the new bytes, whatever the file's size:
+
+    - If the file only grew (the usual case for an append-only store), just
+      the new lines are parsed and tokenized into a new shard.
+    - If the file was rewritten (compaction that dropped lines, manual edits,
+      legacy JSON), every record is fingerprinted, only unseen fingerprints
+      are tokenized, and the shards are consolidated into one matching the
+      file's current rows. Edits confined to the middle of a large file that
+      do not shrink it below the consumed prefix go unnoticed.
+
+    Args:
+        tokenizer (AutoTokenizer): Tokenizer instance.
+        file_path (str): Preference file to mirror.
+        max_length (int): Maximum sequence length.
+        cache_dir (str): Root directory for cached datasets.
+        max_shards (int): Number of shards after which they are merged.
+    """
+
+    def __init__(
+        self, tokenizer, file_path=None, max_length=256, cache_dir=None, max_shards=32
+    ):
+        self.tokenizer = tokenizer
+        self.file_path = file_path or config.preference_path
+        self.max_length = max_length
+        self.max_shards = max_shards
+
+        key = cache_key(
+            os.path.abspath(self.file_path), tokenizer.name_or_path, max_length
+        )
+        self.path = os.path.join(cache_dir or config.cache_dir, f"tokenized-{key}")
+        self.index_path = os.path.join(self.path, "index.json")
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {"shards": [], "offset": 0, "signature": None, "next_shard": 0}
+        with open(self.index_path, "r") as f:
+            return json.load(f)
+
+    def _save_index(self, index):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _tokenize(self, records):
+        dataset = prepare_dataset(records)
+        fingerprints = [record_fingerprint(r) for r in records]
+        tokenized = dataset.map(
+            tokenize_fn,
+            batched=True,
+            fn_kwargs={
+                "tokenizer": self.tokenizer,
+                "max_length": self.max_length,
+                "padding": False,
+            },
+            remove_columns=dataset.column_names,
+        )
+        tokenized = tokenized.map(_add_lengths, batched=True)
+        return tokenized.add_column("fingerprint", fingerprints)
+
+    def _write_shard(self, index, dataset):
+        name = f"shard-{index['next_shard']:05d}"
+        dataset.save_to_disk(os.path.join(self.path, name))
+        index["next_shard"] += 1
+        return name
+
+    def _load_shards(self, shards):
+        if not shards:
+            return None
+        parts = [load_from_disk(os.path.join(self.path, s)) for s in shards]
+        return concatenate_datasets(parts) if len(parts) > 1 else parts[0]
+
+    def load(self):
+        """
+        Bring the cache up to date with the preference file and return it.
+
+        Returns:
+            Dataset: Memory-mapped dataset with 'chosen_*', 'rejected_*',
+            'length' and 'fingerprint' columns, one row per record.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        index = self._load_index()
+
+        file_path = resolve_preference_path(self.file_path)
+        appendable = file_path.endswith(".jsonl")
+
+        offset = index["offset"]
+        if (
+            appendable
+            # Indexes of older versions have no signature and are rebuilt
+            and index.get("signature") is not None
+            and os.path.getsize(file_path) >= offset
+            and _prefix_signature(file_path, offset) == index["signature"]
+        ):
+            new_records, end = _read_jsonl_from(file_path, offset)
+            if new_records:
+                print(f"Tokenizing {len(new_records)} new preference records")
+                index["shards"].append(
+                    self._write_shard(index, self._tokenize(new_records))
+                )
+            if len(index["shards"]) > self.max_shards:
+                self._replace_shards(index, self._load_shards(index["shards"]))
+        else:
+            if appendable:
+                records, end = _read_jsonl_from(file_path, 0)
+            else:
+                records, end = list(iter_preferences(file_path)), None
+            self._rebuild(index, records)
+
+        index["offset"] = end or 0
+        index.pop("prefix_hash", None)
+        index["signature"] = _prefix_signature(file_path, end) if end else None
+        self._save_index(index)
+        dataset = self._load_shards(index["shards"])
+        if dataset is None:
+            dataset = self._tokenize([])
+        return dataset
+
+    def _rebuild(self, index, records):
+        existing = self._load_shards(index["shards"])
+        rows = {}
+        if existing is not None:
+            for i, fp in enumerate(existing["fingerprint"]):
+                rows.setdefault(fp, i)
+
+        base = len(existing) if existing is not None else 0
+        new_records = []
+        selection = []
+        for record in records:
+            fp = record_fingerprint(record)
+            if fp not in rows:
+                rows[fp] = base + len(new_records)
+                new_records.append(record)
+            selection.append(rows[fp])
+
+        print(
+            f"Tokenizing {len(new_records)} new preference records "
+            f"(reusing {len(records) - len(new_records)})"
+        )
+        parts = [existing] if existing is not None else []
+        if new_records:
+            parts.append(self._tokenize(new_records))
+        combined = None
+        if parts:
+            combined = concatenate_datasets(parts).select(selection)
+        self._replace_shards(index, combined)
+
+    def _replace_shards(self, index, dataset):
+        old_shards = index["shards"]
+        index["shards"] = []
+        if dataset is not None and len(dataset):
+            index["shards"].append(self._write_shard(index, dataset.flatten_indices()))
+        self._save_index(index)
+        for shard in old_shards:
+            shutil.rmtree(os.path.join(self.path, shard), ignore_errors=True)
+
+
+def load_tokenized_dataset(tokenizer, file_path=None, max_length=256, cache_dir=None):
+    """
+    Load the tokenized preference dataset, tokenizing only new records.
+
+    Sequences are stored unpadded together with a ``length`` column, so
+    batches can be bucketed by length and padded by ``PairwiseCollator``.
+    See ``TokenizedPreferenceCache`` for how the cache is kept up to date.
+    """
+    cache = TokenizedPreferenceCache(tokenizer, file_path, max_length, cache_dir)
+    return cache.load()
+
+
+class LengthGroupedBatchSampler:
+    """
+    Yield batches of indices whose sequences have similar lengths.
+
+    Indices are shuffled, split into chunks of ``batch_size * bucket_factor``,
+    sorted by length inside each chunk and cut into batches. The batch order is
+    shuffled again so training still sees lengths in random order, while each
+    batch wastes little space on padding.
+
+    Args:
+        lengths (list): Sequence length of every example.
+        batch_size (int): Number of examples per batch.
+        bucket_factor (int): Number of batches sorted together.
+        shuffle (bool): Whether to shuffle indices and batch order.
+        seed (int): Seed for the shuffles; advanced every epoch.
+    """
+
+    def __init__(self, lengths, batch_size, bucket_factor=50, shuffle=True, seed=42):
+        self.lengths = list(lengths)
+        self.batch_size = batch_size
+        self.bucket_factor = bucket_factor
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def __iter__(self):
+        rng = random.Random(self.seed + self.epoch)
+        self.epoch += 1
+
+        indices = list(range(len(self.lengths)))
+        if self.shuffle:
+            rng.shuffle(indices)
+
+        chunk_size = self.batch_size * self.bucket_factor
+        batches = []
+        for start in range(0, len(indices), chunk_size):
+            chunk = sorted(
+                indices[start : start + chunk_size],
+                key=lambda i: self.lengths[i],
+                reverse=True,
+            )
+            for b in range(0, len(chunk), self.batch_size):
+                batches.append(chunk[b : b + self.batch_size])
+
+        if self.shuffle:
+            rng.shuffle(batches)
+        return iter(batches)
+
+    def __len__(self):
+        chunk_size = self.batch_size * self.bucket_factor
+        full_chunks, rest = divmod(len(self.lengths), chunk_size)
+        return full_chunks * self.bucket_factor + -(-rest // self.batch_size)
+
+
+class PairwiseCollator:
+    """
+    Pad a batch of tokenized preference pairs to its longest sequence.
+
+    Chosen and rejected sequences are padded to the same length, so they can
+    be concatenated into a single forward pass.
+
+    Args:
+        tokenizer (AutoTokenizer): Tokenizer providing the pad token id.
+        pad_to_multiple_of (int): Optionally round the padded length up to a
+            multiple of this value (useful for tensor cores).
+    """
+
+    def __init__(self, tokenizer, pad_to_multiple_of=None):
+        self.pad_token_id = tokenizer.pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+
+    def __call__(self, features):
+        max_len = max(
+            max(len(f["chosen_input_ids"]), len(f["rejected_input_ids"]))
+            for f in features
+        )
+        if self.pad_to_multiple_of:
+            multiple = self.pad_to_multiple_of
+            max_len = (max_len + multiple - 1) // multiple * multiple
+
+        batch = {}
+        for side in ("chosen", "rejected"):
+            input_ids = torch.full((len(features), max_len), self.pad_token_id)
+            attention_mask = torch.zeros((len(features), max_len), dtype=torch.long)
+            for i, f in enumerate(features):
+                ids = f[f"{side}_input_ids"]
+                input_ids[i, : len(ids)] = torch.tensor(ids)
+                attention_mask[i, : len(ids)] = 1
+            batch[f"{side}_input_ids"] = input_ids
+            batch[f"{side}_attention_mask"] = attention_mask
+        return batch
@@ -0,0 +1,496 @@
+import asyncio
+from concurrent.futures import Future
+from dataclasses import dataclass
+import queue
+import time
+from threading import Event, Lock, Thread
+from typing import List
+import torch
+import torch.nn.functional as F
+from .config import config
+from .kv_cache import to_legacy_cache
+from .utils import get_device, get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class GenerationResult:
+    """Outcome of one request served by the ``InferenceEngine``."""
+
+    text: str
+    prompt_ids: List[int]
+    token_ids: List[int]
+    time_to_first_token: float
+    latency: float
+
+
+class _Sequence:
+    """Scheduler-side state of one request."""
+
+    def __init__(self, prompt_ids, params, session_id, on_text):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = params["max_new_tokens"]
+        self.temperature = params["temperature"]
+        self.top_p = params["top_p"]
+        self.do_sample = params["do_sample"] and params["temperature"] > 0
+        self.session_id = session_id
+        self.on_text = on_text
+        self.future = Future()
+        # Sequence whose prefill this one shares (the first of its group)
+        self.source = None
+
+        self.generated = []
+        self.text = ""
+        self.past = None
+        self.submitted_at = time.perf_counter()
+        self.first_token_at = None
+
+
+class InferenceEngine:
+    """
+    In-process generation server with continuous batching.
+
+    Requests from any thread (or coroutine) are queued and served by a single
+    scheduler thread that owns the model. New requests are prefilled on their
+    own (once per prompt: the candidates of ``generate_batch`` start from
+    copies of the same KV cache) and then merged into the running decode
+    batch at the next token boundary; finished sequences leave the batch
+    immediately, so short requests never wait for long ones and the batch
+    stays full under load.
+
+    The running batch keeps one left-padded KV cache plus an attention mask
+    over cache positions. Sequences with a ``session_id`` reuse and refresh
+    their entry in ``prefix_cache`` (a ``PrefixCacheStore``), so multi-turn
+    chats only prefill new tokens.
+
+    Args:
+        model: Causal LM used for every request.
+        tokenizer: Tokenizer matching ``model``.
+        max_batch_size (int): Maximum number of sequences decoded together.
+        prefix_cache (PrefixCacheStore): Optional per-session KV cache store.
+        metrics (Metrics): Optional sink for per-request latency and tokens/s.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        max_batch_size=config.engine_max_batch_size,
+        prefix_cache=None,
+        metrics=None,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.prefix_cache = prefix_cache
+        self.metrics = metrics
+        self.eos_token_id = tokenizer.eos_token_id
+
+        self.completed = 0
+        self.generated_tokens = 0
+
+        self._pending = queue.Queue()
+        self._deferred = None
+        self._active = []
+        self._past = None
+        self._mask = None
+        self._positions = None
+        self._last_tokens = None
+
+        self._stop = Event()
+        self._start_lock = Lock()
+        self._thread = None
+
+    # --- Public API ---
+
+    @property
+    def max_positions(self):
+        """Longest sequence the model can attend over, if it has a limit."""
+        model_config = self.model.config
+        return getattr(model_config, "n_positions", None) or getattr(
+            model_config, "max_position_embeddings", None
+        )
+
+    def start(self):
+        """Start the scheduler thread if it is not already running."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = Thread(target=self._loop, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop the scheduler thread after the current step."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def submit(
+        self,
+        prompt,
+        max_new_tokens=100,
+        temperature=1.0,
+        top_p=1.0,
+        do_sample=True,
+        session_id=None,
+        on_text=None,
+    ):
+        """
+        Queue a generation request.
+
+        Args:
+            prompt (str): Prompt text, or a list of already encoded token ids.
+            session_id (str): Enables KV-cache reuse across calls of a session.
+            on_text (callable): Called from the scheduler thread with each new
+                chunk of decoded text.
+
+        Returns:
+            Future: Resolves to a ``GenerationResult``.
+        """
+        return self._submit(
+            prompt,
+            [on_text],
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            do_sample=do_sample,
+            session_id=session_id,
+        )[0]
+
+    def _submit(
+        self,
+        prompt,
+        callbacks,
+        max_new_tokens=100,
+        temperature=1.0,
+        top_p=1.0,
+        do_sample=True,
+        session_id=None,
+    ):
+        # One sequence per callback, all sampled from a single prefill
+        if isinstance(prompt, str):
+            prompt = self.tokenizer(prompt)["input_ids"]
+        prompt_ids = list(prompt) or [self.eos_token_id]
+        limit = self.max_positions
+        if limit is not None and len(prompt_ids) + max_new_tokens > limit:
+            raise ValueError(
+                f"Prompt of {len(prompt_ids)} tokens plus {max_new_tokens} new "
+                f"tokens exceeds the model's {limit} positions"
+            )
+        params = {
+            "max_new_tokens": max_new_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "do_sample": do_sample,
+        }
+        group = [_Sequence(prompt_ids, params, session_id, cb) for cb in callbacks]
+        for seq in group[1:]:
+            seq.source = group[0]
+        self._pending.put(group)
+        self.start()
+        return [seq.future for seq in group]
+
+    def generate_batch(self, prompts, num_responses=1, on_text=None, **kwargs):
+        """
+        Generate ``num_responses`` sequences per prompt and wait for them.
+
+        Blocking helper for threads such as the annotation prefetcher or the
+        PPO rollout loop; all requests are scheduled together, and each prompt
+        is prefilled once for all of its responses.
+
+        Args:
+            on_text (callable): Optional callback receiving the partial text
+                of every sequence whenever one of them grows.
+
+        Returns:
+            list: ``GenerationResult`` objects, prompt-major.
+        """
+        texts = [""] * (len(prompts) * num_responses)
+        futures = []
+        for i, prompt in enumerate(prompts):
+            callbacks = []
+            for j in range(num_responses):
+                callback = None
+                if on_text is not None:
+
+                    def callback(delta, index=i * num_responses + j):
+                        texts[index] += delta
+                        on_text(list(texts))
+
+                callbacks.append(callback)
+            futures.extend(self._submit(prompt, callbacks, **kwargs))
+        return [f.result() for f in futures]
+
+    async def generate(self, prompt, **kwargs):
+        """Generate a completion without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(prompt, **kwargs))
+
+    async def stream(self, prompt, **kwargs):
+        """Yield chunks of decoded text as the engine produces them."""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+
+        def on_text(delta):
+            loop.call_soon_threadsafe(chunks.put_nowait, delta)
+
+        future = self.submit(prompt, on_text=on_text, **kwargs)
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(chunks.put_nowait, None)
+        )
+        while True:
+            delta = await chunks.get()
+            if delta is None:
+                break
+            yield delta
+        future.result()
+
+    # --- Scheduler ---
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if not self._active and self._deferred is None:
+                    self._deferred = self._pending.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            # Groups are admitted whole; one that does not fit waits for the
+            # batch to drain, and an oversized one is admitted alone
+            new = []
+            free = self.max_batch_size - len(self._active)
+            while len(new) < free:
+                if self._deferred is None:
+                    try:
+                        self._deferred = self._pending.get_nowait()
+                    except queue.Empty:
+                        break
+                if len(new) + len(self._deferred) > free and (new or self._active):
+                    break
+                new.extend(self._deferred)
+                self._deferred = None
+
+            try:
+                with torch.no_grad():
+                    if new:
+                        self._admit(new)
+                    if self._active:
+                        self._decode_step()
+            except Exception as e:
+                # Per-request failures are handled in _admit; this is a batch
+                # failure, after which the shared decode state is unusable
+                logger.exception("Inference engine step failed")
+                for seq in self._active + new:
+                    if not seq.future.done():
+                        seq.future.set_exception(e)
+                self._active = []
+                self._past = self._mask = self._positions = self._last_tokens = None
+
+    def _fail(self, seq, error):
+        logger.error(f"Generation request failed: {error!r}")
+        if not seq.future.done():
+            seq.future.set_exception(error)
+
+    def _prefill(self, seq):
+        past, reused = None, 0
+        if self.prefix_cache is not None and seq.session_id is not None:
+            past, reused = self.prefix_cache.checkout(seq.session_id, seq.prompt_ids)
+
+        device = get_device(self.model)
+        length = len(seq.prompt_ids)
+        outputs = self.model(
+            input_ids=torch.tensor([seq.prompt_ids[reused:]], device=device),
+            past_key_values=past,
+            attention_mask=torch.ones(1, length, dtype=torch.long, device=device),
+            position_ids=torch.arange(reused, length, device=device)[None],
+            use_cache=True,
+        )
+        seq.past = to_legacy_cache(outputs.past_key_values)
+        return outputs.logits[:, -1]
+
+    def _admit(self, new):
+        # A failing request (e.g. a broken callback) only fails its own
+        # future, not the other sequences admitted with it
+        prefilled, logits, shared = [], [], {}
+        for seq in new:
+            try:
+                if seq.source is None:
+                    shared[id(seq)] = self._prefill(seq)
+                elif id(seq.source) not in shared:
+                    self._fail(seq, RuntimeError("Prefill of the prompt failed"))
+                    continue
+                else:
+                    # The caches are only read, so candidates share them
+                    seq.past = seq.source.past
+                logits.append(shared[id(seq.source or seq)])
+                prefilled.append(seq)
+            except Exception as e:
+                self._fail(seq, e)
+        if not prefilled:
+            return
+        tokens = self._sample(torch.cat(logits), prefilled)
+
+        joining = []
+        for seq, token in zip(prefilled, tokens.tolist()):
+            try:
+                if self._append_token(seq, token):
+                    self._finish(seq, seq.past)
+                else:
+                    joining.append((seq, token))
+            except Exception as e:
+                self._fail(seq, e)
+        if joining:
+            self._merge(joining)
+
+    def _merge(self, joining):
+        device = get_device(self.model)
+        caches = [s.past for s, _ in joining]
+        masks = [torch.ones(1, len(s.prompt_ids), dtype=torch.long) for s, _ in joining]
+        if self._past is not None:
+            caches.insert(0, self._past)
+            masks.insert(0, self._mask)
+
+        # Left-pad every cache to a common length so they can be stacked
+        width = max(m.shape[1] for m in masks)
+        layers = []
+        for layer in zip(*caches):
+            layers.append(
+                tuple(
+                    torch.cat(
+                        [F.pad(c[t], (0, 0, width - c[t].shape[2], 0)) for c in layer]
+                    )
+                    for t in range(len(layer[0]))
+                )
+            )
+        self._past = tuple(layers)
+        self._mask = torch.cat(
+            [F.pad(m.to(device), (width - m.shape[1], 0)) for m in masks]
+        )
+
+        positions = [torch.tensor([len(s.prompt_ids)]) for s, _ in joining]
+        last = [torch.tensor([t]) for _, t in joining]
+        if self._positions is not None and self._active:
+            positions.insert(0, self._positions.cpu())
+            last.insert(0, self._last_tokens.cpu())
+        self._positions = torch.cat(positions).to(device)
+        self._last_tokens = torch.cat(last).to(device)
+
+        for seq, _ in joining:
+            seq.past = None
+            self._active.append(seq)
+
+    def _decode_step(self):
+        batch_size = len(self._active)
+        mask = torch.cat([self._mask, self._mask.new_ones(batch_size, 1)], dim=1)
+        outputs = self.model(
+            input_ids=self._last_tokens[:, None],
+            past_key_values=self._past,
+            attention_mask=mask,
+            position_ids=self._positions[:, None],
+            use_cache=True,
+        )
+        self._past = to_legacy_cache(outputs.past_key_values)
+        self._mask = mask
+        self._positions = self._positions + 1
+        self._last_tokens = self._sample(outputs.logits[:, -1], self._active)
+
+        keep = []
+        for i, (seq, token) in enumerate(zip(self._active, self._last_tokens.tolist())):
+            try:
+                if self._append_token(seq, token):
+                    self._finish(seq, self._row_cache(i))
+                else:
+                    keep.append(i)
+            except Exception as e:
+                self._fail(seq, e)
+
+        if len(keep) < batch_size:
+            self._retire(keep)
+
+    def _row_cache(self, i):
+        # Rows are left-padded, so a sequence's entries are the last n columns
+        n = int(self._mask[i].sum())
+        return tuple(
+            tuple(t[i : i + 1, :, -n:].clone() for t in layer) for layer in self._past
+        )
+
+    def _retire(self, keep):
+        self._active = [self._active[i] for i in keep]
+        if not keep:
+            self._past = self._mask = self._positions = self._last_tokens = None
+            return
+
+        index = torch.tensor(keep, device=self._mask.device)
+        mask = self._mask.index_select(0, index)
+        # Drop leading columns that are padding for every remaining row
+        start = int((mask.sum(0) > 0).nonzero()[0])
+        self._mask = mask[:, start:]
+        self._past = tuple(
+            tuple(t.index_select(0, index)[:, :, start:] for t in layer)
+            for layer in self._past
+        )
+        self._positions = self._positions.index_select(0, index)
+        self._last_tokens = self._last_tokens.index_select(0, index)
+
+    def _sample(self, logits, seqs):
+        logits = logits.float()
+        device = logits.device
+        greedy = torch.tensor([not s.do_sample for s in seqs], device=device)
+        temperature = torch.tensor(
+            [s.temperature if s.do_sample else 1.0 for s in seqs], device=device
+        )
+        top_p = torch.tensor([s.top_p for s in seqs], device=device)
+
+        probs = torch.softmax(logits / temperature[:, None], dim=-1)
+        sorted_probs, sorted_idx = probs.sort(dim=-1, descending=True)
+        # Nucleus filtering: keep the smallest prefix whose mass reaches top_p
+        outside = sorted_probs.cumsum(dim=-1) - sorted_probs > top_p[:, None]
+        sorted_probs = sorted_probs.masked_fill(outside, 0.0)
+        sampled = sorted_idx.gather(1, torch.multinomial(sorted_probs, 1))[:, 0]
+
+        return torch.where(greedy, logits.argmax(dim=-1), sampled)
+
+    def _append_token(self, seq, token):
+        if seq.first_token_at is None:
+            seq.first_token_at = time.perf_counter()
+        seq.generated.append(token)
+        self.generated_tokens += 1
+        finished = token == self.eos_token_id or (
+            len(seq.generated) >= seq.max_new_tokens
+        )
+
+        text = self.tokenizer.decode(seq.generated, skip_special_tokens=True)
+        # Hold back incomplete multi-byte characters until they are complete
+        if finished or not text.endswith("�"):
+            delta = text[len(seq.text) :]
+            seq.text = text
+            if delta and seq.on_text is not None:
+                seq.on_text(delta)
+        return finished
+
+    def _finish(self, seq, past):
+        if self.prefix_cache is not None and seq.session_id is not None:
+            # The last sampled token has not been fed through the model yet
+            covered = seq.prompt_ids + seq.generated[:-1]
+            self.prefix_cache.store(seq.session_id, covered, past)
+
+        now = time.perf_counter()
+        self.completed += 1
+        result = GenerationResult(
+            text=seq.text,
+            prompt_ids=seq.prompt_ids,
+            token_ids=seq.generated,
+            time_to_first_token=seq.first_token_at - seq.submitted_at,
+            latency=now - seq.submitted_at,
+        )
+        if self.metrics is not None:
+            self.metrics.log(
+                self.completed,
+                latency_s=result.latency,
+                time_to_first_token_s=result.time_to_first_token,
+                tokens=len(result.token_ids),
+                tokens_per_s=len(result.token_ids) / result.latency,
+                batch_size=len(self._active),
+                queued=self._pending.qsize(),
+            )
+        seq.future.set_result(result)
@@ -0,0 +1,93 @@
+import torch
+from transformers.generation.streamers import BaseStreamer
+
+
+class BatchTextStreamer(BaseStreamer):
+    """
+    Streamer for batched ``generate`` calls.
+
+    ``TextStreamer`` only supports a batch size of one. This streamer keeps the
+    new tokens of every sequence and, after each decoding step, calls
+    ``callback`` with the decoded text of all sequences.
+    """
+
+    def __init__(self, tokenizer, callback):
+        self.tokenizer = tokenizer
+        self.callback = callback
+        self.tokens = None
+        self._prompt_seen = False
+
+    def put(self, value):
+        # The first call carries the prompt ids
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+
+        new_tokens = value.reshape(-1).tolist()
+        if self.tokens is None:
+            self.tokens = [[] for _ in new_tokens]
+        for row, token in zip(self.tokens, new_tokens):
+            row.append(token)
+        self.callback(
+            self.tokenizer.batch_decode(self.tokens, skip_special_tokens=True)
+        )
+
+    def end(self):
+        pass
+
+
+def generate_responses(
+    model,
+    tokenizer,
+    prompts,
+    num_responses=2,
+    max_new_tokens=100,
+    on_text=None,
+    **generate_kwargs,
+):
+    """
+    Sample several responses for a batch of prompts in a single generate call.
+
+    Prompts are left-padded so they all end at the same token offset; every
+    prompt is prefilled once and expanded to ``num_responses`` sequences with
+    ``num_return_sequences``.
+
+    Args:
+        prompts (list): Prompts to generate responses for.
+        num_responses (int): Number of responses sampled per prompt.
+        max_new_tokens (int): Maximum number of new tokens per response.
+        on_text (callable): Optional callback receiving the partial text of
+            every sequence after each decoding step.
+        **generate_kwargs: Extra sampling arguments passed to ``model.generate``.
+
+    Returns:
+        list: One list of ``num_responses`` response strings per prompt.
+    """
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "left"
+    try:
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(model.device)
+    finally:
+        tokenizer.padding_side = padding_side
+
+    generate_kwargs.setdefault("do_sample", True)
+    generate_kwargs.setdefault("pad_token_id", tokenizer.eos_token_id)
+    if on_text is not None:
+        generate_kwargs["streamer"] = BatchTextStreamer(tokenizer, on_text)
+
+    with torch.no_grad():
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            num_return_sequences=num_responses,
+            **generate_kwargs,
+        )
+
+    # Slice off the prompt by token offset rather than by character count
+    new_tokens = outputs[:, inputs["input_ids"].shape[1] :]
+    texts = tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+
+    return [
+        [text.strip() for text in texts[i : i + num_responses]]
+        for i in range(0, len(texts), num_responses)
+    ]
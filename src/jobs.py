@@ -0,0 +1,401 @@
+import json
+import logging
+import os
+import re
+import signal
+import sqlite3
+import subprocess
+import time
+from logging.handlers import RotatingFileHandler
+from threading import Event, Lock, Thread
+from transformers import TrainerCallback
+from .config import config
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+PROGRESS_MARKER = "[progress]"
+_PROGRESS_RE = re.compile(re.escape(PROGRESS_MARKER) + r" (\d+)/(\d+)")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    command TEXT NOT NULL,
+    resource TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL,
+    pid INTEGER,
+    returncode INTEGER,
+    error TEXT,
+    log_path TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+)
+"""
+
+
+def report_progress(done, total):
+    """Print a progress marker that the job queue records for the running job."""
+    print(f"{PROGRESS_MARKER} {done}/{total}", flush=True)
+
+
+class JobProgressCallback(TrainerCallback):
+    """Report ``Trainer`` progress to the job queue."""
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if state.max_steps:
+            report_progress(state.global_step, state.max_steps)
+
+
+def _signal(pid, sig):
+    # Jobs run in their own process group so dataloader workers go down too
+    try:
+        if os.name == "posix":
+            os.killpg(pid, sig)
+        else:
+            os.kill(pid, sig)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class JobQueue:
+    """
+    Local job scheduler for training runs, persisted in SQLite.
+
+    Jobs are commands run as child processes. A scheduler thread starts
+    queued jobs in FIFO order while each resource class stays under its
+    concurrency limit (by default one ``"gpu"`` job and two ``"cpu"`` jobs),
+    so a second click on "Start training" waits instead of fighting the first
+    run for memory. Output is captured to a rotating log file per job, and
+    lines printed with ``report_progress`` update the job's progress.
+
+    Job state survives restarts: queued jobs are picked up again. Jobs run
+    in their own session, so a running job can outlive the process that
+    started it; if its PID is still alive after a restart it stays running
+    and keeps its slot until it exits, otherwise it is marked failed.
+
+    Args:
+        db_path (str): SQLite database file. Defaults to ``config.jobs_db_path``.
+        log_dir (str): Directory for job logs. Defaults to ``config.job_log_dir``.
+        limits (dict): Maximum concurrent jobs per resource class.
+        poll_interval (float): Seconds between scheduler passes.
+    """
+
+    def __init__(self, db_path=None, log_dir=None, limits=None, poll_interval=0.5):
+        self.db_path = db_path or config.jobs_db_path
+        self.log_dir = log_dir or config.job_log_dir
+        self.limits = limits or {
+            "gpu": config.job_gpu_slots,
+            "cpu": config.job_cpu_slots,
+        }
+        self.poll_interval = poll_interval
+        os.makedirs(self.log_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._db_lock = Lock()
+        self._execute(_SCHEMA)
+
+        self._procs = {}
+        self._orphans = {}
+        self._cancelling = {}
+        self._step_times = {}  # job_id -> (last progress report, longest gap)
+        self._stop = Event()
+        self._thread = None
+        self._recover()
+        self.start()
+
+    def _execute(self, sql, params=()):
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _update(self, job_id, **fields):
+        columns = ", ".join(f"{k} = ?" for k in fields)
+        self._execute(
+            f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id)
+        )
+
+    def _recover(self):
+        rows = self._execute("SELECT * FROM jobs WHERE status = ?", (RUNNING,))
+        for row in rows:
+            if _pid_alive(row["pid"]):
+                # Started by a previous process; its output is lost, but it
+                # still holds its resource until it exits
+                self._orphans[row["id"]] = (row["pid"], row["resource"])
+                logger.warning(f"Job {row['id']} (pid {row['pid']}) is still running")
+            else:
+                self._update(
+                    row["id"],
+                    status=FAILED,
+                    error="interrupted by a restart",
+                    finished_at=time.time(),
+                )
+
+    # --- Public API ---
+
+    def start(self):
+        """Start the scheduler thread if it is not already running."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop scheduling. Running jobs are left to finish."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def submit(self, name, command, resource="gpu"):
+        """
+        Queue a command.
+
+        Args:
+            name (str): Display name of the job.
+            command (list): Program and arguments, as for ``subprocess.Popen``.
+            resource (str): Resource class used for concurrency limits.
+
+        Returns:
+            int: The job id.
+        """
+        with self._db_lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (name, command, resource, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (name, json.dumps(list(command)), resource, QUEUED, time.time()),
+            )
+            return cursor.lastrowid
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued or running job.
+
+        Running jobs get SIGTERM, then SIGKILL once their grace period is
+        over: ``config.job_cancel_grace`` seconds, or twice the longest gap
+        between the job's progress reports if that is longer, so a training
+        job can finish its current step and write a checkpoint. Returns False
+        if the job had already finished.
+        """
+        job = self.get(job_id)
+        if job is None or job["status"] not in (QUEUED, RUNNING):
+            return False
+        if job["status"] == QUEUED:
+            self._execute(
+                "UPDATE jobs SET status = ?, finished_at = ? "
+                "WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            )
+            if self.get(job_id)["status"] == CANCELLED:
+                return True
+
+        self._cancelling.setdefault(job_id, time.monotonic())
+        proc = self._procs.get(job_id)
+        if proc is not None:
+            _signal(proc.pid, signal.SIGTERM)
+        elif job_id in self._orphans:
+            _signal(self._orphans[job_id][0], signal.SIGTERM)
+        return True
+
+    def get(self, job_id):
+        """Return a job as a dict, or None."""
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    def list(self, limit=20):
+        """Return the most recent jobs, newest first."""
+        rows = self._execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [self._to_dict(row) for row in rows]
+
+    def tail(self, job_id, lines=50):
+        """Return the last ``lines`` lines of a job's log."""
+        job = self.get(job_id)
+        if job is None or not job["log_path"] or not os.path.exists(job["log_path"]):
+            return ""
+        with open(job["log_path"], encoding="utf-8", errors="replace") as f:
+            return "".join(f.readlines()[-lines:])
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job finishes and return it."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job["status"] not in (QUEUED, RUNNING):
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Job {job_id} still {job['status']}")
+            time.sleep(self.poll_interval / 2)
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job["command"] = json.loads(job["command"])
+        return job
+
+    # --- Scheduler ---
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self._reap()
+                self._schedule()
+            except Exception:
+                logger.exception("Job scheduler pass failed")
+            self._stop.wait(self.poll_interval)
+
+    def _reap(self):
+        for job_id, proc in list(self._procs.items()):
+            returncode = proc.poll()
+            if returncode is None:
+                if self._grace_expired(job_id):
+                    _signal(proc.pid, signal.SIGKILL)
+                continue
+
+            proc.pump.join()
+            if self._cancelling.pop(job_id, None) is not None:
+                status = CANCELLED
+            else:
+                status = SUCCEEDED if returncode == 0 else FAILED
+            self._update(
+                job_id, status=status, returncode=returncode, finished_at=time.time()
+            )
+            del self._procs[job_id]
+            self._step_times.pop(job_id, None)
+
+        for job_id, (pid, resource) in list(self._orphans.items()):
+            if _pid_alive(pid):
+                if self._grace_expired(job_id):
+                    _signal(pid, signal.SIGKILL)
+                continue
+            # Not our child, so its exit status is unknown
+            if self._cancelling.pop(job_id, None) is not None:
+                self._update(job_id, status=CANCELLED, finished_at=time.time())
+            else:
+                self._update(
+                    job_id,
+                    status=FAILED,
+                    error="exited after a restart; exit status unknown",
+                    finished_at=time.time(),
+                )
+            del self._orphans[job_id]
+
+    def _record_step(self, job_id):
+        now = time.monotonic()
+        last, longest = self._step_times.get(job_id, (None, 0.0))
+        if last is not None:
+            longest = max(longest, now - last)
+        self._step_times[job_id] = (now, longest)
+
+    def _grace(self, job_id):
+        # A step in flight when SIGTERM arrives, plus the checkpoint after it
+        _, longest = self._step_times.get(job_id, (None, 0.0))
+        return max(config.job_cancel_grace, 2 * longest)
+
+    def _grace_expired(self, job_id):
+        cancelled_at = self._cancelling.get(job_id)
+        return bool(cancelled_at) and (
+            time.monotonic() - cancelled_at > self._grace(job_id)
+        )
+
+    def _schedule(self):
+        running = {}
+        resources = [proc.resource for proc in self._procs.values()]
+        resources += [resource for _, resource in self._orphans.values()]
+        for resource in resources:
+            running[resource] = running.get(resource, 0) + 1
+
+        queued = self._execute(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY id", (QUEUED,)
+        )
+        for row in queued:
+            job = self._to_dict(row)
+            resource = job["resource"]
+            if running.get(resource, 0) >= self.limits.get(resource, 1):
+                continue
+            if self._launch(job):
+                running[resource] = running.get(resource, 0) + 1
+
+    def _claim(self, job_id):
+        # Conditional update, so a job cancelled meanwhile is not started
+        with self._db_lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? "
+                "WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), job_id, QUEUED),
+            )
+            return cursor.rowcount == 1
+
+    def _launch(self, job):
+        if not self._claim(job["id"]):
+            return False
+
+        log_path = os.path.join(self.log_dir, f"job-{job['id']}.log")
+        try:
+            proc = subprocess.Popen(
+                job["command"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+                text=True,
+                errors="replace",
+                env={**os.environ, "PYTHONUNBUFFERED": "1"},
+                start_new_session=os.name == "posix",
+            )
+        except OSError as e:
+            self._update(
+                job["id"], status=FAILED, error=str(e), finished_at=time.time()
+            )
+            return False
+
+        proc.resource = job["resource"]
+        proc.pump = Thread(target=self._pump, args=(job["id"], proc, log_path))
+        proc.pump.daemon = True
+        self._procs[job["id"]] = proc
+        self._update(job["id"], pid=proc.pid, log_path=log_path)
+        proc.pump.start()
+        if job["id"] in self._cancelling:
+            _signal(proc.pid, signal.SIGTERM)
+        return True
+
+    def _pump(self, job_id, proc, log_path):
+        handler = RotatingFileHandler(
+            log_path,
+            maxBytes=config.job_log_max_bytes,
+            backupCount=config.job_log_backups,
+            encoding="utf-8",
+        )
+        try:
+            for line in proc.stdout:
+                line = line.rstrip("\n")
+                handler.emit(logging.makeLogRecord({"msg": line}))
+                match = _PROGRESS_RE.search(line)
+                if match and int(match.group(2)):
+                    done, total = int(match.group(1)), int(match.group(2))
+                    self._update(job_id, progress=done / total)
+                    self._record_step(job_id)
+        finally:
+            handler.close()
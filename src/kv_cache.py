@@ -0,0 +1,140 @@
+from collections import OrderedDict
+from threading import Lock
+from .config import config
+
+
+def to_legacy_cache(past):
+    """Return a KV cache in the tuple-of-(key, value)-per-layer layout."""
+    return past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else past
+
+
+def cache_length(past):
+    """Return the number of tokens held in a KV cache."""
+    if hasattr(past, "get_seq_length"):
+        return past.get_seq_length()
+    return past[0][0].shape[2]
+
+
+def cache_nbytes(past):
+    """Return the memory footprint of a KV cache in bytes."""
+    return sum(
+        t.nelement() * t.element_size()
+        for layer in to_legacy_cache(past)
+        for t in layer
+    )
+
+
+def crop_cache(past, length):
+    """Truncate a KV cache to its first ``length`` tokens."""
+    if hasattr(past, "crop"):
+        past.crop(length)
+        return past
+    return tuple(tuple(t[:, :, :length] for t in layer) for layer in past)
+
+
+def common_prefix_length(a, b):
+    """Return the length of the common prefix of two token id lists."""
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class PrefixCacheStore:
+    """
+    Per-session KV caches keyed on the token prefix of the conversation.
+
+    Each session keeps the token ids it has already prefilled together with
+    their KV cache. On the next turn ``checkout`` returns the cache cropped to
+    the longest prefix shared with the new input, so only the new tokens need
+    a forward pass; if the history diverged (edited or regenerated messages)
+    the cache is cropped to the divergence point or dropped altogether.
+    Sessions are evicted least-recently-used first once the total size
+    exceeds ``max_bytes`` or the number of sessions exceeds ``max_sessions``.
+
+    Args:
+        max_bytes (int): Memory cap across all sessions.
+        max_sessions (int): Maximum number of cached sessions.
+    """
+
+    def __init__(
+        self,
+        max_bytes=config.kv_cache_max_mb * 1024 * 1024,
+        max_sessions=config.kv_cache_max_sessions,
+    ):
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def checkout(self, session_id, input_ids):
+        """
+        Take the session's cache out of the store for reuse with ``input_ids``.
+
+        The entry is removed while the caller generates with it, because
+        generation extends the cache in place; put it back with ``store``.
+
+        Returns:
+            tuple: ``(past_key_values, prefix_length)``, or ``(None, 0)`` when
+            nothing can be reused.
+        """
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is None:
+                self.misses += 1
+                return None, 0
+            token_ids, past, nbytes = entry
+            self._bytes -= nbytes
+
+        # At least one input token must be fed to the model to get logits
+        length = min(
+            common_prefix_length(token_ids, input_ids),
+            cache_length(past),
+            len(input_ids) - 1,
+        )
+        if length <= 0:
+            self.misses += 1
+            return None, 0
+
+        self.hits += 1
+        self.reused_tokens += length
+        return crop_cache(past, length), length
+
+    def store(self, session_id, token_ids, past):
+        """Save the cache covering ``token_ids`` for the session."""
+        nbytes = cache_nbytes(past)
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(session_id, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[session_id] = (list(token_ids), past, nbytes)
+            self._bytes += nbytes
+
+            while self._entries and (
+                self._bytes > self.max_bytes or len(self._entries) > self.max_sessions
+            ):
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def invalidate(self, session_id):
+        """Drop the cache of a session."""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry[2]
@@ -0,0 +1,185 @@
+import json
+import os
+import re
+import resource
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+import torch
+from transformers import TrainerCallback
+from .config import config
+from .utils import get_logger
+
+# Latest value of every metric, exported by the Prometheus endpoint
+_gauges = {}
+_gauges_lock = Lock()
+_server = None
+
+
+def memory_stats():
+    """Peak RSS of this process and peak CUDA allocation, in MB."""
+    # ru_maxrss is in kilobytes on Linux
+    stats = {"peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        stats["peak_cuda_mb"] = torch.cuda.max_memory_allocated() / 1024**2
+    return stats
+
+
+def _metric_name(*parts):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join(("rlhf",) + parts))
+
+
+class _PrometheusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        with _gauges_lock:
+            lines = []
+            for name, value in sorted(_gauges.items()):
+                lines.append(f"# TYPE {name} gauge\n{name} {value}\n")
+        body = "".join(lines).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_prometheus(port=config.metrics_port):
+    """Start the ``/metrics`` endpoint once per process (port 0 disables it)."""
+    global _server
+    if port and _server is None:
+        _server = ThreadingHTTPServer(("", port), _PrometheusHandler)
+        Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+class Metrics:
+    """
+    Lightweight per-step performance metrics.
+
+    Phases are timed with ``timer`` and other values recorded with ``add``;
+    ``log`` closes the step. It writes one JSON line with the accumulated
+    values and peak memory to ``<config.metrics_dir>/<name>.jsonl``, logs a
+    one-line summary through ``get_logger`` and updates the gauges served
+    by the optional Prometheus endpoint (``config.metrics_port``).
+
+    Args:
+        name (str): Metric namespace, e.g. ``"ppo"`` or ``"dpo"``.
+        path (str): JSONL output file. Defaults to the metrics directory.
+        log_every (int): Log a summary every N steps (0 never logs).
+    """
+
+    def __init__(self, name, path=None, log_every=10):
+        self.name = name
+        self.path = path or os.path.join(config.metrics_dir, f"{name}.jsonl")
+        self.log_every = log_every
+        self.logger = get_logger(f"metrics.{name}")
+        self._values = {}
+        self._file = None
+        self._lock = Lock()
+        serve_prometheus()
+
+    @contextmanager
+    def timer(self, phase):
+        """Add the wall-clock time of the block to ``<phase>_s``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if torch.cuda.is_available() and torch.cuda.is_initialized():
+                # Kernels run asynchronously; wait so the time lands here
+                torch.cuda.synchronize()
+            self.add(f"{phase}_s", time.perf_counter() - start)
+
+    def add(self, key, value):
+        """Accumulate ``value`` into ``key`` for the current step."""
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, key, default=0):
+        """Return the value accumulated for ``key`` in the current step."""
+        with self._lock:
+            return self._values.get(key, default)
+
+    def log(self, step, **values):
+        """Write the current step's record and start a new one."""
+        with self._lock:
+            record = {"step": step, "time": time.time(), **self._values, **values}
+            self._values = {}
+        record.update(memory_stats())
+
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+        with _gauges_lock:
+            for key, value in record.items():
+                if isinstance(value, (int, float)) and key != "time":
+                    _gauges[_metric_name(self.name, key)] = value
+
+        if self.log_every and step % self.log_every == 0:
+            summary = ", ".join(
+                f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}"
+                for k, v in record.items()
+                if k not in ("step", "time")
+            )
+            self.logger.info(f"step {step}: {summary}")
+        return record
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def timed(metrics, phase):
+    """``metrics.timer(phase)``, or a no-op when ``metrics`` is None."""
+    return metrics.timer(phase) if metrics is not None else nullcontext()
+
+
+class MetricsCallback(TrainerCallback):
+    """
+    Record ``Trainer`` step time, samples/s, tokens/s and dataloader wait.
+
+    The wait is the time between the end of one optimizer step and the
+    start of the next, which is spent fetching and collating batches.
+    Tokens come from ``state.num_input_tokens_seen``, so tokens/s is only
+    logged for trainers that count them.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._step_start = None
+        self._step_end = None
+        self._tokens_start = 0
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self._step_start = time.perf_counter()
+        self._tokens_start = state.num_input_tokens_seen
+        if self._step_end is not None:
+            self.metrics.add("dataloader_wait_s", self._step_start - self._step_end)
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self._step_end = time.perf_counter()
+        step_time = self._step_end - self._step_start
+        samples = (
+            args.per_device_train_batch_size
+            * args.gradient_accumulation_steps
+            * max(args.world_size, 1)
+        )
+        values = {"step_s": step_time, "samples_per_s": samples / step_time}
+        tokens = state.num_input_tokens_seen - self._tokens_start
+        if tokens > 0:
+            values["tokens_per_s"] = tokens / step_time
+        self.metrics.log(state.global_step, **values)
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.metrics.close()
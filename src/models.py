@@ -1,49 +1,97 @@
-import torch
-from transformers import (
-    AutoTokenizer,
-    AutoModelForCausalLM,
-    AutoModelForSequenceClassification,
-)
-from trl import AutoModelForCausalLMWithValueHead
-from peft import prepare_model_for_kbit_training
+import importlib.util
+from transformers import AutoModelForSequenceClassification
 from .config import config
+from .registry import registry
+from .runtime import get_profile
+from .utils import get_logger
+
+logger = get_logger(__name__)
 
 
 def load_tokenizer(model_name=config.model_name):
     """Load and configure the tokenizer."""
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    tokenizer.pad_token = tokenizer.eos_token
-    return tokenizer
+    return registry.tokenizer(model_name)
 
 
 def load_base_model(model_name=config.model_name):
     """Load the base model for annotation/generation."""
-    model = AutoModelForCausalLM.from_pretrained(
-        model_name, torch_dtype=torch.float16, device_map="auto"
-    )
-    return model
+    profile = get_profile()
+    return registry.causal_lm(model_name, profile.dtype, profile.device_map)
+
+
+def load_reward_model(model_name=config.rm_model_name, device=None):
+    """Load the reward model for evaluation (on GPU when one is available)."""
+    profile = get_profile()
+    if device is None:
+        device = profile.device
+    # Scoring is inference-only, so on CPU the int8 model is good enough
+    quantize = profile.quantize_inference and str(device) == "cpu"
+    tokenizer = registry.tokenizer(model_name, pad_with_eos=False)
+    model = registry.sequence_classifier(model_name, device, quantize=quantize)
+    return model, tokenizer
 
 
-def load_reward_model(model_name="distilbert-base-uncased", device="cuda"):
-    """Load the reward model for evaluation."""
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
+def load_rm_model(model_name=config.rm_model_name):
+    """Load the reward model to train, in fp32 on the profile's device."""
+    profile = get_profile()
+    tokenizer = registry.tokenizer(model_name, pad_with_eos=False)
+    if tokenizer.pad_token is None:
+        # Decoder-only backbones (e.g. GPT-2) have no pad token of their own
+        tokenizer = registry.tokenizer(model_name)
+    # Not shared through the registry: the weights are trained in place, and
+    # the fresh score head must be initialized, which low_cpu_mem_usage skips
     model = AutoModelForSequenceClassification.from_pretrained(
         model_name, num_labels=1
-    ).to(device)
+    ).to(profile.device)
+    # The classifier pools the last non-pad token of decoder-only models
+    model.config.pad_token_id = tokenizer.pad_token_id
     return model, tokenizer
 
 
+def _lora_settings():
+    if not config.use_lora:
+        return None
+    return (config.lora_r, config.lora_alpha, config.lora_dropout)
+
+
+def _quantization():
+    """Return ``"nf4"`` when 4-bit loading is enabled and supported here."""
+    if not (config.use_lora and config.use_4bit):
+        return None
+    if (
+        get_profile().device != "cuda"
+        or importlib.util.find_spec("bitsandbytes") is None
+    ):
+        logger.info("4-bit loading needs CUDA and bitsandbytes; using full weights")
+        return None
+    return "nf4"
+
+
 def load_dpo_model(model_name=config.model_name):
-    """Load the model for DPO training."""
-    model = AutoModelForCausalLM.from_pretrained(
-        model_name, torch_dtype=torch.float16, device_map="auto"
+    """
+    Load the model for DPO training.
+
+    With ``config.use_lora`` this is a PEFT model whose frozen base (4-bit
+    when ``config.use_4bit`` and the hardware allow it) also serves as the
+    DPO reference model.
+    """
+    profile = get_profile()
+    lora = _lora_settings()
+    if lora is None:
+        return registry.causal_lm(model_name, profile.train_dtype, profile.device_map)
+    return registry.adapter_model(
+        model_name, profile.dtype, profile.device_map, _quantization(), lora
     )
-    return model
 
 
-def load_ppo_model(model_name=config.model_name, device="cuda"):
+def load_ppo_model(model_name=config.model_name, device=None):
     """Load the model with value head for PPO training."""
-    model = AutoModelForCausalLMWithValueHead.from_pretrained(
-        model_name, torch_dtype=torch.float16, device_map=device
+    profile = get_profile()
+    device_map = device or profile.device_map
+    lora = _lora_settings()
+    if lora is None:
+        # Shares the transformer weights with load_dpo_model on the same device
+        return registry.value_head(model_name, profile.train_dtype, device_map)
+    return registry.value_head(
+        model_name, profile.dtype, device_map, _quantization(), lora
     )
-    return model
@@ -0,0 +1,360 @@
+import os
+import signal
+import socket
+import threading
+import time
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
+from trl import PPOTrainer
+from .config import config
+from .models import load_ppo_model, load_tokenizer
+from .utils import describe_footprint, get_device, get_logger, set_seed
+from .reward import RewardScorer
+from .rollout import RolloutEngine
+from .prompts import PromptPool, shard_prompts
+from .jobs import report_progress
+from .metrics import Metrics
+from .checkpoint import CheckpointManager, rng_state, set_rng_state
+from .trainer_ppo import (
+    load_ppo_reward_model,
+    load_training_prompts,
+    make_ppo_config,
+    ppo_checkpoint_state,
+    restore_ppo_state,
+    restore_prompt_pool,
+)
+
+logger = get_logger(__name__)
+
+LEARNER_RANK = 0
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def chunk_sizes(batch_size, num_workers):
+    """Split a PPO batch as evenly as possible across the rollout workers."""
+    if not 0 < num_workers <= batch_size:
+        raise ValueError(
+            f"Need between 1 and batch_size={batch_size} rollout workers, "
+            f"got {num_workers}"
+        )
+    base, extra = divmod(batch_size, num_workers)
+    return [base + (i < extra) for i in range(num_workers)]
+
+
+def pack_experience(queries, responses, rewards, state=None, **stats):
+    """
+    Pack one rollout into a few flat tensors for the experience queue.
+
+    Sending one tensor per sequence would cost a shared-memory segment (and
+    a file descriptor) each; flat tensors plus lengths keep it to a handful.
+    ``state`` is the worker's sampler state after the rollout, for the
+    learner's checkpoints.
+    """
+    return {
+        "queries": torch.cat([q.cpu() for q in queries]),
+        "query_lengths": [len(q) for q in queries],
+        "responses": torch.cat([r.cpu() for r in responses]),
+        "response_lengths": [len(r) for r in responses],
+        "rewards": torch.stack([r.cpu() for r in rewards]),
+        "state": state,
+        "stats": stats,
+    }
+
+
+def unpack_experience(packed, device="cpu"):
+    """Inverse of ``pack_experience``: per-sequence queries, responses, rewards."""
+    queries = packed["queries"].to(device).split(packed["query_lengths"])
+    responses = packed["responses"].to(device).split(packed["response_lengths"])
+    rewards = packed["rewards"].to(device).unbind()
+    return list(queries), list(responses), list(rewards)
+
+
+def broadcast_weights(model, src=LEARNER_RANK):
+    """
+    Broadcast the trainable parameters of ``model`` from rank ``src``.
+
+    Only trainable parameters change during PPO (the LoRA adapters and
+    value head when LoRA is on), so frozen base weights are never sent.
+    Parameters are flattened into one buffer per dtype and sent through
+    CPU memory, which is what gloo handles.
+    """
+    params = [p for p in model.parameters() if p.requires_grad]
+    for dtype in sorted({p.dtype for p in params}, key=str):
+        group = [p for p in params if p.dtype == dtype]
+        flat = _flatten_dense_tensors([p.detach().cpu() for p in group])
+        dist.broadcast(flat, src=src)
+        if dist.get_rank() != src:
+            with torch.no_grad():
+                for p, value in zip(group, _unflatten_dense_tensors(flat, group)):
+                    p.copy_(value)
+
+
+def is_sync_step(update, sync_every, total):
+    """Whether weights are broadcast after PPO update ``update`` (0-based)."""
+    return (update + 1) % sync_every == 0 and update + 1 < total
+
+
+def is_state_step(update, sync_every, total, checkpoint_every):
+    """
+    Whether workers send their sampler state with update ``update``.
+
+    The learner checkpoints after periodic checkpoint steps and, when
+    preempted, stops after the next weight broadcast.
+    """
+    periodic = bool(checkpoint_every and (update + 1) % checkpoint_every == 0)
+    return periodic or is_sync_step(update, sync_every, total)
+
+
+def _learner(queues, num_steps, sync_every, stop):
+    model = load_ppo_model(config.model_name)
+    tokenizer = load_tokenizer(config.model_name)
+    ppo_config = make_ppo_config()
+    ppo_trainer = PPOTrainer(config=ppo_config, model=model, tokenizer=tokenizer)
+    device = get_device(model)
+    metrics = Metrics("ppo")
+
+    # Same directory as in-process PPO; either mode resumes the other's
+    # weights and optimizer state. Settings are passed explicitly: defaults
+    # were bound before this process applied the parent's config
+    checkpoints = CheckpointManager(
+        os.path.join(config.checkpoint_dir, "ppo"),
+        every=config.checkpoint_every,
+        keep_last=config.checkpoint_keep_last,
+        keep_every=config.checkpoint_keep_every,
+        resume=config.checkpoint_resume,
+    )
+    checkpoints.install_signal_handler()
+    resume_from = checkpoints.resume_path()
+    rewards, start, worker_states = [], 0, []
+    if resume_from:
+        state = checkpoints.load(resume_from)
+        start, rewards = restore_ppo_state(state, model, ppo_trainer)
+        worker_states = state.get("workers", [])
+        if len(worker_states) != len(queues):
+            worker_states = [None] * len(queues)
+        print(f"Resuming PPO from {resume_from} (step {start})")
+
+    print(f"Starting distributed PPO with {len(queues)} rollout workers...")
+    print(describe_footprint(model))
+    # Workers continue from the same step with their own sampler state, and
+    # from the learner's weights (freshly initialised LoRA and value head
+    # weights differ between processes)
+    dist.broadcast_object_list([start, worker_states], src=LEARNER_RANK)
+    broadcast_weights(model)
+
+    for step in range(start, num_steps):
+        with metrics.timer("rollout_wait"):
+            chunks = [q.get() for q in queues]
+        queries, responses, batch_rewards = [], [], []
+        for chunk in chunks:
+            q, r, s = unpack_experience(chunk, device)
+            queries += q
+            responses += r
+            batch_rewards += s
+
+        with metrics.timer("optimizer"):
+            ppo_trainer.step(queries, responses, batch_rewards)
+        rewards.extend(r.item() for r in batch_rewards)
+
+        # Workers only stop after a weight broadcast, where none of them can
+        # be ahead of the learner; the flag is set before it, so they see it
+        stopping = checkpoints.preempted and is_sync_step(step, sync_every, num_steps)
+        if stopping:
+            stop.set()
+        if is_sync_step(step, sync_every, num_steps):
+            with metrics.timer("weight_sync"):
+                broadcast_weights(model)
+
+        if stopping or (checkpoints.every and (step + 1) % checkpoints.every == 0):
+            with metrics.timer("checkpoint"):
+                state = ppo_checkpoint_state(
+                    step + 1, model, ppo_trainer, None, rewards
+                )
+                state["workers"] = [c["state"] for c in chunks]
+                checkpoints.save(step + 1, state)
+
+        mean_reward = float(np.mean([r.item() for r in batch_rewards]))
+        # Workers generate in parallel, so the slowest one bounds the rollout
+        rollout_s = max(c["stats"]["rollout_s"] for c in chunks)
+        tokens = sum(c["stats"]["generated_tokens"] for c in chunks)
+        report_progress(step + 1, num_steps)
+        metrics.log(
+            step,
+            reward_mean=mean_reward,
+            rollout_s=rollout_s,
+            tokens_per_s=tokens / max(rollout_s, 1e-9),
+        )
+        if step % 10 == 0:
+            print(f"Step {step}: Reward = {mean_reward:.4f}")
+
+        if stopping:
+            checkpoints.close()
+            metrics.close()
+            print(f"PPO Training interrupted, resume from step {step + 1}")
+            return
+
+    checkpoints.finish()
+    metrics.close()
+    print("PPO Training finished!")
+    print(describe_footprint(model))
+    ppo_trainer.save_pretrained(f"{config.output_dir}/ppo_model")
+
+
+def _worker(queue, batch_size, num_steps, sync_every, stop):
+    # The learner alone handles SIGTERM and tells the workers when to stop
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    model = load_ppo_model(config.model_name)
+    tokenizer = load_tokenizer(config.model_name)
+    reward_model, rm_tokenizer = load_ppo_reward_model()
+    # Each worker only tokenizes and samples its own shard of the prompts
+    prompt_pool = PromptPool(
+        shard_prompts(
+            load_training_prompts(tokenizer),
+            dist.get_rank() - 1,
+            dist.get_world_size() - 1,
+        ),
+        tokenizer,
+        seed=42 + dist.get_rank(),
+    )
+    engine = RolloutEngine(
+        model,
+        tokenizer,
+        RewardScorer(reward_model, rm_tokenizer),
+        prompt_pool,
+        batch_size=batch_size,
+    )
+
+    resume = [None, None]
+    dist.broadcast_object_list(resume, src=LEARNER_RANK)
+    start, worker_states = resume
+    if start > 0:
+        state = worker_states[dist.get_rank() - 1]
+        restore_prompt_pool(prompt_pool, state and state["prompt_pool"])
+        if state is not None:
+            set_rng_state(state["rng"])
+    broadcast_weights(model)
+
+    for step in range(start, num_steps):
+        begin = time.perf_counter()
+        batch = engine.rollout()
+        state = None
+        if is_state_step(step, sync_every, num_steps, config.checkpoint_every):
+            state = {"prompt_pool": prompt_pool.state_dict(), "rng": rng_state()}
+        queue.put(
+            pack_experience(
+                batch.queries,
+                batch.responses,
+                batch.rewards,
+                state=state,
+                rollout_s=time.perf_counter() - begin,
+                generated_tokens=sum(len(r) for r in batch.responses),
+            )
+        )
+        if is_sync_step(step, sync_every, num_steps):
+            broadcast_weights(model)
+            if stop.is_set():
+                break
+
+
+def _run(
+    rank,
+    settings,
+    world_size,
+    port,
+    queues,
+    sizes,
+    num_steps,
+    sync_every,
+    threads,
+    stop,
+):
+    # Spawned processes re-import the config module; apply the parent's values
+    vars(config).update(settings)
+    # Every process would otherwise claim all cores and they would contend
+    torch.set_num_threads(threads)
+    dist.init_process_group(
+        "gloo",
+        init_method=f"tcp://127.0.0.1:{port}",
+        rank=rank,
+        world_size=world_size,
+    )
+    try:
+        set_seed(42 + rank)
+        if rank == LEARNER_RANK:
+            _learner(queues, num_steps, sync_every, stop)
+        else:
+            index = rank - 1
+            _worker(queues[index], sizes[index], num_steps, sync_every, stop)
+        dist.barrier()
+    finally:
+        dist.destroy_process_group()
+
+
+def train_ppo_distributed(
+    num_workers=config.ppo_num_workers,
+    sync_every=config.ppo_sync_every,
+    num_steps=config.ppo_steps,
+):
+    """
+    Run PPO with parallel rollout workers and a single learner process.
+
+    Rank 0 is the learner: it owns the ``PPOTrainer`` and runs
+    ``ppo_trainer.step``. Ranks 1..``num_workers`` each hold a copy of the
+    policy and the reward model, sample from their own shard of the prompts,
+    generate and score their share of every PPO batch and ship the
+    experience to the learner through a shared-memory queue. Every
+    ``sync_every`` updates the learner broadcasts its trainable weights to
+    the workers over a gloo process group, so rollouts are at most
+    ``sync_every - 1`` updates stale.
+
+    The learner writes the same checkpoints as in-process PPO, plus every
+    worker's prompt-pool and RNG state. On SIGTERM it stops the workers
+    after the next weight broadcast, writes a last checkpoint and exits;
+    the next run resumes from it.
+
+    Everything runs on one node and works with CPU-only processes.
+    """
+    sizes = chunk_sizes(config.batch_size, num_workers)
+    world_size = num_workers + 1
+    threads = config.num_threads or max(1, (os.cpu_count() or 1) // world_size)
+    ctx = mp.get_context("spawn")
+    # Bounded so a fast worker cannot run more than a sync interval ahead
+    queues = [ctx.Queue(maxsize=sync_every) for _ in range(num_workers)]
+    stop = ctx.Event()
+    logger.info(
+        f"Distributed PPO: {num_workers} workers ({sizes} samples each), "
+        f"weight sync every {sync_every} updates, {threads} threads per process"
+    )
+    # A cancelled job signals the whole process group; wait for the learner
+    # to checkpoint instead of exiting and orphaning it
+    previous = None
+    if threading.current_thread() is threading.main_thread():
+        previous = signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    try:
+        mp.spawn(
+            _run,
+            args=(
+                vars(config),
+                world_size,
+                _free_port(),
+                queues,
+                sizes,
+                num_steps,
+                sync_every,
+                threads,
+                stop,
+            ),
+            nprocs=world_size,
+            join=True,
+        )
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGTERM, previous)
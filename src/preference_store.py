@@ -0,0 +1,228 @@
+import json
+import os
+from threading import Lock, Thread
+from .config import config
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def legacy_path(path):
+    """Return the pre-JSONL ``.json`` path that corresponds to ``path``."""
+    root, ext = os.path.splitext(path)
+    return root + ".json" if ext == ".jsonl" else None
+
+
+def resolve_preference_path(file_path):
+    """
+    Return the file actually holding the preferences at ``file_path``: the
+    legacy ``.json`` sibling when only that one exists.
+    """
+    legacy = legacy_path(file_path)
+    if not os.path.exists(file_path) and legacy and os.path.exists(legacy):
+        return legacy
+    return file_path
+
+
+def iter_preferences(file_path):
+    """
+    Stream preference records from a JSONL file, one dict at a time.
+
+    Blank lines and a truncated final line (left behind by a crash mid-write)
+    are skipped. Legacy ``.json`` array files are still readable, and a
+    missing ``.jsonl`` file falls back to its legacy ``.json`` sibling.
+    """
+    file_path = resolve_preference_path(file_path)
+    if file_path.endswith(".json"):
+        with open(file_path, "r") as f:
+            yield from json.load(f)
+        return
+
+    with open(file_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def _is_record(line):
+    try:
+        return isinstance(json.loads(line), dict)
+    except ValueError:
+        return False
+
+
+class PreferenceStore:
+    """
+    Append-only JSONL store for preference records.
+
+    Each vote is a single line appended to the file, so saving is O(1) and a
+    crash loses at most the votes since the last fsync. An existing legacy
+    ``preferences.json`` is converted the first time the store is opened.
+
+    Repeated records are kept: the same pair can legitimately be voted on
+    more than once. Compaction only drops blank and partially written lines,
+    and runs on a background thread so appends are not held up by it.
+
+    Args:
+        path (str): Path of the JSONL file.
+        fsync_every (int): Number of appends between fsync calls.
+        compact_every (int): Number of appends between background compactions,
+            or 0 to only compact when ``compact`` is called explicitly.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        fsync_every=config.preference_fsync_every,
+        compact_every=config.preference_compact_every,
+    ):
+        self.path = path or config.preference_path
+        self.fsync_every = max(1, fsync_every)
+        self.compact_every = compact_every
+        self._file = None
+        self._unsynced = 0
+        self._appended = 0
+        self._lock = Lock()
+        self._compact_lock = Lock()
+        self._compactor = None
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._migrate()
+            self._file = open(self.path, "a")
+            self._terminate_partial_line()
+        return self._file
+
+    def _terminate_partial_line(self):
+        # A crash mid-write can leave a torn last line; start a fresh line so
+        # the next record is not glued onto it. The newline goes to disk at
+        # once so the file size seen by compaction already includes it.
+        if self._file.tell() == 0:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                self._file.write("\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def _migrate(self):
+        legacy = legacy_path(self.path)
+        if os.path.exists(self.path) or not legacy or not os.path.exists(legacy):
+            return
+        count = self._rewrite(iter_preferences(legacy))
+        print(f"Migrated {count} preferences from {legacy} to {self.path}")
+
+    def _rewrite(self, records):
+        # Write to a temporary file and swap it in so a crash never leaves a
+        # half-written store behind
+        tmp_path = self.path + ".tmp"
+        count = 0
+        with open(tmp_path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        return count
+
+    def append(self, record):
+        """Append one preference record."""
+        self.extend([record])
+
+    def extend(self, records):
+        """Append several preference records with a single write."""
+        if not records:
+            return
+        with self._lock:
+            f = self._open()
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            before = self._appended
+            self._unsynced += len(records)
+            self._appended += len(records)
+            if self._unsynced >= self.fsync_every:
+                self._sync()
+            if (
+                self.compact_every
+                and self._appended // self.compact_every > before // self.compact_every
+                and not (self._compactor and self._compactor.is_alive())
+            ):
+                self._compactor = Thread(target=self._compact_in_background)
+                self._compactor.daemon = True
+                self._compactor.start()
+
+    def _sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def sync(self):
+        """Force buffered appends to disk."""
+        with self._lock:
+            self._sync()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception:
+            logger.exception(f"Compacting {self.path} failed")
+
+    def compact(self):
+        """
+        Rewrite the file without blank or partially written lines.
+
+        Valid lines are copied verbatim, so an unchanged prefix keeps its
+        bytes (and ``TokenizedPreferenceCache`` its tokenized rows). Appends
+        continue while the file is copied and only wait while the lines they
+        added meanwhile are carried over and the copy is swapped in.
+        """
+        with self._compact_lock:
+            with self._lock:
+                # Opening repairs a torn last line, which must come first
+                self._open()
+                end = os.path.getsize(self.path)
+
+            tmp_path = self.path + ".tmp"
+            with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+                consumed = 0
+                for line in src:
+                    consumed += len(line)
+                    if consumed > end:
+                        break
+                    if _is_record(line):
+                        dst.write(line)
+
+                with self._lock:
+                    # Carry over what was appended while copying
+                    src.seek(end)
+                    for line in src:
+                        if _is_record(line):
+                            dst.write(line if line.endswith(b"\n") else line + b"\n")
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                    if self._file is not None:
+                        self._file.close()
+                        self._file = None
+                    self._unsynced = 0
+                    os.replace(tmp_path, self.path)
+
+    def __iter__(self):
+        self.sync()
+        return iter_preferences(self.path)
+
+    def close(self):
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,253 @@
+import queue
+import time
+from collections import deque
+from collections.abc import Sequence
+from threading import Condition, Event, Lock, Thread
+from .config import config
+
+_SKIPPED = object()
+
+
+class _Claim:
+    """A streaming consumer waiting for the item of prompt ``index``."""
+
+    def __init__(self, index):
+        self.index = index
+        self.item = None
+
+
+class AnnotationPrefetcher:
+    """
+    Generate annotation items on a background thread, ahead of the annotator.
+
+    A worker thread walks the prompt list in batches, generates two candidate
+    responses per prompt and keeps ``(prompt, response_a, response_b)`` items
+    in a bounded buffer. The buffer depth provides backpressure: the worker
+    blocks once it is ``depth`` items ahead of the consumers.
+
+    While a batch is being generated, the partial responses of each of its
+    prompts are exposed so a UI can render tokens as they arrive (see
+    ``stream``). A streaming consumer that has to wait claims the next
+    prompt nobody else is waiting for, and receives that prompt's item, so
+    the text it renders is always its own.
+
+    Args:
+        prompts (Sequence): Prompts to annotate, in order (e.g. a
+            ``PromptCorpus``, which is read lazily).
+        generate_fn (callable): Maps a list of prompts to one pair of
+            responses per prompt, or None to skip the prompt. Called with an
+            ``on_text`` keyword that receives the partial text of every
+            sequence during generation.
+        depth (int): Maximum number of ready items kept in the buffer.
+        batch_size (int): Number of prompts generated together per call.
+    """
+
+    def __init__(
+        self,
+        prompts,
+        generate_fn,
+        depth=config.prefetch_depth,
+        batch_size=config.prefetch_batch_size,
+    ):
+        self.prompts = prompts if isinstance(prompts, Sequence) else list(prompts)
+        self.generate_fn = generate_fn
+        self.depth = max(1, depth)
+        self.batch_size = max(1, batch_size)
+        self.hits = 0
+        self.misses = 0
+
+        # Several sessions take items concurrently
+        self._lock = Lock()
+        self._changed = Condition(self._lock)
+        self._ready = deque()  # Items nobody claimed, in prompt order
+        self._claims = {}  # prompt index -> _Claim
+        self._partials = {}  # prompt index -> partial item
+        self._next = 0  # First prompt index without an item yet
+        self._done = False
+        self._error = None
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background worker if it is not already running."""
+        if self._thread is None:
+            self._thread = Thread(target=self._worker, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Ask the worker to exit once its current batch finishes."""
+        self._stop.set()
+
+    def _deliver(self, index, item):
+        with self._changed:
+            self._partials.pop(index, None)
+            self._next = index + 1
+            claim = self._claims.pop(index, None)
+            if claim is not None:
+                # A skipped prompt sends its claimant on to the next one
+                claim.item = item
+                self._changed.notify_all()
+                return True
+            if item is _SKIPPED:
+                return True
+            # Block while the buffer is full, but keep checking for stop requests
+            while len(self._ready) >= self.depth:
+                if self._stop.is_set():
+                    return False
+                self._changed.wait(0.1)
+            self._ready.append(item)
+            self._changed.notify_all()
+            return True
+
+    def _worker(self):
+        try:
+            for start in range(0, len(self.prompts), self.batch_size):
+                if self._stop.is_set():
+                    return
+                batch = self.prompts[start : start + self.batch_size]
+                responses = self.generate_fn(
+                    batch,
+                    on_text=lambda texts, s=start, b=batch: self._set_partial(
+                        s, b, texts
+                    ),
+                )
+                for offset, (prompt, pair) in enumerate(zip(batch, responses)):
+                    item = _SKIPPED if pair is None else (prompt,) + tuple(pair)
+                    if not self._deliver(start + offset, item):
+                        return
+        except Exception as e:
+            with self._changed:
+                self._error = e
+        finally:
+            with self._changed:
+                self._done = True
+                self._changed.notify_all()
+
+    def _set_partial(self, start, batch, texts):
+        # Show the first two candidates of every prompt
+        per_prompt = len(texts) // len(batch)
+        shown = min(per_prompt, 2)
+        with self._lock:
+            for offset, prompt in enumerate(batch):
+                first = offset * per_prompt
+                self._partials[start + offset] = (prompt,) + tuple(
+                    texts[first : first + shown]
+                )
+
+    # The helpers below are called with the lock held
+
+    def _take(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        item = self._ready.popleft()
+        self._changed.notify_all()
+        return item
+
+    def _end(self):
+        # The worker's error is raised once, after which consumers get None
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+        return None
+
+    def _claim(self):
+        index = self._next
+        while index in self._claims:
+            index += 1
+        if index >= len(self.prompts):
+            return None
+        claim = self._claims[index] = _Claim(index)
+        return claim
+
+    def _release(self, claim):
+        if self._claims.get(claim.index) is claim:
+            del self._claims[claim.index]
+        elif claim.item not in (None, _SKIPPED):
+            # Delivered after the consumer went away; the next one gets it
+            self._ready.appendleft(claim.item)
+            self._changed.notify_all()
+
+    def get(self, timeout=None):
+        """
+        Return the next ``(prompt, response_a, response_b)`` item.
+
+        Returns None once every prompt has been handed out. Counts a hit when
+        an item was already waiting and a miss when the caller had to block
+        on generation.
+
+        Raises:
+            queue.Empty: No item became ready within ``timeout`` seconds.
+        """
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            hit = True
+            while not self._ready:
+                if self._done:
+                    return self._end()
+                hit = False
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                self._changed.wait(remaining)
+            return self._take(hit)
+
+    def stream(self, interval=0.05):
+        """
+        Yield the next item, preceded by partial versions while it generates.
+
+        On a hit the complete item is yielded straight away. On a miss, the
+        caller claims a prompt that is yet to be generated, and its partially
+        generated responses are yielded every ``interval`` seconds until that
+        prompt's item is complete. The last value yielded is the complete
+        item, or None when all prompts are done.
+        """
+        self.start()
+        with self._changed:
+            if self._ready:
+                item, claim = self._take(hit=True), None
+            elif self._done:
+                item, claim = self._end(), None
+            else:
+                item, claim = None, self._claim()
+
+        last = None
+        try:
+            while claim is not None:
+                with self._changed:
+                    if claim.item is None and not self._done:
+                        self._changed.wait(interval)
+                    if claim.item is _SKIPPED:
+                        claim = self._claim()
+                        continue
+                    if claim.item is not None:
+                        item, claim = claim.item, None
+                        self.misses += 1
+                        break
+                    if self._done:
+                        self._release(claim)
+                        claim = None
+                        item = self._end()
+                        break
+                    partial = self._partials.get(claim.index)
+                if partial is not None and partial != last:
+                    last = partial
+                    yield partial
+        finally:
+            if claim is not None:
+                with self._changed:
+                    self._release(claim)
+        yield item
+
+    def stats(self):
+        """Return hit/miss counters and the number of ready items."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "queued": len(self._ready),
+            }
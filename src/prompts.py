@@ -0,0 +1,217 @@
+import hashlib
+import json
+from itertools import chain
+import numpy as np
+from .config import config
+from .corpus import PromptCorpus
+
+
+def shard_prompts(prompts, index, num_shards):
+    """
+    The ``index``-th of ``num_shards`` disjoint shards of the unique prompts,
+    e.g. one per rollout worker. With fewer prompts than shards, every shard
+    gets all of them.
+    """
+    if not isinstance(prompts, PromptCorpus):
+        # Corpora are deduplicated when they are built
+        prompts = list(dict.fromkeys(prompts))
+    if len(prompts) < num_shards:
+        return prompts
+    if isinstance(prompts, PromptCorpus):
+        return prompts.shard(index, num_shards)
+    return prompts[index::num_shards]
+
+
+class PromptPool:
+    """
+    Deduplicated, pre-tokenized prompt pool for PPO rollouts.
+
+    Prompts are deduplicated by content hash and tokenized once, in one
+    batched call, into a flat token array with per-prompt offsets. A
+    ``PromptCorpus`` is already deduplicated and tokenized; its memory-mapped
+    token file is used directly, so large pools start without encoding. Batches
+    of indices are drawn with vectorized numpy calls:
+
+    - Without replacement, the pool is walked in epochs: each epoch is a
+      fresh permutation and a batch may run over into the next epoch.
+    - With replacement, every batch is an independent draw.
+
+    With ``weighting="reward_variance"`` prompts are drawn in proportion to
+    the variance of the rewards their responses received so far (a simple
+    curriculum: prompts the policy is still inconsistent on come up more
+    often). Prompts seen fewer than twice get the largest observed variance
+    so they are explored first. In epoch mode the weights shape the order
+    of each epoch's permutation.
+
+    The sampling position, reward statistics and random state are captured
+    by ``state_dict`` so a resumed run continues the same sequence.
+
+    Args:
+        prompts (list | PromptCorpus): Prompt texts, duplicates allowed.
+        tokenizer: Tokenizer used to pre-encode a list of prompts.
+        replacement (bool): Sample with replacement instead of in epochs.
+        weighting (str): ``"uniform"`` or ``"reward_variance"``.
+        min_weight (float): Weight floor so no prompt is starved.
+        seed (int): Seed of the pool's random generator.
+    """
+
+    def __init__(
+        self,
+        prompts,
+        tokenizer,
+        replacement=config.ppo_prompt_replacement,
+        weighting=config.ppo_prompt_weighting,
+        min_weight=1e-3,
+        seed=42,
+    ):
+        if weighting not in ("uniform", "reward_variance"):
+            raise ValueError(f"Unknown prompt weighting {weighting!r}")
+        if isinstance(prompts, PromptCorpus):
+            self._from_corpus(prompts)
+        else:
+            self._encode(prompts, tokenizer)
+        if len(self.prompts) == 0:
+            raise ValueError("The prompt pool is empty")
+        self.replacement = replacement
+        self.weighting = weighting
+        self.min_weight = min_weight
+
+        n = len(self.prompts)
+        self.counts = np.zeros(n, dtype=np.int64)
+        self.reward_sum = np.zeros(n)
+        self.reward_sq_sum = np.zeros(n)
+        self.rng = np.random.default_rng(seed)
+        self.epoch = 0
+        self._order = self._permutation()
+        self._cursor = 0
+
+    def _encode(self, prompts, tokenizer):
+        unique = {}
+        for prompt in prompts:
+            unique.setdefault(hashlib.sha1(prompt.encode("utf-8")).digest(), prompt)
+        self.prompts = list(unique.values())
+        self.fingerprint = hashlib.sha256(b"".join(unique)).hexdigest()[:16]
+
+        encoded = tokenizer(self.prompts)["input_ids"] if unique else []
+        self.lengths = np.fromiter((len(ids) for ids in encoded), dtype=np.int64)
+        self.starts = np.concatenate([[0], np.cumsum(self.lengths)[:-1]])
+        # The trailing sentinel keeps gathers for empty prompts in bounds
+        self.token_ids = np.fromiter(
+            chain(chain.from_iterable(encoded), [0]),
+            dtype=np.int64,
+            count=int(self.lengths.sum()) + 1,
+        )
+
+    def _from_corpus(self, corpus):
+        self.prompts = corpus
+        self.fingerprint = corpus.fingerprint
+        self.starts, ends = corpus.token_spans()
+        self.lengths = ends - self.starts
+        self.token_ids = corpus.tokens
+
+    def __len__(self):
+        return len(self.prompts)
+
+    def weights(self):
+        """Sampling probabilities, or None for uniform sampling."""
+        if self.weighting == "uniform":
+            return None
+        seen = self.counts >= 2
+        counts = np.maximum(self.counts, 1)
+        mean = self.reward_sum / counts
+        variance = np.maximum(self.reward_sq_sum / counts - mean**2, 0.0)
+        explore = variance[seen].max() if seen.any() else 1.0
+        weights = np.where(seen, variance, explore) + self.min_weight
+        return weights / weights.sum()
+
+    def _permutation(self):
+        return self.rng.choice(
+            len(self), size=len(self), replace=False, p=self.weights()
+        )
+
+    def sample(self, batch_size):
+        """Return the indices of the next ``batch_size`` prompts."""
+        if self.replacement:
+            return self.rng.choice(len(self), size=batch_size, p=self.weights())
+
+        parts = []
+        needed = batch_size
+        while needed:
+            if self._cursor == len(self):
+                self.epoch += 1
+                self._order = self._permutation()
+                self._cursor = 0
+            take = min(needed, len(self) - self._cursor)
+            parts.append(self._order[self._cursor : self._cursor + take])
+            self._cursor += take
+            needed -= take
+        return np.concatenate(parts)
+
+    def update(self, indices, rewards):
+        """Record the rewards the responses to ``indices`` received."""
+        indices = np.asarray(indices)
+        rewards = np.asarray(rewards, dtype=np.float64)
+        np.add.at(self.counts, indices, 1)
+        np.add.at(self.reward_sum, indices, rewards)
+        np.add.at(self.reward_sq_sum, indices, rewards**2)
+
+    def texts(self, indices):
+        return [self.prompts[i] for i in indices]
+
+    def token_ids_of(self, indices):
+        """Unpadded token ids of every prompt in ``indices``."""
+        return [
+            np.asarray(
+                self.token_ids[self.starts[i] : self.starts[i] + self.lengths[i]]
+            )
+            for i in indices
+        ]
+
+    def padded(self, indices, pad_token_id):
+        """
+        Left-padded ``input_ids`` and ``attention_mask`` arrays for a batch.
+
+        Built with one gather from the flat token array, without calling
+        the tokenizer again.
+        """
+        indices = np.asarray(indices)
+        lengths = self.lengths[indices]
+        width = max(int(lengths.max()), 1)
+        # Position of every column relative to the start of its prompt
+        position = np.arange(width) - (width - lengths)[:, None]
+        attention_mask = position >= 0
+        gather = self.starts[indices][:, None] + np.maximum(position, 0)
+        gather = np.minimum(gather, len(self.token_ids) - 1)
+        input_ids = np.where(attention_mask, self.token_ids[gather], pad_token_id)
+        return input_ids, attention_mask.astype(np.int64)
+
+    def state_dict(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "epoch": self.epoch,
+            "cursor": self._cursor,
+            "order": self._order,
+            "counts": self.counts,
+            "reward_sum": self.reward_sum,
+            "reward_sq_sum": self.reward_sq_sum,
+            "rng": json.dumps(self.rng.bit_generator.state),
+        }
+
+    def load_state_dict(self, state):
+        if state["fingerprint"] != self.fingerprint:
+            raise ValueError("Prompt pool state was saved for different prompts")
+        self.epoch = int(state["epoch"])
+        self._cursor = int(state["cursor"])
+        self._order = np.asarray(state["order"])
+        self.counts = np.asarray(state["counts"])
+        self.reward_sum = np.asarray(state["reward_sum"])
+        self.reward_sq_sum = np.asarray(state["reward_sq_sum"])
+        self.rng.bit_generator.state = json.loads(str(state["rng"]))
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f, **self.state_dict())
+
+    def load(self, path):
+        with np.load(path) as state:
+            self.load_state_dict(dict(state))
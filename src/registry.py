@@ -0,0 +1,305 @@
+import copy
+from collections import OrderedDict
+from threading import Lock
+import torch
+from transformers import (
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    AutoModelForSequenceClassification,
+    BitsAndBytesConfig,
+)
+from trl import AutoModelForCausalLMWithValueHead
+from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
+from .config import config
+from .runtime import quantize_dynamic
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def model_nbytes(model):
+    """Return the memory held by a module's parameters and buffers in bytes."""
+    if not hasattr(model, "parameters"):
+        return 0
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.nelement() * t.element_size() for t in tensors)
+
+
+def trainable_nbytes(model):
+    """Return the memory held by a module's trainable parameters in bytes."""
+    return sum(
+        p.nelement() * p.element_size() for p in model.parameters() if p.requires_grad
+    )
+
+
+def shared_copy(model):
+    """
+    Copy a module's structure while sharing its weights.
+
+    Submodules are copied, so wrapping or hooking the copy (LoRA layers,
+    gradient checkpointing, frozen ``requires_grad`` flags) leaves the
+    original untouched, while parameters and buffers keep pointing at the
+    same storage. Parameter subclasses such as bitsandbytes' quantized
+    weights carry extra state and are shared as they are.
+    """
+    memo = {}
+    for module in model.modules():
+        for param in module._parameters.values():
+            if param is None or id(param) in memo:
+                continue
+            if type(param) is torch.nn.Parameter:
+                memo[id(param)] = torch.nn.Parameter(
+                    param.data, requires_grad=param.requires_grad
+                )
+            else:
+                memo[id(param)] = param
+        for buffer in module._buffers.values():
+            if buffer is not None:
+                memo[id(buffer)] = buffer
+    return copy.deepcopy(model, memo)
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models and tokenizers.
+
+    Entries are keyed by kind, name, dtype and device and loaded lazily on
+    first use; concurrent requests for the same key wait for a single load.
+    The value-head variant used by PPO wraps the cached causal LM instead of
+    loading a second copy of the transformer, so both share weights (training
+    either one updates both). Weights are loaded with ``low_cpu_mem_usage``,
+    which memory-maps safetensors checkpoints instead of materializing a
+    randomly initialized model first.
+
+    Once the total size exceeds ``max_bytes`` the least recently used entries
+    are dropped from the registry; their memory is freed when no caller
+    holds them any more.
+
+    Args:
+        max_bytes (int): Memory budget across all cached models.
+    """
+
+    def __init__(self, max_bytes=config.registry_max_mb * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self._loading = {}
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, factory, nbytes=model_nbytes):
+        """
+        Return the cached object for ``key``, loading it with ``factory()``.
+
+        Args:
+            key (tuple): Cache key.
+            factory (callable): Builds the object on a miss.
+            nbytes (callable): Maps the object to the memory it adds.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            key_lock = self._loading.setdefault(key, Lock())
+
+        with key_lock:
+            # Another thread may have finished loading while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+
+            obj = factory()
+            size = nbytes(obj)
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = (obj, size)
+                self._bytes += size
+                self._loading.pop(key, None)
+                self._evict(keep=key)
+        return obj
+
+    def _evict(self, keep):
+        evicted = False
+        for key in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            _, size = self._entries.pop(key)
+            self._bytes -= size
+            evicted = True
+            logger.info(f"Evicted {key} from the model registry")
+        if evicted and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def evict(self, key):
+        """Drop one entry."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # --- Typed accessors ---
+
+    def tokenizer(self, model_name, pad_with_eos=True):
+        """Tokenizer, by default with the pad token set to EOS."""
+
+        def load():
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            if pad_with_eos:
+                tokenizer.pad_token = tokenizer.eos_token
+            return tokenizer
+
+        return self.get(("tokenizer", model_name, pad_with_eos, None), load)
+
+    def causal_lm(
+        self,
+        model_name,
+        torch_dtype=torch.float16,
+        device_map="auto",
+        quantization=None,
+    ):
+        """
+        Causal language model, shared by generation and training.
+
+        ``quantization="nf4"`` loads the weights in 4 bit with bitsandbytes,
+        computing in ``torch_dtype``.
+        """
+
+        def load():
+            kwargs = {}
+            if quantization == "nf4":
+                kwargs["quantization_config"] = BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_quant_type="nf4",
+                    bnb_4bit_compute_dtype=torch_dtype,
+                    bnb_4bit_use_double_quant=True,
+                )
+            return AutoModelForCausalLM.from_pretrained(
+                model_name,
+                torch_dtype=torch_dtype,
+                device_map=device_map,
+                low_cpu_mem_usage=True,
+                **kwargs,
+            )
+
+        return self.get(
+            ("causal_lm", model_name, torch_dtype, device_map, quantization), load
+        )
+
+    def adapter_model(
+        self,
+        model_name,
+        torch_dtype=torch.float16,
+        device_map="auto",
+        quantization=None,
+        lora=(16, 32, 0.05),
+    ):
+        """
+        Causal LM with trainable LoRA adapters over the frozen cached base.
+
+        The adapters are injected into a ``shared_copy`` of the cached causal
+        LM: the frozen base weights are not duplicated, but the cached entry,
+        still used for generation, keeps its own modules and stays free of
+        adapters. ``prepare_model_for_kbit_training`` upcasts the copy's
+        non-quantized weights to fp32, which does allocate new tensors.
+        ``lora`` is ``(r, alpha, dropout)``.
+        """
+
+        def load():
+            model = shared_copy(
+                self.causal_lm(model_name, torch_dtype, device_map, quantization)
+            )
+            if quantization is not None:
+                model = prepare_model_for_kbit_training(model)
+            r, alpha, dropout = lora
+            model = get_peft_model(
+                model,
+                LoraConfig(
+                    r=r,
+                    lora_alpha=alpha,
+                    lora_dropout=dropout,
+                    bias="none",
+                    task_type="CAUSAL_LM",
+                ),
+            )
+            # Mixed precision cannot unscale fp16 gradients; train adapters in fp32
+            for param in model.parameters():
+                if param.requires_grad:
+                    param.data = param.data.float()
+            return model
+
+        return self.get(
+            ("adapter_model", model_name, torch_dtype, device_map, quantization, lora),
+            load,
+            nbytes=trainable_nbytes,
+        )
+
+    def value_head(
+        self,
+        model_name,
+        torch_dtype=torch.float16,
+        device_map="auto",
+        quantization=None,
+        lora=None,
+    ):
+        """
+        Causal LM with a PPO value head, wrapping the cached causal LM.
+
+        With ``lora`` set the value head wraps the adapter model instead, so
+        only the adapters and the value head are trained.
+        """
+
+        def load():
+            if lora is None:
+                base = self.causal_lm(model_name, torch_dtype, device_map)
+            else:
+                base = self.adapter_model(
+                    model_name, torch_dtype, device_map, quantization, lora
+                )
+            return AutoModelForCausalLMWithValueHead.from_pretrained(base)
+
+        return self.get(
+            ("value_head", model_name, torch_dtype, device_map, quantization, lora),
+            load,
+            # Only the value head is new; the transformer is already counted
+            nbytes=lambda model: model_nbytes(model.v_head),
+        )
+
+    def sequence_classifier(self, model_name, device, quantize=False):
+        """Single-logit sequence classifier, e.g. a reward model."""
+
+        def load():
+            model = AutoModelForSequenceClassification.from_pretrained(
+                model_name, num_labels=1, low_cpu_mem_usage=True
+            ).to(device)
+            return quantize_dynamic(model.eval()) if quantize else model
+
+        dtype = torch.qint8 if quantize else None
+        return self.get(("sequence_classifier", model_name, dtype, str(device)), load)
+
+
+# Global registry instance
+registry = ModelRegistry()
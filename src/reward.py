@@ -0,0 +1,179 @@
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+import hashlib
+import json
+import torch
+from .config import config
+from .models import load_reward_model
+from .preference_store import iter_preferences
+
+
+@contextmanager
+def mc_dropout(model):
+    """Activate the dropout layers of an eval-mode model (Monte Carlo dropout)."""
+    layers = [m for m in model.modules() if isinstance(m, torch.nn.Dropout)]
+    for layer in layers:
+        layer.train()
+    try:
+        yield
+    finally:
+        for layer in layers:
+            layer.eval()
+
+
+class RewardScorer:
+    """
+    Batched, cached reward scoring on top of a sequence-classification model.
+
+    Each (prompt, response) pair is scored as ``prompt + " " + response``.
+    Texts are tokenized once, sorted by length and scored in micro-batches
+    under ``torch.inference_mode``; rewards stay on the model's device until
+    the whole call is done, so there is a single host sync per call. Scores
+    are kept in an LRU cache keyed by a hash of the text, so repeated rollouts
+    are not rescored.
+
+    With ``dropout=True`` the model's dropout stays active, so every call
+    draws a fresh sample of the rewards; several such scorers over one model
+    estimate its uncertainty. Their scores are not cached.
+
+    Args:
+        model: Reward model returning one logit per sequence.
+        tokenizer: Tokenizer matching ``model``.
+        batch_size (int): Maximum number of sequences per forward pass.
+        max_length (int): Truncation length.
+        cache_size (int): Number of scores kept in the LRU cache.
+        dropout (bool): Score with Monte Carlo dropout.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        batch_size=32,
+        max_length=config.max_length,
+        cache_size=4096,
+        dropout=False,
+    ):
+        self.model = model.eval()
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache_size = 0 if dropout else cache_size
+        self.dropout = dropout
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_pretrained(cls, model_name, device=None, **kwargs):
+        """Build a scorer from a path or hub name via ``load_reward_model``."""
+        model, tokenizer = load_reward_model(model_name, device=device)
+        return cls(model, tokenizer, **kwargs)
+
+    @property
+    def device(self):
+        return next(self.model.parameters()).device
+
+    def _cache_get(self, key):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        return None
+
+    def _cache_put(self, key, value):
+        if self.cache_size <= 0:
+            return
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _forward(self, texts):
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        order = sorted(range(len(texts)), key=lambda i: len(encoded["input_ids"][i]))
+
+        scores = torch.empty(len(texts), device=self.device)
+        dropout = mc_dropout(self.model) if self.dropout else nullcontext()
+        with torch.inference_mode(), dropout:
+            for start in range(0, len(order), self.batch_size):
+                idx = order[start : start + self.batch_size]
+                batch = self.tokenizer.pad(
+                    {k: [encoded[k][i] for i in idx] for k in encoded.keys()},
+                    return_tensors="pt",
+                ).to(self.device)
+                logits = self.model(**batch).logits[:, 0]
+                scores[torch.tensor(idx, device=self.device)] = logits.float()
+        return scores.cpu()
+
+    def score(self, prompts, responses):
+        """
+        Score a list of (prompt, response) pairs.
+
+        Returns:
+            torch.Tensor: One float reward per pair, on the CPU.
+        """
+        texts = [p + " " + r for p, r in zip(prompts, responses)]
+        keys = [hashlib.sha1(t.encode("utf-8")).digest() for t in texts]
+        rewards = [self._cache_get(k) for k in keys]
+
+        missing = {}
+        for i, (key, reward) in enumerate(zip(keys, rewards)):
+            if reward is None:
+                missing.setdefault(key, []).append(i)
+        # Counted per item; repeats of an uncached text are scored only once
+        misses = sum(len(v) for v in missing.values())
+        self.misses += misses
+        self.hits += len(texts) - misses
+
+        if missing:
+            unique = list(missing.keys())
+            scores = self._forward([texts[missing[k][0]] for k in unique]).tolist()
+            for key, value in zip(unique, scores):
+                self._cache_put(key, value)
+                for i in missing[key]:
+                    rewards[i] = value
+
+        return torch.tensor(rewards, dtype=torch.float32)
+
+    def score_file(self, input_path, output_path, chunk_size=1024):
+        """
+        Score a JSONL file offline, streaming it in chunks.
+
+        Records with a ``response`` field get a ``reward``; preference records
+        with ``chosen``/``rejected`` get ``chosen_reward`` and
+        ``rejected_reward``. The fields are picked per record, so files mixing
+        both kinds are fine.
+
+        Returns:
+            int: Number of records written.
+        """
+        count = 0
+        with open(output_path, "w") as out:
+            chunk = []
+            for record in iter_preferences(input_path):
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    count += self._score_chunk(chunk, out)
+                    chunk = []
+            if chunk:
+                count += self._score_chunk(chunk, out)
+        return count
+
+    def _score_chunk(self, records, out):
+        targets = []
+        for record in records:
+            fields = ["response"] if "response" in record else ["chosen", "rejected"]
+            targets.extend((record, field) for field in fields if field in record)
+
+        # One call for the whole chunk, so it is scored in full micro-batches
+        scores = self.score(
+            [record["prompt"] for record, _ in targets],
+            [record[field] for record, field in targets],
+        ).tolist()
+        for (record, field), value in zip(targets, scores):
+            name = "reward" if field == "response" else f"{field}_reward"
+            record[name] = value
+
+        for record in records:
+            out.write(json.dumps(record) + "\n")
+        return len(records)
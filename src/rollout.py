@@ -0,0 +1,149 @@
+from dataclasses import dataclass
+from typing import List
+import numpy as np
+import torch
+from .config import config
+from .metrics import timed
+from .prompts import PromptPool
+from .utils import get_device
+
+
+@dataclass
+class Rollout:
+    """One batch of PPO experience."""
+
+    prompts: List[str]
+    prompt_indices: np.ndarray
+    texts: List[str]
+    queries: List[torch.Tensor]
+    responses: List[torch.Tensor]
+    rewards: List[torch.Tensor]
+
+
+class RolloutEngine:
+    """
+    Collect PPO experience a full batch at a time.
+
+    Each rollout samples ``batch_size`` prompts from a ``PromptPool``,
+    generates their responses in one left-padded ``generate`` call built from
+    the pool's pre-encoded ids and scores all of them with a batched
+    ``RewardScorer``. The rewards are fed back to the pool for
+    reward-variance weighting. When an ``InferenceEngine`` is given, generation goes
+    through it instead, so sequences that hit EOS early free their batch
+    slot rather than decoding padding until the longest one finishes.
+
+    Args:
+        model: Policy model (with or without value head).
+        tokenizer: Policy tokenizer.
+        reward_scorer (RewardScorer): Scores (prompt, response) pairs.
+        prompts (PromptPool): Prompt pool to sample from. A plain list of
+            prompts is wrapped in a ``PromptPool``.
+        batch_size (int): Number of prompts per rollout.
+        max_new_tokens (int): Maximum response length.
+        inference_engine (InferenceEngine): Optional engine serving the policy.
+        metrics (Metrics): Optional sink for generation and scoring timings.
+        **generate_kwargs: Extra sampling arguments passed to ``generate``.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        reward_scorer,
+        prompts,
+        batch_size=config.batch_size,
+        max_new_tokens=50,
+        inference_engine=None,
+        metrics=None,
+        **generate_kwargs,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.reward_scorer = reward_scorer
+        if not isinstance(prompts, PromptPool):
+            prompts = PromptPool(prompts, tokenizer)
+        self.prompt_pool = prompts
+        self.batch_size = batch_size
+        self.max_new_tokens = max_new_tokens
+        self.inference_engine = inference_engine
+        self.metrics = metrics
+        self.generate_kwargs = generate_kwargs
+        self.generate_kwargs.setdefault("do_sample", True)
+        self.generate_kwargs.setdefault("pad_token_id", tokenizer.eos_token_id)
+
+    def sample_prompts(self):
+        """Pool indices of the next batch of prompts."""
+        return self.prompt_pool.sample(self.batch_size)
+
+    def generate(self, indices):
+        """
+        Generate one response per pool prompt in a single batched call.
+
+        Returns:
+            tuple: Unpadded query tensors, response tensors (cut after the
+            first EOS) and decoded response texts.
+        """
+        if self.inference_engine is not None:
+            return self._generate_with_engine(indices)
+
+        pad_token_id = self.generate_kwargs["pad_token_id"]
+        input_ids, attention_mask = self.prompt_pool.padded(indices, pad_token_id)
+        device = get_device(self.model)
+        inputs = {
+            "input_ids": torch.from_numpy(input_ids).to(device),
+            "attention_mask": torch.from_numpy(attention_mask).to(device),
+        }
+
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs, max_new_tokens=self.max_new_tokens, **self.generate_kwargs
+            )
+
+        prompt_len = inputs["input_ids"].shape[1]
+        eos_token_id = self.tokenizer.eos_token_id
+        queries, responses = [], []
+        for i in range(len(indices)):
+            queries.append(inputs["input_ids"][i][inputs["attention_mask"][i].bool()])
+
+            response = outputs[i, prompt_len:]
+            eos = (response == eos_token_id).nonzero()
+            if len(eos):
+                # Keep the first EOS, drop the padding generated after it
+                response = response[: eos[0].item() + 1]
+            responses.append(response)
+
+        texts = self.tokenizer.batch_decode(responses, skip_special_tokens=True)
+        return queries, responses, texts
+
+    def _generate_with_engine(self, indices):
+        sampling = {
+            k: v
+            for k, v in self.generate_kwargs.items()
+            if k in ("do_sample", "temperature", "top_p")
+        }
+        prompt_ids = [ids.tolist() for ids in self.prompt_pool.token_ids_of(indices)]
+        results = self.inference_engine.generate_batch(
+            prompt_ids, max_new_tokens=self.max_new_tokens, **sampling
+        )
+
+        device = get_device(self.model)
+        queries = [torch.tensor(r.prompt_ids, device=device) for r in results]
+        responses = [torch.tensor(r.token_ids, device=device) for r in results]
+        return queries, responses, [r.text for r in results]
+
+    def score(self, prompts, texts):
+        """Score every (prompt, response) pair with the reward scorer."""
+        return list(self.reward_scorer.score(prompts, texts).unbind())
+
+    def rollout(self):
+        """Sample, generate and score one batch of experience."""
+        indices = self.sample_prompts()
+        prompts = self.prompt_pool.texts(indices)
+        with timed(self.metrics, "generation"):
+            queries, responses, texts = self.generate(indices)
+        with timed(self.metrics, "scoring"):
+            rewards = self.score(prompts, texts)
+        self.prompt_pool.update(indices, [r.item() for r in rewards])
+        if self.metrics is not None:
+            self.metrics.add("generated_tokens", sum(len(r) for r in responses))
+        return Rollout(prompts, indices, texts, queries, responses, rewards)
@@ -0,0 +1,117 @@
+from dataclasses import dataclass
+import torch
+from .config import config
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+_DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16, "fp32": torch.float32}
+
+
+@dataclass(frozen=True)
+class ExecutionProfile:
+    """Where models run and at which precision."""
+
+    device: str
+    precision: str
+    quantize_inference: bool
+
+    @property
+    def dtype(self):
+        """Weight dtype for inference-only models."""
+        return _DTYPES[self.precision]
+
+    @property
+    def train_dtype(self):
+        """
+        Weight dtype for trained models.
+
+        On CPU the weights stay in fp32 and bf16 is used through autocast
+        (``TrainingArguments(bf16=True)``) instead.
+        """
+        return self.dtype if self.device == "cuda" else torch.float32
+
+    @property
+    def device_map(self):
+        return "auto" if self.device == "cuda" else None
+
+    def training_precision_args(self):
+        """Precision-related ``TrainingArguments`` keyword arguments."""
+        return {
+            "fp16": self.precision == "fp16",
+            "bf16": self.precision == "bf16",
+            "use_cpu": self.device == "cpu",
+        }
+
+
+def cpu_supports_bf16():
+    """Whether the CPU has native bf16 instructions (AVX512-BF16 or AMX)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def resolve_profile(
+    device=config.device,
+    precision=config.precision,
+    quantize_inference=config.quantize_inference,
+):
+    """
+    Resolve ``"auto"`` settings against the hardware.
+
+    ``device="auto"`` picks CUDA when available. ``precision="auto"`` keeps
+    fp16 on GPU and picks bf16 on CPUs with native bf16 support, fp32
+    otherwise (fp16 matmuls are slow or unsupported on CPU). Dynamic int8
+    quantization of inference-only models only applies on CPU.
+    """
+    if device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    if precision == "auto":
+        if device == "cuda":
+            precision = "fp16"
+        else:
+            precision = "bf16" if cpu_supports_bf16() else "fp32"
+    if precision not in _DTYPES:
+        raise ValueError(f"Unknown precision {precision!r}")
+    return ExecutionProfile(device, precision, quantize_inference and device == "cpu")
+
+
+def configure_threads(
+    num_threads=config.num_threads, num_interop_threads=config.num_interop_threads
+):
+    """Apply intra-op and inter-op thread counts (0 keeps the torch default)."""
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError:
+            # Only allowed before the first inter-op parallel work starts
+            logger.warning("Inter-op thread count already fixed; ignoring setting")
+
+
+def quantize_dynamic(model):
+    """Quantize the Linear layers of an inference-only model to int8."""
+    return torch.ao.quantization.quantize_dynamic(
+        model.float(), {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+_profile = None
+
+
+def get_profile():
+    """Return the process-wide profile, applying thread settings on first use."""
+    global _profile
+    if _profile is None:
+        _profile = resolve_profile()
+        configure_threads()
+        logger.info(
+            f"Execution profile: {_profile.device}/{_profile.precision}, "
+            f"{torch.get_num_threads()} threads, "
+            f"int8 inference={_profile.quantize_inference}"
+        )
+    return _profile
@@ -0,0 +1,139 @@
+import itertools
+import os
+import numpy as np
+from .config import config
+from .models import load_reward_model
+from .reward import RewardScorer
+
+
+def ngrams(text, n=3):
+    """Word n-gram shingles of ``text`` (its words when it is shorter)."""
+    words = text.lower().split()
+    if len(words) < n:
+        return {tuple(words)}
+    return {tuple(words[i : i + n]) for i in range(len(words) - n + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class PairSelector:
+    """
+    Pick the most informative pair out of several candidate responses.
+
+    Candidates whose word-trigram Jaccard similarity to an earlier candidate
+    reaches ``similarity`` are dropped as near-duplicates. The remaining
+    ones are scored with every reward scorer in one batched call each, and
+    the pair with the highest uncertainty is chosen: the smallest mean
+    reward margin, less the disagreement (standard deviation of the margin)
+    between scorers. Votes on such pairs teach the reward model most;
+    pairs it already ranks confidently add little.
+
+    Without scorers the first two distinct candidates are used. With
+    ``max_margin`` set, prompts whose most uncertain pair still has a larger
+    margin are skipped (None) rather than shown, saving the label.
+
+    Which response of the pair is shown as A is random, so annotators'
+    position bias does not line up with generation order or reward.
+
+    Args:
+        scorers (list): ``RewardScorer`` objects, e.g. reward model
+            checkpoints or Monte Carlo dropout samples; may be empty.
+        similarity (float): Jaccard similarity treated as a duplicate.
+        max_margin (float): Skip threshold on the reward margin (0 disables).
+        seed (int): Seed for the A/B order.
+    """
+
+    def __init__(
+        self,
+        scorers=(),
+        similarity=config.annotation_similarity,
+        max_margin=config.annotation_max_margin,
+        seed=None,
+    ):
+        self.scorers = list(scorers)
+        self.similarity = similarity
+        self.max_margin = max_margin
+        self.rng = np.random.default_rng(seed)
+
+    def deduplicate(self, responses):
+        kept, shingles = [], []
+        for response in responses:
+            grams = ngrams(response)
+            if all(jaccard(grams, other) < self.similarity for other in shingles):
+                kept.append(response)
+                shingles.append(grams)
+        return kept
+
+    def _rewards(self, prompts, candidates):
+        """Reward matrix (scorers x candidates) for every prompt."""
+        flat_prompts = [p for p, c in zip(prompts, candidates) for _ in c]
+        flat_texts = [r for c in candidates for r in c]
+        scores = np.stack(
+            [s.score(flat_prompts, flat_texts).numpy() for s in self.scorers]
+        )
+        bounds = np.cumsum([0] + [len(c) for c in candidates])
+        return [scores[:, start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def select(self, prompts, candidates):
+        """
+        Choose one pair per prompt.
+
+        Args:
+            prompts (list): Prompts.
+            candidates (list): Candidate responses of every prompt.
+
+        Returns:
+            list: ``(response_a, response_b)`` per prompt, or None for prompts
+            without an informative pair.
+        """
+        distinct = [self.deduplicate(c) for c in candidates]
+        if not self.scorers:
+            return [
+                self._shuffle(c[0], c[1]) if len(c) >= 2 else None for c in distinct
+            ]
+
+        scorable = [(p, c) for p, c in zip(prompts, distinct) if len(c) >= 2]
+        rewards = iter(self._rewards(*zip(*scorable)) if scorable else [])
+        pairs = []
+        for responses in distinct:
+            if len(responses) < 2:
+                pairs.append(None)
+                continue
+            matrix = next(rewards)
+            best, best_key, best_margin = None, None, None
+            for i, j in itertools.combinations(range(len(responses)), 2):
+                margins = matrix[:, i] - matrix[:, j]
+                margin = abs(margins.mean())
+                key = margin - margins.std()
+                if best_key is None or key < best_key:
+                    best, best_key, best_margin = (i, j), key, margin
+            if self.max_margin and best_margin > self.max_margin:
+                pairs.append(None)
+            else:
+                pairs.append(self._shuffle(responses[best[0]], responses[best[1]]))
+        return pairs
+
+    def _shuffle(self, a, b):
+        return (b, a) if self.rng.random() < 0.5 else (a, b)
+
+
+def load_selection_scorers(passes=config.annotation_dropout_passes):
+    """
+    Scorers for pair selection: ``passes`` Monte Carlo dropout samples of
+    the trained reward model, if there is one.
+
+    Only the final reward model is saved, so the disagreement term comes
+    from dropout; all samples share one copy of the model.
+    """
+    path = os.path.join(config.output_dir, "reward_model")
+    # An untrained reward head would rank pairs at random
+    if not os.path.isdir(path):
+        return []
+    model, tokenizer = load_reward_model(path)
+    if passes <= 1:
+        return [RewardScorer(model, tokenizer)]
+    return [RewardScorer(model, tokenizer, dropout=True) for _ in range(passes)]
@@ -1,51 +1,234 @@
-import torch
-from transformers import TrainingArguments
+import dataclasses
+import json
+import os
+from datasets import load_from_disk
+from transformers import TrainerCallback, TrainingArguments
 from trl import DPOTrainer
+from .autotune import BatchPlan, plan_batch
+from .checkpoint import (
+    CheckpointManager,
+    load_trainable_state,
+    rng_state,
+    set_rng_state,
+    trainable_state,
+)
 from .config import config
-from .data import prepare_dataset, load_preferences
+from .data import cache_key, load_preference_dataset
+from .jobs import JobProgressCallback
+from .metrics import Metrics, MetricsCallback
 from .models import load_dpo_model, load_tokenizer
-from .utils import set_seed
+from .runtime import get_profile
+from .utils import describe_footprint, set_seed
+
+
+def precompute_reference_logps(trainer, dataset_key, cache_dir=None):
+    """
+    Attach reference-model log-probs to the trainer's datasets.
+
+    The reference model is the policy before training (with LoRA, the frozen
+    base with adapters disabled), so the log-probs are computed by the
+    trainer's own model before ``train()`` is called, in one
+    batched pass over the train and eval splits. The tokenized splits with
+    their ``reference_*_logps`` columns are stored next to the dataset cache,
+    so later runs on the same data load them instead of recomputing. Either
+    way no separate reference model is kept in memory during training.
+
+    Args:
+        trainer (DPOTrainer): Trainer created with ``precompute_ref_log_probs``.
+        dataset_key (str): Identifies the raw train/eval splits.
+        cache_dir (str): Root directory for cached datasets.
+    """
+    key = cache_key(
+        trainer.model.config._name_or_path,
+        getattr(trainer.model, "is_loaded_in_4bit", False),
+        dataset_key,
+        trainer.max_length,
+        trainer.max_prompt_length,
+        trainer.loss_type,
+    )
+    path = os.path.join(cache_dir or config.cache_dir, f"dpo-reference-{key}")
+    train_path = os.path.join(path, "train")
+    eval_path = os.path.join(path, "eval")
+
+    if os.path.isdir(train_path) and os.path.isdir(eval_path):
+        print(f"Loading reference log-probs from {path}")
+        trainer.train_dataset = load_from_disk(train_path)
+        trainer.eval_dataset = load_from_disk(eval_path)
+    else:
+        print("Precomputing reference log-probs...")
+        # DPOTrainer adds the reference columns the first time the
+        # dataloaders are requested
+        trainer.get_train_dataloader()
+        trainer.get_eval_dataloader()
+        trainer.train_dataset.save_to_disk(train_path)
+        trainer.eval_dataset.save_to_disk(eval_path)
+
+    trainer._precomputed_train_ref_log_probs = True
+    trainer._precomputed_eval_ref_log_probs = True
+
+
+class CheckpointedDPOTrainer(DPOTrainer):
+    """
+    ``DPOTrainer`` whose checkpoints go through a ``CheckpointManager``.
+
+    Saving only snapshots the trainable weights, optimizer, scheduler and
+    RNG state and leaves the writing to the manager's background thread,
+    instead of ``Trainer``'s synchronous ``torch.save`` of everything. Each
+    checkpoint also holds ``trainer_state.json``, so
+    ``train(resume_from_checkpoint=...)`` skips the batches already seen as
+    usual, and the loading hooks below restore the rest from the snapshot.
+
+    It also counts the non-padding chosen and rejected tokens of every batch
+    into ``state.num_input_tokens_seen`` (``Trainer``'s own count looks for
+    ``input_ids``, which DPO batches do not have), for ``MetricsCallback``.
+    """
+
+    def __init__(self, *args, checkpoints, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkpoints = checkpoints
+        self._resume_state = None
+
+    def training_step(self, model, inputs):
+        self.state.num_input_tokens_seen += sum(
+            int(inputs[key].sum())
+            for key in ("chosen_attention_mask", "rejected_attention_mask")
+            if key in inputs
+        )
+        return super().training_step(model, inputs)
+
+    def _save_checkpoint(self, model, trial, metrics=None):
+        self.store_flos()
+        self.checkpoints.save(
+            self.state.global_step,
+            {
+                "model": trainable_state(self.model),
+                "optimizer": self.optimizer.state_dict(),
+                "scheduler": self.lr_scheduler.state_dict(),
+                "rng": rng_state(),
+            },
+            files={
+                "trainer_state.json": json.dumps(
+                    dataclasses.asdict(self.state), indent=2, sort_keys=True
+                )
+            },
+        )
+
+    def _checkpoint_state(self, checkpoint):
+        if self._resume_state is None:
+            self._resume_state = self.checkpoints.load(checkpoint)
+        return self._resume_state
+
+    def _load_from_checkpoint(self, resume_from_checkpoint, model=None):
+        state = self._checkpoint_state(resume_from_checkpoint)
+        load_trainable_state(model or self.model, state["model"])
+
+    def _load_optimizer_and_scheduler(self, checkpoint):
+        if checkpoint is None:
+            return
+        state = self._checkpoint_state(checkpoint)
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.lr_scheduler.load_state_dict(state["scheduler"])
+
+    def _load_rng_state(self, checkpoint):
+        if checkpoint is not None:
+            set_rng_state(self._checkpoint_state(checkpoint)["rng"])
+
+
+class PreemptionCallback(TrainerCallback):
+    """Checkpoint and stop after the current step once SIGTERM arrived."""
+
+    def __init__(self, checkpoints):
+        self.checkpoints = checkpoints
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self.checkpoints.preempted:
+            control.should_save = True
+            control.should_training_stop = True
 
 
 def train_dpo():
     set_seed()
 
     # Load data
-    prefs = load_preferences(config.preference_path)
-    dataset = prepare_dataset(prefs)
-    split = dataset.train_test_split(test_size=0.2)
+    # Cached on disk, so repeated runs also reuse DPOTrainer's tokenization
+    dataset = load_preference_dataset(config.preference_path)
+    split = dataset.train_test_split(test_size=0.2, seed=42)
     train_ds = split["train"]
     eval_ds = split["test"]
 
     # Load model & tokenizer
     model = load_dpo_model()
     tokenizer = load_tokenizer()
+    profile = get_profile()
+
+    # Fit as large a micro-batch as memory allows, accumulating up to
+    # config.batch_size
+    if config.dpo_autotune:
+        plan = plan_batch(model, seq_len=config.max_length)
+    else:
+        plan = BatchPlan(
+            micro_batch_size=config.batch_size,
+            gradient_accumulation_steps=1,
+            gradient_checkpointing=config.dpo_gradient_checkpointing == "on",
+        )
+    print(
+        f"Batch plan: micro-batch {plan.micro_batch_size} x "
+        f"{plan.gradient_accumulation_steps} accumulation steps, "
+        f"gradient checkpointing {'on' if plan.gradient_checkpointing else 'off'}"
+    )
 
     training_args = TrainingArguments(
         output_dir=config.output_dir,
         num_train_epochs=config.rm_epochs,
-        per_device_train_batch_size=2,  # As per original notebook
-        learning_rate=5e-5,
-        fp16=True,
+        learning_rate=config.dpo_learning_rate,
+        **plan.training_args(),
+        **profile.training_precision_args(),
         logging_steps=5,
-        save_steps=50,
+        # CheckpointedDPOTrainer writes these asynchronously
+        save_strategy="steps" if config.checkpoint_every else "no",
+        save_steps=config.checkpoint_every or 500,
         report_to="none",
     )
 
-    dpo_trainer = DPOTrainer(
+    checkpoints = CheckpointManager(os.path.join(config.checkpoint_dir, "dpo"))
+    checkpoints.install_signal_handler()
+
+    dpo_trainer = CheckpointedDPOTrainer(
         model=model,
         args=training_args,
         train_dataset=train_ds,
         eval_dataset=eval_ds,
         tokenizer=tokenizer,
         beta=0.1,
+        max_length=config.max_length,
+        max_prompt_length=config.max_length // 2,
+        precompute_ref_log_probs=True,
+        checkpoints=checkpoints,
+        callbacks=[
+            PreemptionCallback(checkpoints),
+            JobProgressCallback(),
+            MetricsCallback(Metrics("dpo", log_every=training_args.logging_steps)),
+        ],
+    )
+    precompute_reference_logps(
+        dpo_trainer, f"{train_ds._fingerprint}-{eval_ds._fingerprint}"
     )
 
     print("Starting DPO Training...")
-    dpo_trainer.train()
+    print(describe_footprint(model))
+    resume_from = checkpoints.resume_path()
+    if resume_from:
+        print(f"Resuming DPO from {resume_from}")
+    dpo_trainer.train(resume_from_checkpoint=resume_from)
+    if checkpoints.preempted:
+        checkpoints.close()
+        print("DPO Training interrupted, rerun to resume")
+        return
+    checkpoints.finish()
     print("DPO Training finished!")
+    print(describe_footprint(model))
 
-    # Save model
+    # Save model (adapter weights only when training with LoRA)
     dpo_trainer.save_model(f"{config.output_dir}/dpo_model")
 
 
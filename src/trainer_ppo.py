@@ -1,24 +1,79 @@
+import json
 import os
-import torch
 import numpy as np
 from trl import PPOTrainer, PPOConfig
 from .config import config
 from .models import load_ppo_model, load_reward_model, load_tokenizer
-from .utils import set_seed
+from .utils import describe_footprint, set_seed
 from .data import load_preferences
+from .reward import RewardScorer
+from .rollout import RolloutEngine
+from .prompts import PromptPool
+from .corpus import PromptCorpus, load_corpus
+from .engine import InferenceEngine
+from .jobs import report_progress
+from .metrics import Metrics
+from .checkpoint import (
+    CheckpointManager,
+    load_trainable_state,
+    rng_state,
+    set_rng_state,
+    trainable_state,
+)
 
+PROMPTS_NAME = "prompts.json"
+
+
+def make_ppo_config():
+    """
+    PPO settings of a run. ``mini_batch_size`` is set explicitly because
+    TRL's default (128) does not divide ``config.batch_size``.
+    """
+    return PPOConfig(
+        learning_rate=config.learning_rate,
+        batch_size=config.batch_size,
+        mini_batch_size=config.ppo_mini_batch_size,
+    )
 
-def train_ppo():
-    set_seed()
 
-    # Load preference prompts for training loop
+def load_training_prompts(tokenizer=None):
+    """
+    Prompts for the PPO prompt pool: the memory-mapped prompt corpus when
+    ``config.prompt_corpus_path`` is set, else those of the collected
+    preferences.
+    """
+    if config.prompt_corpus_path:
+        return load_corpus(config.prompt_corpus_path, tokenizer or load_tokenizer())
     prefs = load_preferences(config.preference_path)
-    training_prompts = [p["prompt"] for p in prefs]
+    return [p["prompt"] for p in prefs]
 
-    # Load models
-    model = load_ppo_model()
-    tokenizer = load_tokenizer()
 
+def load_prompt_pool(tokenizer, resume_from=None):
+    """
+    The PPO prompt pool, built from the prompts snapshotted into the
+    ``resume_from`` checkpoint when there are any.
+
+    Preferences collected while a run was interrupted change the prompt
+    list, and with it the pool's sampling state; the resumed run keeps
+    sampling from the prompts it started with, and the new ones join at the
+    next fresh run.
+    """
+    snapshot = resume_from and os.path.join(resume_from, PROMPTS_NAME)
+    if snapshot and os.path.exists(snapshot):
+        with open(snapshot, encoding="utf-8") as f:
+            return PromptPool(json.load(f), tokenizer)
+    return PromptPool(load_training_prompts(tokenizer), tokenizer)
+
+
+def prompt_files(prompt_pool):
+    """Checkpoint files snapshotting the pool's prompts (corpora are on disk)."""
+    if isinstance(prompt_pool.prompts, PromptCorpus):
+        return {}
+    return {PROMPTS_NAME: json.dumps(prompt_pool.prompts)}
+
+
+def load_ppo_reward_model():
+    """Load the reward model used to score PPO rollouts."""
     # Original notebook loads reward model from output/reward_model.
     # We'll assume the user has a reward model there or load a default one.
     # The original notebook had a section "LOAD REWARD MODEL" using distilbert.
@@ -51,56 +106,165 @@ def train_ppo():
     reward_model_path = os.path.join(config.output_dir, "reward_model")
     if not os.path.exists(reward_model_path):
         print(
-            f"Reward model not found at {reward_model_path}, using distilbert-base-uncased default."
+            f"Reward model not found at {reward_model_path}, using {config.rm_model_name} default."
         )
-        reward_model, rm_tokenizer = load_reward_model("distilbert-base-uncased")
+        return load_reward_model(config.rm_model_name)
+    return load_reward_model(reward_model_path)
+
+
+def ppo_checkpoint_state(step, model, ppo_trainer, prompt_pool, rewards):
+    """
+    Everything needed to continue a PPO run exactly after ``step`` steps.
+
+    ``prompt_pool`` is None for the distributed learner, whose rollout
+    workers own the prompt pools.
+    """
+    state = {
+        "step": step,
+        "model": trainable_state(model),
+        # PPO steps leave the policy in train mode, so later rollouts sample
+        # with dropout active; a resumed run must generate the same way
+        "training": model.training,
+        "optimizer": ppo_trainer.optimizer.state_dict(),
+        "kl_coef": float(ppo_trainer.kl_ctl.value),
+        "rewards": np.asarray(rewards, dtype=np.float64),
+        "rng": rng_state(),
+    }
+    if prompt_pool is not None:
+        state["prompt_pool"] = prompt_pool.state_dict()
+    return state
+
+
+def restore_prompt_pool(prompt_pool, state):
+    """Continue ``prompt_pool`` from a checkpointed pool state, if it matches."""
+    if state is not None and state["fingerprint"] == prompt_pool.fingerprint:
+        prompt_pool.load_state_dict(state)
     else:
-        reward_model, rm_tokenizer = load_reward_model(reward_model_path)
+        # E.g. the prompt corpus was rebuilt, or the run switched between
+        # in-process and distributed PPO; the weights still resume
+        print(
+            "Warning: the PPO prompts changed since the checkpoint, "
+            "prompt sampling starts over"
+        )
 
-    ppo_config = PPOConfig(
-        learning_rate=config.learning_rate, batch_size=config.batch_size
-    )
 
-    ppo_trainer = PPOTrainer(config=ppo_config, model=model, tokenizer=tokenizer)
+def restore_ppo_state(state, model, ppo_trainer, prompt_pool=None):
+    """Load a checkpoint state; returns the step count and reward history."""
+    load_trainable_state(model, state["model"])
+    model.train(state["training"])
+    ppo_trainer.optimizer.load_state_dict(state["optimizer"])
+    ppo_trainer.kl_ctl.value = state["kl_coef"]
+    if prompt_pool is not None:
+        restore_prompt_pool(prompt_pool, state.get("prompt_pool"))
+    set_rng_state(state["rng"])
+    return state["step"], state["rewards"].tolist()
 
-    print("Starting PPO Training Loop...")
 
-    rewards = []
+def train_ppo():
+    if config.ppo_num_workers > 0:
+        # The learner process checkpoints and resumes distributed runs
+        from .ppo_distributed import train_ppo_distributed
+
+        return train_ppo_distributed()
+
+    set_seed()
+
+    # Load models
+    model = load_ppo_model()
+    tokenizer = load_tokenizer()
+    reward_model, rm_tokenizer = load_ppo_reward_model()
+
+    # Snapshots are written in the background; an interrupted run picks up
+    # from its last checkpoint
+    checkpoints = CheckpointManager(os.path.join(config.checkpoint_dir, "ppo"))
+    checkpoints.install_signal_handler()
+    resume_from = checkpoints.resume_path()
+
+    # Deduplicated preference prompts, tokenized once for the whole run
+    prompt_pool = load_prompt_pool(tokenizer, resume_from)
+    checkpoint_files = prompt_files(prompt_pool)
 
-    for step in range(config.ppo_steps):
-        # Sample a prompt
-        prompt = np.random.choice(training_prompts)
+    ppo_config = make_ppo_config()
 
-        # Helper to encode prompt
-        input_ids = tokenizer(prompt, return_tensors="pt").input_ids.to(model.device)
+    ppo_trainer = PPOTrainer(config=ppo_config, model=model, tokenizer=tokenizer)
+
+    # The inference engine decodes the policy weights in place, so rollouts
+    # always see the latest PPO update
+    inference_engine = None
+    if config.ppo_use_inference_engine:
+        inference_engine = InferenceEngine(model.pretrained_model, tokenizer)
 
-        # Generate response
-        response = model.generate(input_ids, max_new_tokens=50, do_sample=True)
+    # Times generation, scoring and the optimizer step of every PPO step
+    metrics = Metrics("ppo")
 
-        # Extract only the new tokens
-        response_tensors = response[:, input_ids.shape[1] :]
+    # Each rollout generates and scores a full PPO batch at once
+    engine = RolloutEngine(
+        model,
+        tokenizer,
+        RewardScorer(reward_model, rm_tokenizer),
+        prompt_pool,
+        batch_size=config.batch_size,
+        inference_engine=inference_engine,
+        metrics=metrics,
+    )
 
-        text = tokenizer.decode(response_tensors[0])
-        combined = prompt + " " + text
+    rewards = []
+    start = 0
 
-        # Compute reward
-        inputs = rm_tokenizer(
-            combined, return_tensors="pt", truncation=True, max_length=256
-        ).to(model.device)
+    if resume_from:
+        start, rewards = restore_ppo_state(
+            checkpoints.load(resume_from), model, ppo_trainer, prompt_pool
+        )
+        print(f"Resuming PPO from {resume_from} (step {start})")
 
-        with torch.no_grad():
-            reward = reward_model(**inputs).logits[0, 0].cpu()
+    print("Starting PPO Training Loop...")
+    print(describe_footprint(model))
+
+    for step in range(start, config.ppo_steps):
+        batch = engine.rollout()
 
         # PPO Step
-        stats = ppo_trainer.step([input_ids[0]], [response_tensors[0]], [reward])
+        with metrics.timer("optimizer"):
+            stats = ppo_trainer.step(batch.queries, batch.responses, batch.rewards)
+
+        rewards.extend(r.item() for r in batch.rewards)
+        report_progress(step + 1, config.ppo_steps)
 
-        rewards.append(reward.item())
+        if checkpoints.due(step + 1):
+            # Only the copy off the live tensors happens here
+            with metrics.timer("checkpoint"):
+                checkpoints.save(
+                    step + 1,
+                    ppo_checkpoint_state(
+                        step + 1, model, ppo_trainer, prompt_pool, rewards
+                    ),
+                    files=checkpoint_files,
+                )
+
+        generation_s = metrics.value("generation_s")
+        metrics.log(
+            step,
+            reward_mean=float(np.mean([r.item() for r in batch.rewards])),
+            tokens_per_s=metrics.value("generated_tokens") / max(generation_s, 1e-9),
+        )
 
         if step % 10 == 0:
-            print(f"Step {step}: Reward = {reward.item():.4f}")
+            mean_reward = np.mean([r.item() for r in batch.rewards])
+            print(f"Step {step}: Reward = {mean_reward:.4f}")
+
+        if checkpoints.preempted:
+            checkpoints.close()
+            metrics.close()
+            print(f"PPO Training interrupted, resume from step {step + 1}")
+            return
 
+    checkpoints.finish()
+    metrics.close()
     print("PPO Training finished!")
+    print(describe_footprint(model))
+    # With LoRA this saves the adapter and value head only
     ppo_trainer.save_pretrained(f"{config.output_dir}/ppo_model")
+    prompt_pool.save(f"{config.output_dir}/ppo_model/prompt_pool.npz")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,242 @@
+import json
+import os
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+from transformers import get_linear_schedule_with_warmup
+from .config import config
+from .data import LengthGroupedBatchSampler, PairwiseCollator, load_tokenized_dataset
+from .jobs import report_progress
+from .metrics import Metrics
+from .models import load_rm_model
+from .runtime import get_profile
+from .utils import describe_footprint, set_seed
+
+
+def shared_prefix_length(a, b):
+    """Number of leading tokens ``a`` and ``b`` have in common."""
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def trim_shared_prefix(chosen, rejected, max_length, keep=0):
+    """
+    Fit a preference pair into ``max_length`` tokens.
+
+    Both sequences start with the same prompt, and only the responses
+    differ. Plain right truncation can cut the responses off entirely,
+    leaving two identical sequences. Instead the excess is removed from the
+    shared prefix first (after its first ``keep`` tokens, e.g. ``[CLS]``),
+    dropping the start of the prompt in both sequences alike; only when the
+    responses alone are too long are the sequences truncated on the right.
+
+    Returns:
+        tuple: Trimmed ``(chosen, rejected)`` token id lists.
+    """
+    excess = max(len(chosen), len(rejected)) - max_length
+    if excess > 0:
+        shared = shared_prefix_length(chosen, rejected)
+        cut = min(excess, max(shared - keep, 0))
+        chosen = chosen[:keep] + chosen[keep + cut :]
+        rejected = rejected[:keep] + rejected[keep + cut :]
+    return chosen[:max_length], rejected[:max_length]
+
+
+def _trim_batch(examples, max_length, keep):
+    chosen, rejected = [], []
+    for c, r in zip(examples["chosen_input_ids"], examples["rejected_input_ids"]):
+        c, r = trim_shared_prefix(c, r, max_length, keep)
+        chosen.append(c)
+        rejected.append(r)
+    return {
+        "chosen_input_ids": chosen,
+        "chosen_attention_mask": [[1] * len(c) for c in chosen],
+        "rejected_input_ids": rejected,
+        "rejected_attention_mask": [[1] * len(r) for r in rejected],
+        "length": [max(len(c), len(r)) for c, r in zip(chosen, rejected)],
+    }
+
+
+def prepare_pairs(dataset, tokenizer, max_length=config.max_length):
+    """
+    Trim the tokenized pairs to ``max_length`` and drop uninformative ones.
+
+    Pairs whose chosen and rejected sequences are still identical carry no
+    preference signal (their loss is a constant log 2) and are removed.
+    """
+    keep = 1 if tokenizer.cls_token_id is not None else 0
+    dataset = dataset.map(
+        _trim_batch,
+        batched=True,
+        fn_kwargs={"max_length": max_length, "keep": keep},
+        desc="Trimming shared prefixes",
+    )
+    return dataset.filter(
+        lambda c, r: c != r,
+        input_columns=["chosen_input_ids", "rejected_input_ids"],
+        desc="Dropping identical pairs",
+    )
+
+
+def pairwise_rewards(model, batch):
+    """
+    Score chosen and rejected sequences in one forward pass.
+
+    ``PairwiseCollator`` pads both sides to the same length, so they are
+    concatenated along the batch dimension and split again afterwards.
+
+    Returns:
+        tuple: ``(chosen_rewards, rejected_rewards)`` as fp32 tensors.
+    """
+    input_ids = torch.cat([batch["chosen_input_ids"], batch["rejected_input_ids"]])
+    attention_mask = torch.cat(
+        [batch["chosen_attention_mask"], batch["rejected_attention_mask"]]
+    )
+    rewards = model(input_ids=input_ids, attention_mask=attention_mask).logits
+    return rewards.squeeze(-1).float().chunk(2)
+
+
+def bradley_terry_loss(chosen_rewards, rejected_rewards):
+    """Negative log-likelihood that the chosen response is preferred."""
+    return -F.logsigmoid(chosen_rewards - rejected_rewards).mean()
+
+
+def _autocast(profile):
+    return torch.autocast(
+        device_type=profile.device,
+        dtype=profile.dtype,
+        enabled=profile.precision != "fp32",
+    )
+
+
+def _to(batch, device):
+    return {k: v.to(device) for k, v in batch.items()}
+
+
+@torch.no_grad()
+def evaluate(model, dataloader, profile=None):
+    """Fraction of pairs the model ranks correctly, and the mean loss."""
+    profile = profile or get_profile()
+    model.eval()
+    correct, total, loss = 0, 0, 0.0
+    for batch in dataloader:
+        with _autocast(profile):
+            chosen, rejected = pairwise_rewards(model, _to(batch, profile.device))
+        correct += (chosen > rejected).sum().item()
+        loss += bradley_terry_loss(chosen, rejected).item() * len(chosen)
+        total += len(chosen)
+    model.train()
+    return {"accuracy": correct / max(total, 1), "loss": loss / max(total, 1)}
+
+
+def train_rm():
+    # The saved evaluation results come from the last epoch
+    if config.rm_epochs < 1:
+        raise ValueError(f"rm_epochs must be at least 1, got {config.rm_epochs}")
+    set_seed()
+    profile = get_profile()
+
+    model, tokenizer = load_rm_model(config.rm_model_name)
+
+    # Tokenize with headroom so trim_shared_prefix, not the tokenizer,
+    # decides what is cut from pairs longer than config.max_length
+    source_length = min(tokenizer.model_max_length, 2 * config.max_length)
+    dataset = load_tokenized_dataset(
+        tokenizer, config.preference_path, max_length=source_length
+    )
+    dataset = prepare_pairs(dataset, tokenizer, config.max_length)
+    split = dataset.train_test_split(test_size=config.rm_val_fraction, seed=42)
+    train_ds, eval_ds = split["train"], split["test"]
+    print(f"Reward model pairs: {len(train_ds)} train, {len(eval_ds)} validation")
+
+    # Length-bucketed batches, padded to their longest sequence
+    collator = PairwiseCollator(tokenizer)
+    columns = [
+        f"{side}_{key}"
+        for side in ("chosen", "rejected")
+        for key in ("input_ids", "attention_mask")
+    ]
+    train_loader = DataLoader(
+        train_ds.select_columns(columns),
+        batch_sampler=LengthGroupedBatchSampler(train_ds["length"], config.batch_size),
+        collate_fn=collator,
+    )
+    eval_loader = DataLoader(
+        eval_ds.select_columns(columns),
+        batch_sampler=LengthGroupedBatchSampler(
+            eval_ds["length"], config.batch_size, shuffle=False
+        ),
+        collate_fn=collator,
+    )
+
+    total_steps = config.rm_epochs * len(train_loader)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=config.rm_learning_rate)
+    scheduler = get_linear_schedule_with_warmup(
+        optimizer, int(0.1 * total_steps), total_steps
+    )
+    # Loss scaling is only needed for fp16 autocast
+    scaler = torch.cuda.amp.GradScaler(enabled=profile.precision == "fp16")
+    metrics = Metrics("rm")
+
+    print("Starting Reward Model Training...")
+    print(describe_footprint(model))
+    model.train()
+
+    step = 0
+    for epoch in range(config.rm_epochs):
+        for batch in train_loader:
+            with metrics.timer("step"):
+                batch = _to(batch, profile.device)
+                with _autocast(profile):
+                    chosen, rejected = pairwise_rewards(model, batch)
+                loss = bradley_terry_loss(chosen, rejected)
+                scaler.scale(loss).backward()
+                scaler.step(optimizer)
+                scaler.update()
+                scheduler.step()
+                optimizer.zero_grad(set_to_none=True)
+
+            pairs = len(chosen)
+            mask = torch.cat(
+                [batch["chosen_attention_mask"], batch["rejected_attention_mask"]]
+            )
+            metrics.log(
+                step,
+                loss=loss.item(),
+                accuracy=(chosen > rejected).float().mean().item(),
+                pairs_per_s=pairs / max(metrics.value("step_s"), 1e-9),
+                padding_fraction=1.0 - mask.float().mean().item(),
+            )
+            step += 1
+            report_progress(step, total_steps)
+
+        result = evaluate(model, eval_loader, profile)
+        metrics.log(
+            step,
+            epoch=epoch,
+            val_accuracy=result["accuracy"],
+            val_loss=result["loss"],
+        )
+        print(
+            f"Epoch {epoch}: validation accuracy = {result['accuracy']:.4f}, "
+            f"loss = {result['loss']:.4f}"
+        )
+
+    metrics.close()
+    print("Reward Model Training finished!")
+
+    # safetensors are memory-mapped on load, so load_reward_model (and the
+    # PPO and pair-selection scorers built on it) start quickly
+    output_path = os.path.join(config.output_dir, "reward_model")
+    model.save_pretrained(output_path, safe_serialization=True)
+    tokenizer.save_pretrained(output_path)
+    with open(os.path.join(output_path, "eval_results.json"), "w") as f:
+        json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    train_rm()
@@ -23,6 +23,32 @@ def get_logger(name):
     return logging.getLogger(name)
 
 
+def get_device(model):
+    """Return the device of a model's parameters (works for wrapped models too)."""
+    return next(model.parameters()).device
+
+
+def peak_memory_mb():
+    """Peak memory of this process in MB: CUDA allocations, or CPU RSS."""
+    if torch.cuda.is_available():
+        return torch.cuda.max_memory_allocated() / 1024**2
+    import resource
+
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def describe_footprint(model):
+    """Summarize trainable vs total parameters and the peak memory so far."""
+    trainable = sum(p.numel() for p in model.parameters() if p.requires_grad)
+    total = sum(p.numel() for p in model.parameters())
+    return (
+        f"Trainable parameters: {trainable:,} / {total:,} "
+        f"({100 * trainable / max(total, 1):.2f}%), "
+        f"peak memory: {peak_memory_mb():.0f} MB"
+    )
+
+
 def print_gpu_utilization():
     """Print GPU memory utilization."""
     if torch.cuda.is_available():
@@ -0,0 +1,225 @@
+import heapq
+import itertools
+import queue
+import time
+from collections import deque
+from dataclasses import dataclass
+from threading import Lock, Thread
+from .config import config
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class Lease:
+    """An annotation item handed out to one session until ``expires_at``."""
+
+    item_id: int
+    prompt: str
+    response_a: str
+    response_b: str
+    session_id: str
+    expires_at: float
+
+    @property
+    def item(self):
+        return (self.prompt, self.response_a, self.response_b)
+
+
+class AnnotationWorkQueue:
+    """
+    Hand out distinct annotation items to concurrent sessions.
+
+    Every session holds at most one lease. Asking again, even concurrently,
+    returns the same item (so a page reload does not skip it); voting
+    completes the lease and the session gets a fresh item next. Leases not
+    completed within ``lease_timeout`` seconds are reclaimed and handed to
+    the next session that asks, before any new item is taken from the
+    prefetcher.
+
+    The lock only guards the lease bookkeeping; generation waits on the
+    prefetcher outside of it. Votes are put on a queue and written to the
+    preference store in batches by a single writer thread, so annotators
+    never wait on disk I/O or on each other's writes. A batch whose write
+    fails is kept and retried with exponential backoff; ``flush`` waits for
+    it, and should be called before the process exits.
+
+    Args:
+        prefetcher (AnnotationPrefetcher): Source of generated items.
+        store (PreferenceStore): Where votes are written.
+        lease_timeout (float): Seconds before an unanswered item is reclaimed.
+        clock (callable): Time source, replaceable in tests.
+        retry_delay (float): Seconds before retrying a failed write; doubles
+            with every further failure, up to a minute.
+    """
+
+    def __init__(
+        self,
+        prefetcher,
+        store,
+        lease_timeout=config.annotation_lease_timeout,
+        clock=time.monotonic,
+        retry_delay=1.0,
+    ):
+        self.prefetcher = prefetcher
+        self.store = store
+        self.lease_timeout = lease_timeout
+        self.clock = clock
+        self.retry_delay = retry_delay
+
+        self._lock = Lock()
+        self._ids = itertools.count()
+        self._leases = {}  # session_id -> Lease
+        self._expiry = []  # heap of (expires_at, item_id, session_id)
+        self._requeued = deque()
+        self._votes = queue.Queue()
+        self._writer = None
+
+    def _reclaim(self, now):
+        # Entries of completed or renewed leases are skipped lazily
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, item_id, session_id = heapq.heappop(self._expiry)
+            lease = self._leases.get(session_id)
+            if lease is not None and lease.item_id == item_id:
+                del self._leases[session_id]
+                self._requeued.append(lease.item)
+
+    def _grant(self, session_id, item, now):
+        current = self._leases.get(session_id)
+        if current is not None:
+            # A concurrent request of the same session (a double click, a
+            # second tab) was granted first; this item goes to the next one
+            self._requeued.appendleft(item)
+            return current
+        lease = Lease(next(self._ids), *item, session_id, now + self.lease_timeout)
+        self._leases[session_id] = lease
+        heapq.heappush(self._expiry, (lease.expires_at, lease.item_id, session_id))
+        return lease
+
+    def _current_or_requeued(self, session_id):
+        now = self.clock()
+        with self._lock:
+            self._reclaim(now)
+            if session_id in self._leases:
+                return self._leases[session_id]
+            if self._requeued:
+                return self._grant(session_id, self._requeued.popleft(), now)
+        return None
+
+    def lease(self, session_id, timeout=None):
+        """
+        Return the session's ``Lease``, blocking while a new item generates.
+
+        Returns None once every item has been handed out.
+        """
+        lease = self._current_or_requeued(session_id)
+        if lease is not None:
+            return lease
+        item = self.prefetcher.get(timeout=timeout)
+        if item is None:
+            return None
+        with self._lock:
+            return self._grant(session_id, item, self.clock())
+
+    def stream(self, session_id):
+        """
+        Like ``lease``, but yield partial ``(prompt, response_a, response_b)``
+        tuples while a new item generates. The last value yielded is the
+        ``Lease``, or None when all items are done.
+        """
+        lease = self._current_or_requeued(session_id)
+        if lease is not None:
+            yield lease
+            return
+        # The prefetcher's last value is the complete item
+        items = self.prefetcher.stream()
+        item = next(items)
+        for following in items:
+            yield item
+            item = following
+        if item is None:
+            yield None
+            return
+        with self._lock:
+            yield self._grant(session_id, item, self.clock())
+
+    def complete(self, session_id, choice):
+        """
+        Record the session's vote and end its lease.
+
+        ``choice`` is ``"A is Better"``, ``"B is Better"`` or anything else
+        to skip the item. Returns False when the session holds no lease,
+        e.g. because it expired and was given to someone else.
+        """
+        with self._lock:
+            lease = self._leases.pop(session_id, None)
+        if lease is None:
+            return False
+
+        if choice == "A is Better":
+            chosen, rejected = lease.response_a, lease.response_b
+        elif choice == "B is Better":
+            chosen, rejected = lease.response_b, lease.response_a
+        else:  # Tie / skip
+            return True
+        self._start_writer()
+        self._votes.put(
+            {"prompt": lease.prompt, "chosen": chosen, "rejected": rejected}
+        )
+        return True
+
+    def _start_writer(self):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = Thread(target=self._write_votes, daemon=True)
+                    self._writer.start()
+
+    def _write_votes(self):
+        records, failures = [], 0
+        while True:
+            if not records:
+                records.append(self._votes.get())
+            # Drain whatever else arrived meanwhile into the same write
+            while True:
+                try:
+                    records.append(self._votes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.store.extend(records)
+            except Exception:
+                # Keep the batch; the votes are lost only if the process dies
+                delay = min(self.retry_delay * 2**failures, 60.0)
+                failures += 1
+                logger.exception(
+                    f"Failed to save {len(records)} preference records, "
+                    f"retrying in {delay:.0f}s"
+                )
+                time.sleep(delay)
+                continue
+            for _ in records:
+                self._votes.task_done()
+            records, failures = [], 0
+
+    def flush(self, timeout=None):
+        """
+        Block until every recorded vote has been written to the store.
+
+        Returns False if votes are still unwritten after ``timeout`` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._votes.all_tasks_done:
+            while self._votes.unfinished_tasks:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                self._votes.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {"leased": len(self._leases), "requeued": len(self._requeued)}
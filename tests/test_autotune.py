@@ -0,0 +1,131 @@
+import unittest
+import sys
+import os
+import tempfile
+from unittest import mock
+from transformers import GPT2Config, GPT2LMHeadModel
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import autotune
+from src.autotune import plan_batch
+
+
+def tiny_model():
+    return GPT2LMHeadModel(
+        GPT2Config(vocab_size=64, n_positions=64, n_layer=1, n_embd=16, n_head=2)
+    )
+
+
+class TestPlanBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_probe_finds_fitting_plan(self):
+        plan = plan_batch(
+            tiny_model(),
+            seq_len=32,
+            target_batch_size=4,
+            gradient_checkpointing="off",
+            cache_dir=self.tmp.name,
+        )
+        self.assertIn(plan.micro_batch_size, (1, 2, 4))
+        self.assertEqual(plan.micro_batch_size * plan.gradient_accumulation_steps, 4)
+        self.assertFalse(plan.gradient_checkpointing)
+
+    def test_micro_batches_divide_the_target(self):
+        probed = []
+
+        def probe(model, size, seq_len):
+            probed.append(size)
+            return float(size)
+
+        # Activations take 100 bytes per sample, against a budget of 450
+        peaks = iter([100, 200, 300, 400, 500, 600])
+        with mock.patch.object(autotune, "_probe", probe), mock.patch.object(
+            autotune, "_current_bytes", return_value=0
+        ), mock.patch.object(autotune, "_peak_bytes", lambda: next(peaks)):
+            size, _ = autotune._search(
+                tiny_model(), 32, 6, budget=450, optimizer_bytes=0
+            )
+        # 4 does not divide 6 and 6 does not fit: 3 x 2 reaches it exactly
+        self.assertEqual(probed, [1, 2, 3])
+        self.assertEqual(size, 3)
+
+    def test_accumulation_and_checkpointing_fallback(self):
+        results = iter([(2, 10.0), (4, 12.0)])
+        with mock.patch.object(autotune, "_search", lambda *a: next(results)):
+            plan = plan_batch(
+                tiny_model(),
+                seq_len=32,
+                target_batch_size=8,
+                gradient_checkpointing="auto",
+                cache_dir=self.tmp.name,
+            )
+
+        self.assertEqual(plan.micro_batch_size, 4)
+        self.assertEqual(plan.gradient_accumulation_steps, 2)
+        self.assertTrue(plan.gradient_checkpointing)
+
+    def test_checkpointing_state_is_restored(self):
+        model = tiny_model()
+        # As left behind by prepare_model_for_kbit_training
+        model.gradient_checkpointing_enable()
+        seen = []
+
+        def search(model, *args):
+            seen.append(model.is_gradient_checkpointing)
+            return 1, 1.0
+
+        with mock.patch.object(autotune, "_search", search):
+            plan_batch(
+                model,
+                seq_len=32,
+                target_batch_size=8,
+                gradient_checkpointing="auto",
+                cache_dir=self.tmp.name,
+            )
+        # The "off" probe really runs without checkpointing
+        self.assertEqual(seen, [False, True])
+        self.assertTrue(model.is_gradient_checkpointing)
+
+    def test_plan_is_cached(self):
+        model = tiny_model()
+        first = plan_batch(
+            model,
+            seq_len=32,
+            target_batch_size=2,
+            gradient_checkpointing="off",
+            cache_dir=self.tmp.name,
+        )
+        with mock.patch.object(autotune, "_search", side_effect=AssertionError):
+            second = plan_batch(
+                model,
+                seq_len=32,
+                target_batch_size=2,
+                gradient_checkpointing="off",
+                cache_dir=self.tmp.name,
+            )
+        self.assertEqual(first, second)
+
+    @unittest.skipUnless(
+        os.access("/proc/self/clear_refs", os.W_OK), "needs Linux peak RSS reset"
+    )
+    def test_peak_rss_is_reset_between_probes(self):
+        with mock.patch.object(autotune, "get_profile") as profile:
+            profile.return_value.device = "cpu"
+            autotune._reset_peak()
+            before = autotune._peak_bytes()
+            block = bytearray(200 * 1024**2)
+            self.assertGreater(autotune._peak_bytes(), before + 100 * 1024**2)
+            del block
+            autotune._reset_peak()
+            self.assertLess(autotune._peak_bytes(), before + 100 * 1024**2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import sys
+import os
+from contextlib import redirect_stdout
+from io import StringIO
+
+# Add project root and the benchmarks directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+)
+
+from run_benchmarks import compare
+
+
+def result(value, higher_is_better):
+    return {"value": value, "unit": "s", "higher_is_better": higher_is_better}
+
+
+class TestCompare(unittest.TestCase):
+    def compare(self, results, threshold=0.25):
+        baseline = {"rate": result(100.0, True), "latency": result(1.0, False)}
+        with redirect_stdout(StringIO()):
+            return compare(results, baseline, threshold)
+
+    def test_noise_within_threshold_passes(self):
+        results = {"rate": result(80.0, True), "latency": result(1.2, False)}
+        self.assertEqual(self.compare(results), [])
+
+    def test_slowdowns_are_flagged_by_direction(self):
+        results = {"rate": result(70.0, True), "latency": result(1.3, False)}
+        self.assertEqual(
+            [name for name, *_ in self.compare(results)], ["rate", "latency"]
+        )
+        # Faster than the baseline is never a regression
+        results = {"rate": result(200.0, True), "latency": result(0.5, False)}
+        self.assertEqual(self.compare(results), [])
+
+    def test_new_metrics_are_skipped(self):
+        self.assertEqual(self.compare({"new": result(1.0, True)}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
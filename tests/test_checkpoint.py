@@ -0,0 +1,132 @@
+import unittest
+import sys
+import os
+import random
+import tempfile
+import numpy as np
+import torch
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.checkpoint import (
+    CheckpointManager,
+    load_trainable_state,
+    rng_state,
+    set_rng_state,
+    trainable_state,
+)
+
+
+def make_model():
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(4, 8), torch.nn.Linear(8, 1))
+    # Frozen parameters (e.g. the LoRA base) are not checkpointed
+    model[0].bias.requires_grad_(False)
+    optimizer = torch.optim.AdamW(
+        [p for p in model.parameters() if p.requires_grad], lr=1e-2
+    )
+    return model, optimizer
+
+
+def train(model, optimizer, steps):
+    for _ in range(steps):
+        x = torch.randn(16, 4)
+        loss = (model(x) - x.sum(1, keepdim=True)).pow(2).mean()
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+
+
+class TestCheckpointManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = os.path.join(self.tmp.name, "run")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_state_round_trip(self):
+        manager = CheckpointManager(self.dir)
+        state = {
+            "step": 3,
+            "optimizer": {0: {"exp_avg": torch.ones(2)}, 1: {}},
+            "betas": (0.9, 0.999),
+            "pool": {"order": np.array([2, 0, 1]), "rng": '{"a": 1}'},
+            "half": torch.arange(4, dtype=torch.bfloat16),
+        }
+        manager.save(3, state, files={"notes.txt": "hi"}, block=True)
+        loaded = manager.load()
+        self.assertEqual(loaded["step"], 3)
+        self.assertEqual(list(loaded["optimizer"]), [0, 1])
+        self.assertTrue(torch.equal(loaded["optimizer"][0]["exp_avg"], torch.ones(2)))
+        self.assertEqual(loaded["betas"], (0.9, 0.999))
+        self.assertEqual(loaded["pool"]["order"].tolist(), [2, 0, 1])
+        self.assertEqual(loaded["half"].dtype, torch.bfloat16)
+        with open(os.path.join(manager.latest(), "notes.txt")) as f:
+            self.assertEqual(f.read(), "hi")
+
+    def test_snapshot_is_isolated_from_training(self):
+        manager = CheckpointManager(self.dir)
+        weight = torch.zeros(3)
+        manager.save(1, {"weight": weight})
+        # In-place updates right after save must not leak into the checkpoint
+        weight.add_(1)
+        manager.wait()
+        self.assertEqual(manager.load()["weight"].tolist(), [0, 0, 0])
+
+    def test_retention(self):
+        manager = CheckpointManager(self.dir, keep_last=2, keep_every=4)
+        for step in range(1, 10):
+            manager.save(step, {"step": step}, block=True)
+        self.assertEqual(manager.steps(), [4, 8, 9])
+        self.assertEqual(manager.load()["step"], 9)
+
+    def test_exact_resume(self):
+        model, optimizer = make_model()
+        torch.manual_seed(1)
+        train(model, optimizer, 6)
+        expected = [p.clone() for p in model.parameters()]
+
+        model, optimizer = make_model()
+        torch.manual_seed(1)
+        train(model, optimizer, 3)
+        manager = CheckpointManager(self.dir)
+        manager.save(
+            3,
+            {
+                "model": trainable_state(model),
+                "optimizer": optimizer.state_dict(),
+                "rng": rng_state(),
+            },
+        )
+        # Whatever happens after the snapshot is not part of the run
+        train(model, optimizer, 2)
+        random.random()
+        manager.close()
+
+        model, optimizer = make_model()
+        resumed = CheckpointManager(self.dir)
+        state = resumed.load(resumed.resume_path())
+        self.assertEqual(set(state["model"]), {"0.weight", "1.weight", "1.bias"})
+        load_trainable_state(model, state["model"])
+        optimizer.load_state_dict(state["optimizer"])
+        set_rng_state(state["rng"])
+        train(model, optimizer, 3)
+        for p, e in zip(model.parameters(), expected):
+            self.assertTrue(torch.equal(p, e))
+
+    def test_finished_runs_start_over(self):
+        manager = CheckpointManager(self.dir)
+        manager.save(5, {"step": 5}, block=True)
+        self.assertEqual(CheckpointManager(self.dir).resume_path(), manager.path(5))
+        manager.finish()
+        self.assertIsNone(CheckpointManager(self.dir).resume_path())
+        self.assertEqual(CheckpointManager(self.dir).steps(), [])
+        self.assertIsNone(
+            CheckpointManager(self.dir, resume=False).resume_path(),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
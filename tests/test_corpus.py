@@ -0,0 +1,102 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.corpus import PromptCorpus, load_corpus
+from src.prompts import PromptPool
+
+
+class WordTokenizer:
+    """Stand-in tokenizer: one token per word (its length)."""
+
+    name_or_path = "words"
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += 1
+        return {"input_ids": [[len(w) for w in t.split()] for t in texts]}
+
+
+PROMPTS = ["a bb", "ccc", "a bb", "dddd ee f", "héllo wörld", "ccc"]
+
+
+class TestPromptCorpus(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, "prompts.jsonl")
+        with open(self.source, "w") as f:
+            for i, prompt in enumerate(PROMPTS):
+                # Bare strings and objects can be mixed
+                value = prompt if i % 2 else {"prompt": prompt, "id": i}
+                f.write(json.dumps(value) + "\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def load(self, tokenizer=None, **kwargs):
+        return load_corpus(
+            self.source,
+            tokenizer or WordTokenizer(),
+            cache_dir=self.tmp.name,
+            **kwargs,
+        )
+
+    def test_deduplicated_random_access(self):
+        corpus = self.load()
+        self.assertEqual(len(corpus), 4)
+        self.assertEqual(list(corpus), ["a bb", "ccc", "dddd ee f", "héllo wörld"])
+        self.assertEqual(corpus[-1], "héllo wörld")
+        self.assertEqual(corpus[1:3], ["ccc", "dddd ee f"])
+        self.assertEqual(corpus.lengths.tolist(), [2, 1, 3, 2])
+        self.assertEqual(len(set(corpus.hashes.tolist())), 4)
+        with self.assertRaises(IndexError):
+            corpus[4]
+
+    def test_index_is_reused(self):
+        self.load()
+        tokenizer = WordTokenizer()
+        corpus = self.load(tokenizer)
+        self.assertEqual(tokenizer.calls, 0)
+        self.assertIsInstance(corpus, PromptCorpus)
+
+    def test_filter_by_length(self):
+        corpus = self.load(min_tokens=2, max_tokens=2)
+        self.assertEqual(list(corpus), ["a bb", "héllo wörld"])
+        self.assertEqual(list(corpus.filter(max_tokens=2)), list(corpus))
+
+    def test_shards_are_disjoint(self):
+        corpus = self.load()
+        shards = [list(corpus.shard(i, 3)) for i in range(3)]
+        self.assertEqual(shards, [["a bb", "héllo wörld"], ["ccc"], ["dddd ee f"]])
+        self.assertEqual(list(corpus.filter(min_tokens=2).shard(1, 2)), ["dddd ee f"])
+
+    def test_parquet_source(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = os.path.join(self.tmp.name, "prompts.parquet")
+        pq.write_table(pa.table({"prompt": PROMPTS}), path)
+        corpus = load_corpus(path, WordTokenizer(), cache_dir=self.tmp.name)
+        self.assertEqual(list(corpus), ["a bb", "ccc", "dddd ee f", "héllo wörld"])
+
+    def test_prompt_pool_uses_corpus_tokens(self):
+        corpus = self.load(min_tokens=2)
+        pool = PromptPool(corpus, tokenizer=None, seed=0)
+        self.assertEqual(pool.texts([0, 2]), ["a bb", "héllo wörld"])
+        self.assertEqual(
+            [ids.tolist() for ids in pool.token_ids_of([1, 2])], [[4, 2, 1], [5, 5]]
+        )
+        input_ids, attention_mask = pool.padded([0, 1], pad_token_id=9)
+        self.assertEqual(input_ids.tolist(), [[9, 1, 2], [4, 2, 1]])
+        self.assertEqual(attention_mask.tolist(), [[0, 1, 1], [1, 1, 1]])
+
+
+if __name__ == "__main__":
+    unittest.main()
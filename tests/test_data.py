@@ -0,0 +1,174 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.data import (
+    LengthGroupedBatchSampler,
+    PairwiseCollator,
+    TokenizedPreferenceCache,
+    load_preference_dataset,
+)
+from src.preference_store import PreferenceStore
+
+
+class CharTokenizer:
+    """Minimal stand-in tokenizer: one token per character."""
+
+    name_or_path = "char"
+    pad_token_id = 0
+
+    def __call__(self, texts, truncation=True, padding=False, max_length=None):
+        ids = [[ord(c) for c in t][:max_length] for t in texts]
+        return {"input_ids": ids, "attention_mask": [[1] * len(i) for i in ids]}
+
+
+def record(i):
+    return {"prompt": f"p{i}", "chosen": "c" * (i + 1), "rejected": "r"}
+
+
+class TestTokenizedPreferenceCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "preferences.jsonl")
+        self.store = PreferenceStore(self.path, compact_every=0)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def load(self):
+        cache = TokenizedPreferenceCache(
+            CharTokenizer(), self.path, max_length=32, cache_dir=self.tmp.name
+        )
+        return cache.load()
+
+    def test_appended_records_are_added(self):
+        for i in range(3):
+            self.store.append(record(i))
+        self.store.sync()
+        self.assertEqual(len(self.load()), 3)
+
+        self.store.append(record(3))
+        self.store.sync()
+        dataset = self.load()
+
+        self.assertEqual(len(dataset), 4)
+        self.assertEqual(dataset[3]["length"], len("p3 cccc"))
+
+    def test_rewritten_file_is_rebuilt(self):
+        for i in range(3):
+            self.store.append(record(i))
+        self.store.close()
+        self.assertEqual(len(self.load()), 3)
+
+        # A manual edit removes a record from the middle
+        with open(self.path) as f:
+            lines = f.readlines()
+        with open(self.path, "w") as f:
+            f.writelines(lines[:1] + lines[2:])
+        dataset = self.load()
+        self.assertEqual(len(dataset), 2)
+        self.assertEqual(dataset["length"], [len("p0 c"), len("p2 ccc")])
+
+    def test_compaction_keeps_tokenized_rows(self):
+        for i in range(3):
+            self.store.append(record(i))
+        self.store.sync()
+        self.assertEqual(len(self.load()), 3)
+
+        # Valid lines are copied verbatim, so the cache sees an append
+        self.store.compact()
+        self.store.append(record(3))
+        self.store.sync()
+        tokenize = TokenizedPreferenceCache._tokenize
+        with mock.patch.object(
+            TokenizedPreferenceCache, "_tokenize", autospec=True, side_effect=tokenize
+        ) as spy:
+            self.assertEqual(len(self.load()), 4)
+        self.assertEqual([len(c.args[1]) for c in spy.call_args_list], [1])
+
+    def test_update_reads_only_the_signature_windows(self):
+        for i in range(40):
+            self.store.append(record(i))
+        self.store.sync()
+        self.load()
+
+        self.store.append(record(40))
+        self.store.sync()
+        size = os.path.getsize(self.path)
+        opened = []
+        real_open = open
+
+        def counting_open(file, mode="r", *args, **kwargs):
+            f = real_open(file, mode, *args, **kwargs)
+            if file == self.path:
+                read = f.read
+                f.read = lambda n=-1: opened.append(read(n)) or opened[-1]
+            return f
+
+        with mock.patch("src.data._SIGNATURE_WINDOW", 64), mock.patch(
+            "builtins.open", counting_open
+        ):
+            self.assertEqual(len(self.load()), 41)
+        self.assertLess(sum(map(len, opened)), size // 2)
+
+        # A rewrite inside a window is still noticed
+        with open(self.path) as f:
+            lines = f.readlines()
+        with open(self.path, "w") as f:
+            f.writelines([lines[0].replace("p0", "q0")] + lines[1:])
+        tokenize = TokenizedPreferenceCache._tokenize
+        with mock.patch("src.data._SIGNATURE_WINDOW", 64), mock.patch.object(
+            TokenizedPreferenceCache, "_tokenize", autospec=True, side_effect=tokenize
+        ) as spy:
+            self.assertEqual(len(self.load()), 41)
+        self.assertEqual([len(c.args[1]) for c in spy.call_args_list], [1])
+
+
+class TestLegacyPreferences(unittest.TestCase):
+    def test_legacy_json_is_loaded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # Only the pre-JSONL file exists
+            with open(os.path.join(tmp, "preferences.json"), "w") as f:
+                json.dump([record(0), record(1)], f)
+            path = os.path.join(tmp, "preferences.jsonl")
+
+            dataset = load_preference_dataset(path, cache_dir=tmp)
+            self.assertEqual(dataset["prompt"], ["p0", "p1"])
+
+            cache = TokenizedPreferenceCache(
+                CharTokenizer(), path, max_length=32, cache_dir=tmp
+            )
+            self.assertEqual(len(cache.load()), 2)
+
+
+class TestBatching(unittest.TestCase):
+    def test_sampler_covers_every_index(self):
+        lengths = [i % 13 for i in range(101)]
+        sampler = LengthGroupedBatchSampler(lengths, batch_size=8, bucket_factor=3)
+        batches = list(sampler)
+
+        self.assertEqual(len(batches), len(sampler))
+        self.assertEqual(sorted(i for b in batches for i in b), list(range(101)))
+
+    def test_collator_pads_to_longest(self):
+        features = [
+            {"chosen_input_ids": [1, 2, 3], "rejected_input_ids": [4]},
+            {"chosen_input_ids": [5], "rejected_input_ids": [6, 7]},
+        ]
+        batch = PairwiseCollator(CharTokenizer())(features)
+
+        self.assertEqual(tuple(batch["chosen_input_ids"].shape), (2, 3))
+        self.assertEqual(
+            batch["rejected_attention_mask"].tolist(), [[1, 0, 0], [1, 1, 0]]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import sys
+import os
+import torch
+from unittest import mock
+from transformers import GPT2Config, GPT2LMHeadModel
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.engine import InferenceEngine
+from src.kv_cache import PrefixCacheStore
+
+
+class CharTokenizer:
+    """Minimal stand-in tokenizer: one token per character, EOS is 0."""
+
+    eos_token_id = 0
+
+    def __call__(self, text):
+        return {"input_ids": [ord(c) % 127 + 1 for c in text]}
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join(chr(i - 1) for i in ids if i != self.eos_token_id)
+
+
+def tiny_model():
+    torch.manual_seed(0)
+    model_config = GPT2Config(
+        vocab_size=128, n_positions=256, n_layer=2, n_embd=32, n_head=2
+    )
+    return GPT2LMHeadModel(model_config).eval()
+
+
+class TestInferenceEngine(unittest.TestCase):
+    def setUp(self):
+        self.model = tiny_model()
+        self.tokenizer = CharTokenizer()
+
+    def reference(self, prompt, max_new_tokens):
+        ids = torch.tensor([self.tokenizer(prompt)["input_ids"]])
+        out = self.model.generate(
+            ids,
+            attention_mask=torch.ones_like(ids),
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=0,
+            eos_token_id=0,
+        )
+        tokens = out[0, ids.shape[1] :].tolist()
+        return tokens[: tokens.index(0) + 1] if 0 in tokens else tokens
+
+    def test_greedy_matches_generate_under_batching(self):
+        engine = InferenceEngine(self.model, self.tokenizer, max_batch_size=2)
+        requests = [("hello", 12), ("a", 3), ("the quick brown fox", 20)]
+        futures = [
+            engine.submit(p, max_new_tokens=n, do_sample=False) for p, n in requests
+        ]
+        for (prompt, n), future in zip(requests, futures):
+            self.assertEqual(
+                future.result(timeout=30).token_ids, self.reference(prompt, n)
+            )
+        engine.stop()
+
+    def test_session_reuses_prefix_cache(self):
+        store = PrefixCacheStore()
+        engine = InferenceEngine(self.model, self.tokenizer, prefix_cache=store)
+        first = engine.submit(
+            "turn one", max_new_tokens=4, do_sample=False, session_id="s"
+        )
+        prompt = "turn one" + first.result(timeout=30).text + " turn two"
+        second = engine.submit(
+            prompt, max_new_tokens=4, do_sample=False, session_id="s"
+        )
+
+        self.assertEqual(second.result(timeout=30).token_ids, self.reference(prompt, 4))
+        self.assertEqual(store.hits, 1)
+        self.assertGreater(store.reused_tokens, 0)
+        engine.stop()
+
+    def test_generate_batch_streams_partial_text(self):
+        engine = InferenceEngine(self.model, self.tokenizer)
+        partials = []
+        results = engine.generate_batch(
+            ["x", "y"], num_responses=2, max_new_tokens=5, on_text=partials.append
+        )
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(partials[-1], [r.text for r in results])
+        engine.stop()
+
+    def test_each_prompt_is_prefilled_once(self):
+        # A group larger than the batch is admitted alone
+        engine = InferenceEngine(self.model, self.tokenizer, max_batch_size=3)
+        with mock.patch.object(engine, "_prefill", wraps=engine._prefill) as prefill:
+            results = engine.generate_batch(
+                ["hello", "a"], num_responses=4, max_new_tokens=6, do_sample=False
+            )
+        self.assertEqual(prefill.call_count, 2)
+        self.assertEqual(len(results), 8)
+        for i, prompt in enumerate(["hello", "a"]):
+            for result in results[i * 4 : (i + 1) * 4]:
+                self.assertEqual(result.token_ids, self.reference(prompt, 6))
+        engine.stop()
+
+    def test_over_length_request_is_rejected(self):
+        engine = InferenceEngine(self.model, self.tokenizer)
+        with self.assertRaises(ValueError):
+            engine.submit("x" * 300, max_new_tokens=10)
+        with self.assertRaises(ValueError):
+            engine.submit("x" * 150, max_new_tokens=150)
+        engine.stop()
+
+    def test_failing_request_does_not_fail_others(self):
+        engine = InferenceEngine(self.model, self.tokenizer, max_batch_size=4)
+
+        def broken(delta):
+            raise RuntimeError("callback failed")
+
+        bad = engine.submit("abc", max_new_tokens=8, on_text=broken)
+        good = engine.submit("hello", max_new_tokens=8, do_sample=False)
+
+        with self.assertRaises(RuntimeError):
+            bad.result(timeout=30)
+        self.assertEqual(good.result(timeout=30).token_ids, self.reference("hello", 8))
+        # The engine keeps serving new requests afterwards
+        again = engine.submit("a", max_new_tokens=3, do_sample=False)
+        self.assertEqual(again.result(timeout=30).token_ids, self.reference("a", 3))
+        engine.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import sys
+import os
+import torch
+from transformers import BatchEncoding, GPT2Config, GPT2LMHeadModel
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.generation import generate_responses
+
+
+class CharTokenizer:
+    """Minimal stand-in tokenizer: one token per character, id 0 is EOS/pad."""
+
+    eos_token_id = 0
+    pad_token_id = 0
+
+    def __init__(self):
+        self.padding_side = "right"
+
+    def __call__(self, texts, return_tensors="pt", padding=True):
+        ids = [[ord(c) - 96 for c in t] for t in texts]
+        width = max(len(i) for i in ids)
+        rows, masks = [], []
+        for i in ids:
+            pad, mask = [0] * (width - len(i)), [1] * len(i)
+            if self.padding_side == "left":
+                rows.append(pad + i)
+                masks.append(pad + mask)
+            else:
+                rows.append(i + pad)
+                masks.append(mask + pad)
+        return BatchEncoding(
+            {"input_ids": torch.tensor(rows), "attention_mask": torch.tensor(masks)}
+        )
+
+    def batch_decode(self, sequences, skip_special_tokens=True):
+        return [
+            "".join(chr(96 + t) for t in row if not (skip_special_tokens and t == 0))
+            for row in (s.tolist() if torch.is_tensor(s) else s for s in sequences)
+        ]
+
+
+class TestGenerateResponses(unittest.TestCase):
+    def test_prompts_are_sliced_off_under_left_padding(self):
+        torch.manual_seed(0)
+        model = GPT2LMHeadModel(
+            GPT2Config(vocab_size=27, n_positions=64, n_layer=1, n_embd=16, n_head=2)
+        ).eval()
+        tokenizer = CharTokenizer()
+        prompts = ["abc", "abcdefgh", "z"]
+        # top_k=1 makes sampling greedy, so the outputs are comparable
+
+        batched = generate_responses(
+            model,
+            tokenizer,
+            prompts,
+            num_responses=2,
+            max_new_tokens=5,
+            top_k=1,
+        )
+        # The caller's padding side is restored
+        self.assertEqual(tokenizer.padding_side, "right")
+        self.assertEqual([len(r) for r in batched], [2, 2, 2])
+        for prompt, responses in zip(prompts, batched):
+            alone = generate_responses(
+                model,
+                tokenizer,
+                [prompt],
+                num_responses=1,
+                max_new_tokens=5,
+                top_k=1,
+            )
+            # Only the new tokens, exactly as without padding
+            self.assertEqual(responses, alone[0] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+import sys
+import os
+import tempfile
+import time
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.config import config
+from src.jobs import CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = self.make_queue()
+
+    def tearDown(self):
+        self.queue.stop()
+        self.tmp.cleanup()
+
+    def make_queue(self):
+        return JobQueue(
+            db_path=os.path.join(self.tmp.name, "jobs.sqlite"),
+            log_dir=os.path.join(self.tmp.name, "logs"),
+            limits={"gpu": 1},
+            poll_interval=0.05,
+        )
+
+    def test_captures_log_and_progress(self):
+        job_id = self.queue.submit(
+            "ok", python("print('hello'); print('[progress] 3/4')")
+        )
+        job = self.queue.wait(job_id, timeout=30)
+
+        self.assertEqual(job["status"], SUCCEEDED)
+        self.assertEqual(job["progress"], 0.75)
+        self.assertIn("hello", self.queue.tail(job_id))
+
+    def test_failure_is_recorded(self):
+        job_id = self.queue.submit("bad", python("raise SystemExit(3)"))
+        job = self.queue.wait(job_id, timeout=30)
+
+        self.assertEqual(job["status"], FAILED)
+        self.assertEqual(job["returncode"], 3)
+
+    def test_resource_limit_queues_jobs(self):
+        first = self.queue.submit("first", python("import time; time.sleep(1)"))
+        second = self.queue.submit("second", python("pass"))
+        time.sleep(0.3)
+        self.assertEqual(self.queue.get(second)["status"], QUEUED)
+
+        self.queue.wait(second, timeout=30)
+        self.assertLessEqual(
+            self.queue.get(first)["finished_at"], self.queue.get(second)["started_at"]
+        )
+
+    def test_cancel_running_and_queued(self):
+        running = self.queue.submit("long", python("import time; time.sleep(30)"))
+        queued = self.queue.submit("next", python("pass"))
+        while self.queue.get(running)["status"] == QUEUED:
+            time.sleep(0.05)
+
+        self.assertTrue(self.queue.cancel(queued))
+        self.assertTrue(self.queue.cancel(running))
+        self.assertEqual(self.queue.wait(running, timeout=30)["status"], CANCELLED)
+        self.assertEqual(self.queue.get(queued)["status"], CANCELLED)
+        self.assertFalse(self.queue.cancel(running))
+
+    def test_cancel_waits_for_slow_steps(self):
+        # Finishes its current 1s step on SIGTERM, like the trainers do
+        code = (
+            "import signal, time\n"
+            "stop = []\n"
+            "signal.signal(signal.SIGTERM, lambda *a: stop.append(1))\n"
+            "for step in range(30):\n"
+            "    time.sleep(1)\n"
+            "    print(f'[progress] {step + 1}/30', flush=True)\n"
+            "    if stop:\n"
+            "        print('checkpointed', flush=True)\n"
+            "        break\n"
+        )
+        job_id = self.queue.submit("train", python(code))
+        while (self.queue.get(job_id)["progress"] or 0) < 2 / 30:
+            time.sleep(0.05)
+
+        with mock.patch.object(config, "job_cancel_grace", 0.2):
+            self.assertTrue(self.queue.cancel(job_id))
+            job = self.queue.wait(job_id, timeout=30)
+        self.assertEqual(job["status"], CANCELLED)
+        self.assertIn("checkpointed", self.queue.tail(job_id))
+
+    def start_long_job(self):
+        job_id = self.queue.submit("long", python("import time; time.sleep(30)"))
+        while self.queue.get(job_id)["status"] == QUEUED:
+            time.sleep(0.05)
+        # Simulate a restart: the old scheduler is gone, the child lives on
+        self.queue.stop()
+        return job_id, self.queue._procs[job_id]
+
+    def restart(self):
+        restarted = self.make_queue()
+        self.addCleanup(restarted.stop)
+        return restarted
+
+    def test_restart_marks_dead_jobs_failed(self):
+        job_id, proc = self.start_long_job()
+        proc.kill()
+        proc.wait()
+
+        restarted = self.restart()
+        self.assertEqual(restarted.get(job_id)["status"], FAILED)
+
+    def test_restart_keeps_live_jobs_on_their_slot(self):
+        job_id, proc = self.start_long_job()
+
+        restarted = self.restart()
+        self.assertEqual(restarted.get(job_id)["status"], RUNNING)
+        waiting = restarted.submit("next", python("pass"))
+        time.sleep(0.3)
+        self.assertEqual(restarted.get(waiting)["status"], QUEUED)
+
+        proc.kill()
+        proc.wait()
+        self.assertEqual(restarted.wait(waiting, timeout=30)["status"], SUCCEEDED)
+        self.assertEqual(restarted.get(job_id)["status"], FAILED)
+
+    def test_queued_jobs_start_after_restart(self):
+        self.queue.stop()
+        job_id = self.queue.submit("queued", python("pass"))
+        time.sleep(0.2)
+        self.assertEqual(self.queue.get(job_id)["status"], QUEUED)
+
+        restarted = self.restart()
+        self.assertEqual(restarted.wait(job_id, timeout=30)["status"], SUCCEEDED)
+
+
+if __name__ == "__main__":
+    unittest.main()
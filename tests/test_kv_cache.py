@@ -0,0 +1,56 @@
+import unittest
+import sys
+import os
+import torch
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.kv_cache import PrefixCacheStore, cache_length, cache_nbytes
+
+
+def fake_cache(length, layers=2):
+    return tuple(
+        (torch.zeros(1, 2, length, 4), torch.zeros(1, 2, length, 4))
+        for _ in range(layers)
+    )
+
+
+class TestPrefixCacheStore(unittest.TestCase):
+    def test_reuses_common_prefix(self):
+        store = PrefixCacheStore()
+        store.store("s", [1, 2, 3, 4, 5], fake_cache(4))
+
+        past, length = store.checkout("s", [1, 2, 3, 9, 9])
+        self.assertEqual(length, 3)
+        self.assertEqual(cache_length(past), 3)
+        self.assertEqual(len(store), 0)
+
+    def test_diverged_history_is_dropped(self):
+        store = PrefixCacheStore()
+        store.store("s", [1, 2, 3], fake_cache(2))
+
+        past, length = store.checkout("s", [7, 2, 3])
+        self.assertIsNone(past)
+        self.assertEqual(length, 0)
+
+    def test_leaves_one_token_to_prefill(self):
+        store = PrefixCacheStore()
+        store.store("s", [1, 2, 3, 4], fake_cache(3))
+
+        _, length = store.checkout("s", [1, 2])
+        self.assertEqual(length, 1)
+
+    def test_lru_eviction_by_memory(self):
+        size = cache_nbytes(fake_cache(4))
+        store = PrefixCacheStore(max_bytes=2 * size)
+        for session in ["a", "b", "c"]:
+            store.store(session, [1, 2, 3, 4, 5], fake_cache(4))
+
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.nbytes, 2 * size)
+        self.assertIsNone(store.checkout("a", [1, 2, 3])[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
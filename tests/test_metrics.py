@@ -0,0 +1,89 @@
+import unittest
+import sys
+import os
+import json
+import socket
+import tempfile
+import time
+import urllib.request
+from types import SimpleNamespace
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.metrics import Metrics, MetricsCallback, serve_prometheus
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "ppo.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_step_record_written_as_jsonl(self):
+        metrics = Metrics("test", path=self.path, log_every=0)
+        with metrics.timer("generation"):
+            time.sleep(0.01)
+        with metrics.timer("generation"):
+            pass
+        metrics.add("tokens", 3)
+        metrics.add("tokens", 4)
+        metrics.log(0, reward_mean=1.5)
+        metrics.log(1)
+        metrics.close()
+
+        with open(self.path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 2)
+        self.assertGreaterEqual(records[0]["generation_s"], 0.01)
+        self.assertEqual(records[0]["tokens"], 7)
+        self.assertEqual(records[0]["reward_mean"], 1.5)
+        self.assertIn("peak_rss_mb", records[0])
+        self.assertNotIn("tokens", records[1])
+
+    def test_callback_logs_tokens_per_second(self):
+        metrics = Metrics("dpo", path=self.path, log_every=0)
+        callback = MetricsCallback(metrics)
+        args = SimpleNamespace(
+            per_device_train_batch_size=2, gradient_accumulation_steps=2, world_size=1
+        )
+        state = SimpleNamespace(global_step=0, num_input_tokens_seen=0)
+
+        callback.on_step_begin(args, state, None)
+        state.num_input_tokens_seen += 400
+        state.global_step = 1
+        callback.on_step_end(args, state, None)
+        callback.on_step_begin(args, state, None)
+        state.global_step = 2
+        callback.on_step_end(args, state, None)
+        metrics.close()
+
+        with open(self.path) as f:
+            first, second = [json.loads(line) for line in f]
+        self.assertAlmostEqual(
+            first["tokens_per_s"] / first["samples_per_s"], 400 / 4, places=5
+        )
+        # Trainers that do not count tokens log no tokens/s
+        self.assertNotIn("tokens_per_s", second)
+        self.assertIn("dataloader_wait_s", second)
+
+    def test_prometheus_endpoint_exports_latest_values(self):
+        with socket.socket() as s:
+            s.bind(("", 0))
+            port = s.getsockname()[1]
+        server = serve_prometheus(port)
+        port = server.server_address[1]
+
+        metrics = Metrics("prom", path=self.path, log_every=0)
+        metrics.log(3, step_s=0.25)
+        metrics.close()
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as resp:
+            body = resp.read().decode()
+        self.assertIn("rlhf_prom_step_s 0.25", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+import unittest
+import sys
+import os
+import glob
+import json
+import signal
+import subprocess
+import tempfile
+import time
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+# Add project root and the benchmarks directory to path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+
+from src.ppo_distributed import (
+    _free_port,
+    broadcast_weights,
+    chunk_sizes,
+    is_state_step,
+    is_sync_step,
+    pack_experience,
+    unpack_experience,
+)
+from common import tiny_model, tiny_reward_model, tiny_tokenizer
+from safetensors.torch import load_file
+
+TRAIN = """
+import os
+import sys
+sys.path.insert(0, {root!r})
+from src.config import config
+config.model_name = os.path.abspath("policy")
+config.ppo_steps = 6
+config.batch_size = 2
+config.ppo_num_workers = 1
+config.checkpoint_every = 1
+config.num_threads = 1
+from src.trainer_ppo import train_ppo
+train_ppo()
+"""
+
+
+def _broadcast(rank, port, results):
+    dist.init_process_group(
+        "gloo", init_method=f"tcp://127.0.0.1:{port}", rank=rank, world_size=2
+    )
+    try:
+        torch.manual_seed(rank)
+        model = torch.nn.Sequential(torch.nn.Linear(4, 4), torch.nn.Linear(4, 1))
+        # Frozen weights are not broadcast and stay rank-specific
+        model[1].weight.requires_grad_(False)
+        broadcast_weights(model)
+        # Plain lists: shared tensors would not outlive this process
+        results.put((rank, [p.tolist() for p in model.parameters()]))
+    finally:
+        dist.destroy_process_group()
+
+
+def make_run_dir(directory):
+    """Tiny offline policy, reward model and preferences in ``directory``."""
+    tokenizer = tiny_tokenizer()
+    for name, model in [
+        ("policy", tiny_model(tokenizer, n_layer=1, n_embd=32, n_head=2)),
+        ("output/reward_model", tiny_reward_model(tokenizer, n_layers=1, dim=32)),
+    ]:
+        model.save_pretrained(os.path.join(directory, name))
+        tokenizer.save_pretrained(os.path.join(directory, name))
+    os.makedirs(os.path.join(directory, "data"))
+    with open(os.path.join(directory, "data", "preferences.jsonl"), "w") as f:
+        for i in range(8):
+            record = {"prompt": f"Prompt {i}", "chosen": "a", "rejected": "b"}
+            f.write(json.dumps(record) + "\n")
+
+
+def train(directory, interrupt_after=None):
+    """Run distributed PPO in ``directory``, SIGTERMed like a cancelled job."""
+    proc = subprocess.Popen(
+        [sys.executable, "-c", TRAIN.format(root=ROOT)],
+        cwd=directory,
+        env={**os.environ, "HF_HUB_OFFLINE": "1", "TRANSFORMERS_OFFLINE": "1"},
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        start_new_session=True,
+    )
+    if interrupt_after is not None:
+        checkpoint = os.path.join(
+            directory, "output", "checkpoints", "ppo", f"checkpoint-{interrupt_after}"
+        )
+        while not os.path.exists(checkpoint) and proc.poll() is None:
+            time.sleep(0.01)
+        os.killpg(proc.pid, signal.SIGTERM)
+    output = proc.communicate(timeout=600)[0]
+    if proc.returncode != 0:
+        raise AssertionError(output)
+    return output
+
+
+def final_weights(directory):
+    (path,) = glob.glob(os.path.join(directory, "output", "ppo_model", "*.safetensors"))
+    return load_file(path)
+
+
+class TestDistributedPPO(unittest.TestCase):
+    def test_chunk_sizes(self):
+        self.assertEqual(chunk_sizes(8, 2), [4, 4])
+        self.assertEqual(chunk_sizes(5, 3), [2, 2, 1])
+        with self.assertRaises(ValueError):
+            chunk_sizes(2, 3)
+
+    def test_sync_schedule(self):
+        synced = [u for u in range(6) if is_sync_step(u, 2, 6)]
+        # No broadcast after the final update
+        self.assertEqual(synced, [1, 3])
+        # Worker state goes with every update the learner may checkpoint after
+        states = [u for u in range(6) if is_state_step(u, 2, 6, 5)]
+        self.assertEqual(states, [1, 3, 4])
+
+    def test_experience_round_trip(self):
+        queries = [torch.tensor([1, 2, 3]), torch.tensor([4])]
+        responses = [torch.tensor([5, 6]), torch.tensor([7, 8, 9])]
+        rewards = [torch.tensor(0.5), torch.tensor(-1.0)]
+        packed = pack_experience(queries, responses, rewards, rollout_s=1.0)
+        self.assertEqual(packed["stats"], {"rollout_s": 1.0})
+
+        q, r, s = unpack_experience(packed)
+        for expected, actual in zip(queries + responses + rewards, q + r + s):
+            self.assertTrue(torch.equal(expected, actual))
+
+    def test_broadcast_weights(self):
+        ctx = mp.get_context("spawn")
+        results = ctx.SimpleQueue()
+        mp.spawn(_broadcast, args=(_free_port(), results), nprocs=2, join=True)
+        params = dict(results.get() for _ in range(2))
+
+        for i, (learner, worker) in enumerate(zip(params[0], params[1])):
+            if i == 2:  # The frozen weight
+                self.assertNotEqual(learner, worker)
+            else:
+                self.assertEqual(learner, worker)
+
+
+class TestDistributedResume(unittest.TestCase):
+    def test_interrupted_run_resumes_exactly(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            interrupted = os.path.join(tmp, "interrupted")
+            reference = os.path.join(tmp, "reference")
+            make_run_dir(interrupted)
+            make_run_dir(reference)
+
+            output = train(interrupted, interrupt_after=1)
+            self.assertIn("PPO Training interrupted", output)
+            self.assertNotIn("PPO Training finished", output)
+            output = train(interrupted)
+            self.assertIn("Resuming PPO from", output)
+            self.assertIn("PPO Training finished", output)
+
+            # Weights, optimizer and every worker's sampler continue as if
+            # the run had never stopped
+            train(reference)
+            expected = final_weights(reference)
+            for name, tensor in final_weights(interrupted).items():
+                self.assertTrue(torch.equal(tensor, expected[name]), name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+from threading import Thread
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.preference_store import PreferenceStore, iter_preferences
+
+
+def record(i):
+    return {"prompt": f"p{i}", "chosen": f"c{i}", "rejected": f"r{i}"}
+
+
+class TestPreferenceStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "preferences.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_and_read(self):
+        store = PreferenceStore(self.path, fsync_every=2, compact_every=0)
+        for i in range(3):
+            store.append(record(i))
+        store.close()
+
+        self.assertEqual(
+            list(iter_preferences(self.path)), [record(i) for i in range(3)]
+        )
+
+    def test_truncated_line_is_skipped(self):
+        with open(self.path, "w") as f:
+            f.write(json.dumps(record(0)) + "\n")
+            f.write('{"prompt": "p1", "cho')
+
+        self.assertEqual(list(iter_preferences(self.path)), [record(0)])
+
+        store = PreferenceStore(self.path, compact_every=0)
+        store.append(record(2))
+        store.close()
+        self.assertEqual(list(iter_preferences(self.path)), [record(0), record(2)])
+
+    def test_legacy_json_is_migrated(self):
+        legacy = os.path.join(self.tmp.name, "preferences.json")
+        with open(legacy, "w") as f:
+            json.dump([record(0), record(1)], f, indent=2)
+
+        # Readers fall back to the legacy file before migration
+        self.assertEqual(len(list(iter_preferences(self.path))), 2)
+
+        store = PreferenceStore(self.path, compact_every=0)
+        store.append(record(2))
+        store.close()
+
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(
+            list(iter_preferences(self.path)), [record(i) for i in range(3)]
+        )
+
+    def test_compact_keeps_repeated_votes(self):
+        with open(self.path, "w") as f:
+            f.write(json.dumps(record(0)) + "\n\n")
+            f.write('{"prompt": "p1", "cho')
+        store = PreferenceStore(self.path, compact_every=0)
+        store.append(record(0))
+        store.append(record(1))
+        store.compact()
+        store.append(record(2))
+        store.close()
+
+        # The torn and blank lines are gone, the second vote on p0 is not
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [record(0), record(0), record(1), record(2)],
+        )
+
+    def test_compact_repairs_a_torn_last_line_first(self):
+        with open(self.path, "w") as f:
+            f.write(json.dumps(record(0)) + "\n")
+            f.write('{"prompt": "p1", "cho')
+        store = PreferenceStore(self.path, compact_every=0)
+
+        # The size compaction copies up to already includes the repair
+        last_bytes = []
+        getsize = os.path.getsize
+
+        def getsize_after_repair(path):
+            with open(path, "rb") as f:
+                last_bytes.append(f.read()[-1:])
+            return getsize(path)
+
+        with mock.patch("os.path.getsize", side_effect=getsize_after_repair):
+            store.compact()
+        self.assertEqual(last_bytes, [b"\n"])
+        with open(self.path) as f:
+            self.assertEqual(f.read(), json.dumps(record(0)) + "\n")
+
+        store.append(record(2))
+        store.close()
+        self.assertEqual(list(iter_preferences(self.path)), [record(0), record(2)])
+
+    def test_background_compaction_keeps_concurrent_appends(self):
+        store = PreferenceStore(self.path, compact_every=5)
+        threads = [
+            Thread(
+                target=lambda offset=offset: [
+                    store.append(record(offset + i)) for i in range(50)
+                ]
+            )
+            for offset in (0, 1000)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        store.close()
+
+        saved = [r["prompt"] for r in iter_preferences(self.path)]
+        self.assertEqual(len(saved), 100)
+        self.assertEqual(
+            sorted(saved),
+            sorted(record(o + i)["prompt"] for o in (0, 1000) for i in range(50)),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import sys
+import os
+import time
+from threading import Thread
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.prefetch import AnnotationPrefetcher
+
+
+def fake_generate(prompts, on_text=None):
+    return [(p + " A", p + " B") for p in prompts]
+
+
+class TestAnnotationPrefetcher(unittest.TestCase):
+    def test_items_in_order(self):
+        prompts = ["one", "two", "three"]
+        prefetcher = AnnotationPrefetcher(prompts, fake_generate, depth=2)
+
+        items = []
+        while True:
+            item = prefetcher.get(timeout=5)
+            if item is None:
+                break
+            items.append(item)
+
+        self.assertEqual([p for p, _, _ in items], prompts)
+        self.assertEqual(items[0], ("one", "one A", "one B"))
+        self.assertIsNone(prefetcher.get())
+
+    def test_hits_after_warmup(self):
+        prefetcher = AnnotationPrefetcher(["a", "b"], fake_generate, depth=2)
+        prefetcher.start()
+        time.sleep(0.2)
+
+        prefetcher.get(timeout=5)
+        prefetcher.get(timeout=5)
+        self.assertEqual(prefetcher.stats()["hits"], 2)
+        self.assertEqual(prefetcher.stats()["misses"], 0)
+
+    def test_worker_error_is_raised(self):
+        def failing(prompts, on_text=None):
+            raise RuntimeError("boom")
+
+        prefetcher = AnnotationPrefetcher(["a"], failing)
+        with self.assertRaises(RuntimeError):
+            prefetcher.get(timeout=5)
+
+    def test_stream_yields_partial_text(self):
+        def slow_generate(prompts, on_text=None):
+            for i in range(1, 4):
+                on_text([p + "a" * i for p in prompts for _ in range(2)])
+                time.sleep(0.1)
+            return fake_generate(prompts)
+
+        prefetcher = AnnotationPrefetcher(["x"], slow_generate, depth=1)
+        items = list(prefetcher.stream(interval=0.01))
+
+        self.assertEqual(items[-1], ("x", "x A", "x B"))
+        self.assertIn(("x", "xaa", "xaa"), items[:-1])
+        self.assertEqual(prefetcher.stats()["misses"], 1)
+
+    def test_streams_show_only_their_own_prompt(self):
+        def slow_generate(prompts, on_text=None):
+            for i in range(1, 20):
+                on_text([p + "a" * i for p in prompts for _ in range(2)])
+                time.sleep(0.02)
+            return fake_generate(prompts)
+
+        prefetcher = AnnotationPrefetcher(
+            ["x", "y"], slow_generate, depth=2, batch_size=2
+        )
+        streams = [[], []]
+        threads = [
+            Thread(target=lambda s=s: s.extend(prefetcher.stream(interval=0.01)))
+            for s in streams
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=10)
+
+        self.assertEqual(sorted(s[-1][0] for s in streams), ["x", "y"])
+        for items in streams:
+            self.assertGreater(len(items), 1)
+            prompt = items[-1][0]
+            for partial in items[:-1]:
+                self.assertEqual(partial[0], prompt)
+                self.assertTrue(partial[1].startswith(prompt + "a"))
+        self.assertEqual(prefetcher.stats()["misses"], 2)
+
+    def test_abandoned_stream_passes_its_item_on(self):
+        def slow_generate(prompts, on_text=None):
+            for i in range(1, 10):
+                on_text([p + "a" * i for p in prompts for _ in range(2)])
+                time.sleep(0.02)
+            return fake_generate(prompts)
+
+        prefetcher = AnnotationPrefetcher(["x"], slow_generate, depth=1)
+        stream = prefetcher.stream(interval=0.01)
+        self.assertEqual(next(stream)[0], "x")
+        # E.g. the browser tab was closed
+        stream.close()
+        self.assertEqual(prefetcher.get(timeout=5), ("x", "x A", "x B"))
+        self.assertIsNone(prefetcher.get(timeout=5))
+
+
+if __name__ == "__main__":
+    unittest.main()
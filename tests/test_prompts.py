@@ -0,0 +1,111 @@
+import unittest
+import sys
+import os
+import tempfile
+import numpy as np
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import trainer_ppo
+from src.prompts import PromptPool, shard_prompts
+from src.config import config
+from src.trainer_ppo import load_prompt_pool, make_ppo_config, prompt_files
+
+
+class WordTokenizer:
+    """Stand-in tokenizer: one token per word (its length)."""
+
+    def __call__(self, texts):
+        return {"input_ids": [[len(w) for w in t.split()] for t in texts]}
+
+
+PROMPTS = ["a bb", "ccc", "a bb", "dddd ee f", "g", "ccc"]
+
+
+class TestPromptPool(unittest.TestCase):
+    def test_deduplicates_and_encodes(self):
+        pool = PromptPool(PROMPTS, WordTokenizer())
+        self.assertEqual(pool.prompts, ["a bb", "ccc", "dddd ee f", "g"])
+        self.assertEqual(
+            [ids.tolist() for ids in pool.token_ids_of([0, 2])], [[1, 2], [4, 2, 1]]
+        )
+
+        input_ids, attention_mask = pool.padded([1, 2], pad_token_id=9)
+        self.assertEqual(input_ids.tolist(), [[9, 9, 3], [4, 2, 1]])
+        self.assertEqual(attention_mask.tolist(), [[0, 0, 1], [1, 1, 1]])
+
+    def test_shards_split_unique_prompts(self):
+        shards = [shard_prompts(PROMPTS, i, 2) for i in range(2)]
+        self.assertEqual(shards, [["a bb", "dddd ee f"], ["ccc", "g"]])
+        # Too few prompts to split: every worker samples all of them
+        self.assertEqual(shard_prompts(["x", "x"], 1, 2), ["x"])
+
+    def test_epochs_cover_every_prompt(self):
+        pool = PromptPool(PROMPTS, WordTokenizer(), replacement=False, seed=0)
+        drawn = np.concatenate([pool.sample(3) for _ in range(4)])
+        # 12 draws over 4 prompts: three full epochs
+        self.assertEqual(pool.epoch, 2)
+        for epoch in drawn.reshape(3, 4):
+            self.assertEqual(sorted(epoch), [0, 1, 2, 3])
+
+    def test_reward_variance_weighting(self):
+        pool = PromptPool(PROMPTS, WordTokenizer(), weighting="reward_variance")
+        pool.update([0, 0, 1, 1, 2, 2, 3, 3], [0, 2, 1, 1, 1, 1, 1, 1])
+        weights = pool.weights()
+        self.assertAlmostEqual(weights.sum(), 1.0)
+        self.assertGreater(weights[0], 100 * weights[1])
+
+    def test_resume_continues_sequence(self):
+        pool = PromptPool(PROMPTS, WordTokenizer(), replacement=False, seed=0)
+        pool.sample(3)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "pool.npz")
+            pool.save(path)
+            expected = [pool.sample(3).tolist() for _ in range(3)]
+
+            resumed = PromptPool(PROMPTS, WordTokenizer(), replacement=False, seed=1)
+            resumed.load(path)
+            self.assertEqual([resumed.sample(3).tolist() for _ in range(3)], expected)
+
+            other = PromptPool(["x"], WordTokenizer())
+            with self.assertRaises(ValueError):
+                other.load(path)
+
+    def test_resume_keeps_checkpointed_prompts(self):
+        pool = PromptPool(PROMPTS, WordTokenizer(), replacement=False, seed=0)
+        pool.sample(3)
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, text in prompt_files(pool).items():
+                with open(os.path.join(tmp, name), "w") as f:
+                    f.write(text)
+            state = pool.state_dict()
+            expected = [pool.sample(3).tolist() for _ in range(3)]
+
+            # A preference collected while the run was interrupted
+            with mock.patch.object(
+                trainer_ppo, "load_training_prompts", return_value=PROMPTS + ["new"]
+            ):
+                self.assertEqual(len(load_prompt_pool(WordTokenizer())), 5)
+                resumed = load_prompt_pool(WordTokenizer(), resume_from=tmp)
+            resumed.load_state_dict(state)
+            self.assertEqual([resumed.sample(3).tolist() for _ in range(3)], expected)
+
+
+class TestPPOConfig(unittest.TestCase):
+    def test_mini_batch_default_divides_batch(self):
+        ppo_config = make_ppo_config()
+        self.assertEqual(ppo_config.batch_size, config.batch_size)
+        self.assertEqual(ppo_config.mini_batch_size, config.ppo_mini_batch_size)
+        self.assertEqual(config.batch_size % ppo_config.backward_batch_size, 0)
+
+    def test_mini_batch_must_divide_batch(self):
+        # TRL's own default of 128 would reject every full rollout batch
+        with mock.patch.object(config, "ppo_mini_batch_size", config.batch_size + 1):
+            with self.assertRaises(ValueError):
+                make_ppo_config()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import sys
+import os
+import tempfile
+import time
+from threading import Thread
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.registry import ModelRegistry
+
+
+class TestModelRegistry(unittest.TestCase):
+    def test_loads_once_under_concurrency(self):
+        registry = ModelRegistry()
+        calls = []
+
+        def factory():
+            calls.append(1)
+            time.sleep(0.1)
+            return object()
+
+        results = []
+        threads = [
+            Thread(target=lambda: results.append(registry.get("k", factory)))
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual(registry.misses, 1)
+
+    def test_lru_eviction_by_memory(self):
+        registry = ModelRegistry(max_bytes=2 * 400)
+        for key in ["a", "b", "c"]:
+            registry.get(key, lambda: torch.nn.Linear(10, 10, bias=False))
+
+        self.assertEqual(len(registry), 2)
+        self.assertNotIn("a", registry)
+        self.assertEqual(registry.nbytes, 800)
+
+    def test_value_head_shares_causal_lm_weights(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            GPT2LMHeadModel(
+                GPT2Config(
+                    vocab_size=64, n_positions=32, n_layer=1, n_embd=16, n_head=2
+                )
+            ).save_pretrained(tmp)
+
+            registry = ModelRegistry()
+            base = registry.causal_lm(tmp, torch.float32, device_map="cpu")
+            policy = registry.value_head(tmp, torch.float32, device_map="cpu")
+
+            self.assertIs(policy.pretrained_model, base)
+            self.assertIs(registry.causal_lm(tmp, torch.float32, "cpu"), base)
+            self.assertEqual(len(registry), 2)
+
+    def test_adapter_model_trains_lora_only(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            GPT2LMHeadModel(
+                GPT2Config(
+                    vocab_size=64, n_positions=32, n_layer=1, n_embd=16, n_head=2
+                )
+            ).save_pretrained(tmp)
+
+            registry = ModelRegistry()
+            lora = (4, 8, 0.0)
+            model = registry.adapter_model(tmp, torch.float32, None, lora=lora)
+            policy = registry.value_head(tmp, torch.float32, None, lora=lora)
+
+            trainable = [n for n, p in model.named_parameters() if p.requires_grad]
+            self.assertTrue(trainable)
+            self.assertTrue(all("lora_" in n for n in trainable))
+            self.assertIs(policy.pretrained_model, model)
+
+    def test_adapter_model_leaves_cached_base_untouched(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            GPT2LMHeadModel(
+                GPT2Config(
+                    vocab_size=64, n_positions=32, n_layer=1, n_embd=16, n_head=2
+                )
+            ).save_pretrained(tmp)
+
+            registry = ModelRegistry()
+            base = registry.causal_lm(tmp, torch.float32, None)
+            model = registry.adapter_model(tmp, torch.float32, None, lora=(4, 8, 0.0))
+
+            self.assertFalse(any("lora_" in n for n, _ in base.named_parameters()))
+            self.assertTrue(all(p.requires_grad for p in base.parameters()))
+            # The frozen base weights are shared, not duplicated
+            weight = base.transformer.h[0].attn.c_attn.weight
+            adapted = model.base_model.model.transformer.h[0].attn.c_attn
+            self.assertEqual(weight.data_ptr(), adapted.base_layer.weight.data_ptr())
+            self.assertIs(base.lm_head.weight, base.transformer.wte.weight)
+
+
+if __name__ == "__main__":
+    unittest.main()
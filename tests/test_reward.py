@@ -0,0 +1,112 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import torch
+from transformers import (
+    BatchEncoding,
+    DistilBertConfig,
+    DistilBertForSequenceClassification,
+)
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.reward import RewardScorer
+
+
+class CharTokenizer:
+    """Minimal stand-in tokenizer: one token per character, right padding."""
+
+    def __call__(self, texts, truncation=True, max_length=None):
+        ids = [[1 + ord(c) % 60 for c in t][:max_length] for t in texts]
+        return {"input_ids": ids, "attention_mask": [[1] * len(i) for i in ids]}
+
+    def pad(self, encoded, return_tensors="pt"):
+        width = max(len(ids) for ids in encoded["input_ids"])
+        return BatchEncoding(
+            {
+                key: torch.tensor([row + [0] * (width - len(row)) for row in rows])
+                for key, rows in encoded.items()
+            }
+        )
+
+
+def tiny_reward_model():
+    torch.manual_seed(0)
+    return DistilBertForSequenceClassification(
+        DistilBertConfig(
+            vocab_size=64, dim=16, n_layers=1, n_heads=2, hidden_dim=32, num_labels=1
+        )
+    )
+
+
+class TestRewardScorer(unittest.TestCase):
+    def setUp(self):
+        self.model = tiny_reward_model()
+
+    def scorer(self, **kwargs):
+        return RewardScorer(self.model, CharTokenizer(), max_length=64, **kwargs)
+
+    def test_batched_matches_unbatched(self):
+        prompts = ["hi", "a longer prompt", "q", "hi"]
+        responses = ["there", "x", "a much longer response here", "you"]
+
+        batched = self.scorer(batch_size=4, cache_size=0).score(prompts, responses)
+        single = self.scorer(batch_size=1, cache_size=0).score(prompts, responses)
+        with torch.no_grad():
+            expected = [
+                self.model(
+                    **CharTokenizer().pad(CharTokenizer()([p + " " + r]))
+                ).logits.item()
+                for p, r in zip(prompts, responses)
+            ]
+
+        torch.testing.assert_close(batched, single, atol=1e-5, rtol=0)
+        torch.testing.assert_close(batched, torch.tensor(expected), atol=1e-5, rtol=0)
+
+    def test_hits_and_misses_count_items(self):
+        scorer = self.scorer()
+        scorer.score(["p", "p", "q"], ["a", "a", "b"])
+        self.assertEqual((scorer.hits, scorer.misses), (0, 3))
+        scorer.score(["p", "p"], ["a", "a"])
+        self.assertEqual((scorer.hits, scorer.misses), (2, 3))
+
+    def test_dropout_samples_vary(self):
+        prompts, responses = ["p", "q"], ["a response", "another one"]
+        deterministic = self.scorer()
+        first = deterministic.score(prompts, responses)
+        torch.testing.assert_close(
+            self.scorer(cache_size=0).score(prompts, responses), first
+        )
+
+        sampler = self.scorer(dropout=True)
+        samples = torch.stack([sampler.score(prompts, responses) for _ in range(5)])
+        self.assertGreater(samples.std(0).min().item(), 0)
+        # Dropout is only active while sampling
+        self.assertFalse(any(m.training for m in self.model.modules()))
+        self.assertEqual(len(sampler.cache), 0)
+
+    def test_score_file_with_mixed_records(self):
+        records = [
+            {"prompt": "p", "response": "r"},
+            {"prompt": "p", "chosen": "c", "rejected": "r"},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "in.jsonl")
+            target = os.path.join(tmp, "out.jsonl")
+            with open(source, "w") as f:
+                f.writelines(json.dumps(r) + "\n" for r in records)
+
+            self.assertEqual(self.scorer().score_file(source, target), 2)
+            with open(target) as f:
+                scored = [json.loads(line) for line in f]
+
+        self.assertIn("reward", scored[0])
+        self.assertEqual(scored[0]["reward"], scored[1]["rejected_reward"])
+        self.assertIn("chosen_reward", scored[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import sys
+import os
+import torch
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.runtime import quantize_dynamic, resolve_profile
+
+
+class TestExecutionProfile(unittest.TestCase):
+    def test_cpu_profile_avoids_fp16(self):
+        profile = resolve_profile(device="cpu", precision="auto")
+        self.assertIn(profile.precision, ("bf16", "fp32"))
+        self.assertEqual(profile.train_dtype, torch.float32)
+        self.assertIsNone(profile.device_map)
+        self.assertTrue(profile.training_precision_args()["use_cpu"])
+
+    def test_quantization_only_on_cpu(self):
+        self.assertTrue(resolve_profile("cpu", "fp32", True).quantize_inference)
+        self.assertFalse(resolve_profile("cuda", "fp16", True).quantize_inference)
+
+    def test_unknown_precision_raises(self):
+        with self.assertRaises(ValueError):
+            resolve_profile("cpu", "fp8")
+
+    def test_dynamic_quantization_is_close(self):
+        torch.manual_seed(0)
+        model = torch.nn.Sequential(torch.nn.Linear(16, 16), torch.nn.ReLU())
+        x = torch.randn(4, 16)
+        expected = model(x)
+
+        quantized = quantize_dynamic(model)
+        self.assertTrue(torch.allclose(quantized(x), expected, atol=0.05))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import sys
+import os
+import torch
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.selection import PairSelector, jaccard, ngrams
+
+
+class TableScorer:
+    """Stand-in reward scorer reading rewards from a dict."""
+
+    def __init__(self, rewards):
+        self.rewards = rewards
+        self.calls = 0
+
+    def score(self, prompts, responses):
+        self.calls += 1
+        return torch.tensor([self.rewards[r] for r in responses])
+
+
+def unordered(pairs):
+    return [None if pair is None else set(pair) for pair in pairs]
+
+
+class TestPairSelector(unittest.TestCase):
+    def test_near_duplicates_are_dropped(self):
+        selector = PairSelector(similarity=0.5)
+        kept = selector.deduplicate(
+            [
+                "the cat sat on the mat",
+                "the cat sat on the mat!",
+                "The cat sat on the mat",
+                "dogs chase cars",
+            ]
+        )
+        self.assertEqual(kept, ["the cat sat on the mat", "dogs chase cars"])
+        self.assertEqual(jaccard(ngrams("a b c d"), ngrams("a b c d")), 1.0)
+
+    def test_picks_smallest_margin(self):
+        scorer = TableScorer({"w x y": 0.0, "p q r": 2.0, "k l m": 2.1})
+        selector = PairSelector([scorer])
+        pairs = selector.select(["p1", "p2"], [["w x y", "p q r", "k l m"], ["w x y"]])
+        self.assertEqual(unordered(pairs), [{"p q r", "k l m"}, None])
+        # One batched call for all prompts
+        self.assertEqual(scorer.calls, 1)
+
+    def test_disagreement_between_scorers(self):
+        texts = ["w x y", "p q r", "k l m"]
+        first = TableScorer({"w x y": 0.0, "p q r": 0.2, "k l m": 3.2})
+        second = TableScorer({"w x y": 0.0, "p q r": 0.2, "k l m": -0.8})
+        selector = PairSelector([first, second])
+        # A disputed pair beats one both scorers find close
+        self.assertEqual(
+            unordered(selector.select(["p"], [texts])), [{"p q r", "k l m"}]
+        )
+
+    def test_confident_pairs_are_skipped(self):
+        scorer = TableScorer({"w x y": 0.0, "p q r": 5.0})
+        selector = PairSelector([scorer], max_margin=1.0)
+        self.assertEqual(selector.select(["p"], [["w x y", "p q r"]]), [None])
+
+    def test_without_scorers(self):
+        selector = PairSelector()
+        pairs = selector.select(["p"], [["a b c", "a b c", "d e f", "g h i"]])
+        self.assertEqual(unordered(pairs), [{"a b c", "d e f"}])
+
+    def test_sides_are_randomized(self):
+        selector = PairSelector(seed=0)
+        pairs = selector.select(["p"] * 50, [["a b c", "d e f"]] * 50)
+        firsts = [pair[0] for pair in pairs]
+        self.assertEqual(set(firsts), {"a b c", "d e f"})
+        self.assertEqual(
+            unordered(PairSelector(seed=0).select(["p"], [["a b c", "d e f"]])),
+            [{"a b c", "d e f"}],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
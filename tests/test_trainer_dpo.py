@@ -0,0 +1,66 @@
+import unittest
+import sys
+import os
+import tempfile
+from types import SimpleNamespace
+from datasets import Dataset
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.trainer_dpo import precompute_reference_logps
+
+
+class StubTrainer:
+    """Records how often the reference log-probs are computed."""
+
+    def __init__(self, max_length=64):
+        self.model = SimpleNamespace(config=SimpleNamespace(_name_or_path="tiny"))
+        self.max_length = max_length
+        self.max_prompt_length = max_length // 2
+        self.loss_type = "sigmoid"
+        self.train_dataset = Dataset.from_dict({"prompt": ["a", "b", "c"]})
+        self.eval_dataset = Dataset.from_dict({"prompt": ["d"]})
+        self.computed = 0
+
+    def _add_reference(self, dataset):
+        self.computed += 1
+        return dataset.add_column("reference_chosen_logps", [-1.0] * len(dataset))
+
+    def get_train_dataloader(self):
+        self.train_dataset = self._add_reference(self.train_dataset)
+
+    def get_eval_dataloader(self):
+        self.eval_dataset = self._add_reference(self.eval_dataset)
+
+
+class TestReferenceLogps(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def precompute(self, trainer, dataset_key="data"):
+        precompute_reference_logps(trainer, dataset_key, cache_dir=self.tmp.name)
+        return trainer
+
+    def test_later_runs_load_the_cache(self):
+        first = self.precompute(StubTrainer())
+        self.assertEqual(first.computed, 2)
+        self.assertTrue(first._precomputed_train_ref_log_probs)
+
+        second = self.precompute(StubTrainer())
+        self.assertEqual(second.computed, 0)
+        self.assertEqual(len(second.train_dataset), 3)
+        self.assertEqual(second.eval_dataset["reference_chosen_logps"], [-1.0])
+        self.assertTrue(second._precomputed_eval_ref_log_probs)
+
+    def test_cache_is_keyed_by_data_and_lengths(self):
+        self.precompute(StubTrainer())
+        self.assertEqual(self.precompute(StubTrainer(), "other").computed, 2)
+        self.assertEqual(self.precompute(StubTrainer(max_length=32)).computed, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
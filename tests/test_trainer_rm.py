@@ -0,0 +1,109 @@
+import unittest
+import sys
+import os
+import torch
+from unittest import mock
+from datasets import Dataset
+from transformers import DistilBertConfig, DistilBertForSequenceClassification
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.config import config
+from src.data import PairwiseCollator
+from src.trainer_rm import (
+    bradley_terry_loss,
+    pairwise_rewards,
+    prepare_pairs,
+    train_rm,
+    trim_shared_prefix,
+)
+
+
+class StubTokenizer:
+    cls_token_id = 1
+    pad_token_id = 0
+
+
+class TestTrimSharedPrefix(unittest.TestCase):
+    def test_short_pairs_are_unchanged(self):
+        self.assertEqual(
+            trim_shared_prefix([1, 5, 6, 7], [1, 5, 8], 8, keep=1),
+            ([1, 5, 6, 7], [1, 5, 8]),
+        )
+
+    def test_prompt_is_cut_before_responses(self):
+        chosen = [1, 10, 11, 12, 13, 20, 21]
+        rejected = [1, 10, 11, 12, 13, 30]
+        # Right truncation would leave [1, 10, 11, 12] on both sides
+        self.assertEqual(
+            trim_shared_prefix(chosen, rejected, 4, keep=1),
+            ([1, 13, 20, 21], [1, 13, 30]),
+        )
+
+    def test_long_responses_are_truncated(self):
+        self.assertEqual(
+            trim_shared_prefix([5, 6, 7, 8], [5, 9, 9, 9], 2),
+            ([6, 7], [9, 9]),
+        )
+
+
+class TestPairwiseBatching(unittest.TestCase):
+    def test_identical_pairs_are_dropped(self):
+        dataset = Dataset.from_dict(
+            {
+                "chosen_input_ids": [[1, 4, 4, 4, 5], [1, 4, 6]],
+                "chosen_attention_mask": [[1] * 5, [1] * 3],
+                "rejected_input_ids": [[1, 4, 4, 4, 7], [1, 4, 6]],
+                "rejected_attention_mask": [[1] * 5, [1] * 3],
+            }
+        )
+        pairs = prepare_pairs(dataset, StubTokenizer(), max_length=3)
+        self.assertEqual(pairs["chosen_input_ids"], [[1, 4, 5]])
+        self.assertEqual(pairs["rejected_input_ids"], [[1, 4, 7]])
+        self.assertEqual(pairs["length"], [3])
+
+    def test_single_forward_matches_separate_passes(self):
+        torch.manual_seed(0)
+        model = DistilBertForSequenceClassification(
+            DistilBertConfig(
+                vocab_size=32,
+                dim=16,
+                n_layers=1,
+                n_heads=2,
+                hidden_dim=32,
+                num_labels=1,
+            )
+        ).eval()
+        features = [
+            {"chosen_input_ids": [1, 5, 6], "rejected_input_ids": [1, 5, 7, 8, 9]},
+            {"chosen_input_ids": [1, 2], "rejected_input_ids": [1, 3]},
+        ]
+        batch = PairwiseCollator(StubTokenizer())(features)
+        with torch.no_grad():
+            chosen, rejected = pairwise_rewards(model, batch)
+            expected = [
+                model(input_ids=torch.tensor([f[f"{side}_input_ids"]])).logits.item()
+                for side in ("chosen", "rejected")
+                for f in features
+            ]
+        torch.testing.assert_close(
+            torch.cat([chosen, rejected]), torch.tensor(expected), atol=1e-5, rtol=0
+        )
+        loss = bradley_terry_loss(torch.tensor([2.0, 0.0]), torch.tensor([0.0, 0.0]))
+        # Mean of -log(sigmoid(2)) and -log(sigmoid(0))
+        self.assertAlmostEqual(loss.item(), (0.126928 + 0.693147) / 2, places=5)
+
+
+class TestTrainRM(unittest.TestCase):
+    def test_zero_epochs_is_rejected_before_loading(self):
+        with mock.patch.object(config, "rm_epochs", 0), mock.patch(
+            "src.trainer_rm.load_rm_model"
+        ) as load:
+            with self.assertRaises(ValueError):
+                train_rm()
+        load.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+import sys
+import os
+import tempfile
+from threading import Barrier, Thread
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.preference_store import PreferenceStore, iter_preferences
+from src.prefetch import AnnotationPrefetcher
+from src.work_queue import AnnotationWorkQueue
+
+
+def fake_generate(prompts, on_text=None):
+    return [(p + " A", p + " B") for p in prompts]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAnnotationWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = PreferenceStore(os.path.join(self.tmp.name, "prefs.jsonl"))
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def make_queue(self, prompts, **kwargs):
+        prefetcher = AnnotationPrefetcher(prompts, fake_generate, depth=2)
+        return AnnotationWorkQueue(prefetcher, self.store, clock=self.clock, **kwargs)
+
+    def saved(self):
+        return list(iter_preferences(self.store.path))
+
+    def test_sessions_get_distinct_items(self):
+        work_queue = self.make_queue(["one", "two", "three"])
+        first = work_queue.lease("alice", timeout=5)
+        second = work_queue.lease("bob", timeout=5)
+        self.assertNotEqual(first.prompt, second.prompt)
+        # Asking again (e.g. after a reload) returns the same item
+        self.assertEqual(work_queue.lease("alice", timeout=5), first)
+
+    def test_votes_are_saved_per_session(self):
+        work_queue = self.make_queue(["one", "two"])
+        alice = work_queue.lease("alice", timeout=5)
+        bob = work_queue.lease("bob", timeout=5)
+
+        self.assertTrue(work_queue.complete("bob", "B is Better"))
+        self.assertTrue(work_queue.complete("alice", "Tie"))
+        self.assertFalse(work_queue.complete("alice", "A is Better"))
+        work_queue.flush()
+
+        self.assertEqual(
+            self.saved(),
+            [
+                {
+                    "prompt": bob.prompt,
+                    "chosen": bob.response_b,
+                    "rejected": bob.response_a,
+                }
+            ],
+        )
+        self.assertNotEqual(alice.prompt, bob.prompt)
+        self.assertIsNone(work_queue.lease("alice", timeout=5))
+
+    def test_expired_lease_is_reassigned(self):
+        work_queue = self.make_queue(["one", "two"], lease_timeout=10)
+        abandoned = work_queue.lease("alice", timeout=5)
+
+        self.clock.now = 11
+        reassigned = work_queue.lease("bob", timeout=5)
+        self.assertEqual(reassigned.prompt, abandoned.prompt)
+        # Alice's late vote no longer counts
+        self.assertFalse(work_queue.complete("alice", "A is Better"))
+        self.assertTrue(work_queue.complete("bob", "A is Better"))
+        work_queue.flush()
+        self.assertEqual(len(self.saved()), 1)
+
+    def test_concurrent_requests_of_one_session(self):
+        work_queue = self.make_queue(["one", "two", "three"])
+        prefetcher = work_queue.prefetcher
+        get, stream = prefetcher.get, prefetcher.stream
+        # Both requests wait for a new item before either is granted
+        both_waiting = Barrier(2, timeout=5)
+
+        def slow_get(*args, **kwargs):
+            both_waiting.wait()
+            return get(*args, **kwargs)
+
+        def slow_stream(*args, **kwargs):
+            both_waiting.wait()
+            yield from stream(*args, **kwargs)
+
+        prefetcher.get, prefetcher.stream = slow_get, slow_stream
+        leased = []
+        double_click = Thread(
+            target=lambda: leased.append(work_queue.lease("alice", timeout=5))
+        )
+        double_click.start()
+        *_, streamed = work_queue.stream("alice")
+        double_click.join(timeout=10)
+        prefetcher.get, prefetcher.stream = get, stream
+
+        self.assertEqual(leased, [streamed])
+        # The other item generated for alice is not lost
+        others = [work_queue.lease(s, timeout=5).prompt for s in ("bob", "carol")]
+        self.assertEqual(sorted(others + [streamed.prompt]), ["one", "three", "two"])
+
+    def test_failed_writes_are_retried(self):
+        work_queue = self.make_queue(["one"], retry_delay=0.01)
+        extend = self.store.extend
+        failures = iter([OSError("disk full"), OSError("disk full")])
+
+        def flaky_extend(records):
+            error = next(failures, None)
+            if error is not None:
+                raise error
+            extend(records)
+
+        self.store.extend = flaky_extend
+        work_queue.lease("alice", timeout=5)
+        work_queue.complete("alice", "A is Better")
+
+        self.assertTrue(work_queue.flush(timeout=5))
+        self.assertEqual([r["prompt"] for r in self.saved()], ["one"])
+
+    def test_flush_times_out(self):
+        work_queue = self.make_queue(["one"], retry_delay=60)
+        self.store.extend = mock.Mock(side_effect=OSError("disk full"))
+        work_queue.lease("alice", timeout=5)
+        work_queue.complete("alice", "A is Better")
+        self.assertFalse(work_queue.flush(timeout=0.1))
+
+    def test_concurrent_sessions(self):
+        prompts = [f"prompt {i}" for i in range(40)]
+        work_queue = self.make_queue(prompts)
+        seen = []
+
+        def annotate(session_id):
+            while True:
+                lease = work_queue.lease(session_id, timeout=5)
+                if lease is None:
+                    return
+                seen.append(lease.prompt)
+                work_queue.complete(session_id, "A is Better")
+
+        threads = [Thread(target=annotate, args=(f"s{i}",)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=10)
+        work_queue.flush()
+
+        self.assertEqual(sorted(seen), sorted(prompts))
+        self.assertEqual(sorted(r["prompt"] for r in self.saved()), sorted(prompts))
+
+
+if __name__ == "__main__":
+    unittest.main()